@@ -0,0 +1,165 @@
+"""
+Pre-aggregated pincode cube shared by the heatmap dashboards.
+
+The dashboards only ever filter on a couple of low-cardinality columns (year,
+patient type), so instead of regrouping the raw rows on every rerun we count
+them once per (pincode × filter dimensions) cell. Pincode attributes
+(location, city, state) are resolved once per pincode. A sidebar change then
+only slices and sums a few thousand cube cells.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Largest (groups × distinct values) table most_frequent counts densely
+DENSE_PAIR_LIMIT = 20_000_000
+
+
+def most_frequent(df, by, column, weights=None):
+    """
+    Most common non-null value of a column per group, without per-group Python calls.
+
+    Equivalent to grouping and calling x.mode()[0] in a lambda: ties go to the
+    smallest value and groups with only null values get NaN.
+
+    Args:
+        df (pd.DataFrame): Input rows
+        by (str): Group key column
+        column (str): Column to take the most common value of
+        weights (str): Optional column of row weights (e.g. cube counts) to sum instead of counting rows
+
+    Returns:
+        pd.Series: Most common value indexed by group key
+    """
+    # Integer-code both columns (code order matches value order; nulls get -1)
+    group_codes, groups = _codes(df[by])
+    value_codes, values = _codes(df[column])
+    valid = (group_codes >= 0) & (value_codes >= 0)
+
+    # Count (or sum weights of) each (group, value) pair through one composite integer key
+    key = group_codes[valid].astype('int64') * len(values) + value_codes[valid]
+    row_weights = None if weights is None else df[weights].to_numpy()[valid]
+    if len(groups) * len(values) <= DENSE_PAIR_LIMIT:
+        # Dense table of every (group, value) pair - a single O(rows) bincount
+        dense = np.bincount(key, weights=row_weights, minlength=len(groups) * len(values))
+        pair_keys = np.flatnonzero(dense)
+        pair_counts = dense[pair_keys]
+    else:
+        counts = pd.Series(key).value_counts(sort=False) if row_weights is None else pd.Series(row_weights).groupby(key).sum()
+        pair_keys = counts.index.to_numpy()
+        pair_counts = counts.to_numpy()
+    pair_groups = pair_keys // len(values)
+    pair_values = pair_keys % len(values)
+
+    # Order by group, then count descending, then value ascending and keep the first pair per group
+    order = np.lexsort((pair_values, -pair_counts, pair_groups))
+    first = order[np.r_[True, pair_groups[order][1:] != pair_groups[order][:-1]]] if len(order) else order
+    top = pd.Series(values.take(pair_values[first]), index=groups.take(pair_groups[first]), name=column)
+
+    # Groups whose values are all null have no counts - keep them, as NaN
+    observed_groups = groups[np.bincount(group_codes[group_codes >= 0], minlength=len(groups)) > 0]
+    return top.reindex(pd.Index(observed_groups, name=by))
+
+
+def _codes(series):
+    """Integer codes and sorted unique values of a column (categoricals reuse their codes)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    return pd.factorize(series, sort=True)
+
+
+def build_pincode_cube(df, dims):
+    """Count rows per pincode and combination of the filter dimensions"""
+    return df.groupby(['CPA_PIN_CODE', *dims], dropna=False, observed=True).size().reset_index(name='count')
+
+
+def build_pincode_locations(df):
+    """Resolve the representative location and most common city/state per pincode"""
+    locations = df.groupby('CPA_PIN_CODE').agg({
+        'Latitude': 'median',  # Median latitude (same for all rows of a pincode after the merge)
+        'Longitude': 'median'  # Median longitude (same for all rows of a pincode after the merge)
+    })
+    locations['CPA_ADDR_CITY'] = most_frequent(df, 'CPA_PIN_CODE', 'CPA_ADDR_CITY')  # Most common city
+    locations['StateName'] = most_frequent(df, 'CPA_PIN_CODE', 'StateName')  # Most common state
+    return locations.reset_index()
+
+
+# Pincode attributes counted per partition by fold_pincode_aggregates
+LOCATION_COLUMNS = ['CPA_PIN_CODE', 'Latitude', 'Longitude', 'CPA_ADDR_CITY', 'StateName']
+
+
+def _fold_counts(total, part, keys):
+    """Add the counts of part to the running totals, per key"""
+    if total is None:
+        return part
+    return pd.concat([total, part]).groupby(keys, dropna=False, observed=True)['count'].sum().reset_index()
+
+
+def fold_pincode_aggregates(frames, dims):
+    """
+    build_pincode_cube and build_pincode_locations over a stream of row frames.
+
+    Each frame (e.g. one dataset partition) is reduced to its cube cells and
+    its (pincode, location, city, state) counts, which are added to running
+    totals, so only one frame of rows is in memory at a time. Counts are
+    additive, so the result matches aggregating all rows at once.
+
+    Returns:
+        tuple: (cube, locations) as returned by the two builders
+    """
+    cube = None
+    attributes = None
+    for df in frames:
+        cube = _fold_counts(cube, build_pincode_cube(df, dims), ['CPA_PIN_CODE', *dims])
+        part = df.groupby(LOCATION_COLUMNS, dropna=False, observed=True).size().reset_index(name='count')
+        attributes = _fold_counts(attributes, part, LOCATION_COLUMNS)
+
+    if cube is None:
+        return (pd.DataFrame(columns=['CPA_PIN_CODE', *dims, 'count']),
+                pd.DataFrame(columns=LOCATION_COLUMNS))
+
+    # Coordinates come from the per-pincode merge, so every row of a pincode has the same ones
+    locations = attributes.groupby('CPA_PIN_CODE').agg({'Latitude': 'median', 'Longitude': 'median'})
+    locations['CPA_ADDR_CITY'] = most_frequent(attributes, 'CPA_PIN_CODE', 'CPA_ADDR_CITY', weights='count')
+    locations['StateName'] = most_frequent(attributes, 'CPA_PIN_CODE', 'StateName', weights='count')
+    return cube.sort_values(['CPA_PIN_CODE', *dims]).reset_index(drop=True), locations.reset_index()
+
+
+def slice_cube(cube, filters):
+    """Keep the cube cells matching every non-None filter value"""
+    mask = pd.Series(True, index=cube.index)
+    for column, value in filters.items():
+        if value is not None:
+            mask &= cube[column] == value
+    return cube[mask]
+
+
+def summarize_cube(cube, locations, count_name, filters, mode_columns=()):
+    """
+    Build the per-pincode summary for one filter selection.
+
+    Args:
+        cube (pd.DataFrame): Output of build_pincode_cube
+        locations (pd.DataFrame): Output of build_pincode_locations
+        count_name (str): Name of the count column in the summary
+        filters (dict): Cube column -> selected value (None means all values)
+        mode_columns (iterable): Cube dimensions to report the most common value of per pincode
+
+    Returns:
+        pd.DataFrame: One row per pincode with counts, percentage and location,
+        sorted by count descending
+    """
+    sliced = slice_cube(cube, filters)
+
+    pincode_counts = sliced.groupby('CPA_PIN_CODE')['count'].sum().reset_index(name=count_name)
+    pincode_summary = pincode_counts.merge(locations, on='CPA_PIN_CODE')
+
+    # Most common value of a dimension within the slice, weighted by the cube counts
+    for column in mode_columns:
+        top_values = most_frequent(sliced, 'CPA_PIN_CODE', column, weights='count')
+        pincode_summary = pincode_summary.merge(top_values.reset_index(), on='CPA_PIN_CODE', how='left')
+
+    # Calculate percentage of the total within the slice
+    total = pincode_summary[count_name].sum()
+    pincode_summary['percentage'] = (pincode_summary[count_name] / total * 100)
+    return pincode_summary.sort_values(count_name, ascending=False)
@@ -1,9 +1,19 @@
+from pathlib import Path
+
 import streamlit as st
-import pandas as pd
 import folium
-from folium.plugins import MarkerCluster, HeatMap
+from folium.plugins import MarkerCluster
 from streamlit_folium import st_folium
 
+from aggregates import build_pincode_cube, build_pincode_locations, fold_pincode_aggregates, summarize_cube
+from boundaries import BOUNDARY_FILE, band_feature_collections, load_simplified_boundaries
+from clustering import build_cluster_index
+from data_loader import ADDRESS_DATASET, dataset_partitions, iter_partitions, load_address_data, memory_report
+from heat_tiles import heat_tile_layer, static_heat_tiles
+from hexbin import HEX_RESOLUTIONS, aggregate_hexes, hex_mapping, hexbin_layer
+from map_layers import (ChoroplethLayer, ClusterIndexLayer, HeatDataLayer, PincodeMarkerLayer, cluster_icon_function,
+                        count_colors, heat_data)
+
 # Page config
 st.set_page_config(
     page_title="Address Heatmap Dashboard",
@@ -15,99 +25,164 @@ st.set_page_config(
 @st.cache_data
 def load_data():
     """Load and prepare the data"""
-    # Load the combined address data (merges Address Details.csv and TNAddress.csv)
-    address_df = pd.read_csv('Combined_Address_Details.csv')
-
-    # Load Google Maps pincode coordinates (more reliable than the old CSV)
-    pincode_coords = pd.read_csv('pincode_coordinates_google.csv')
-
-    # Clean pincodes
-    address_df['CPA_PIN_CODE'] = pd.to_numeric(address_df['CPA_PIN_CODE'], errors='coerce')
-    address_df = address_df.dropna(subset=['CPA_PIN_CODE'])
-
-    # Parse registration date to extract year
-    address_df['RegistrationDate'] = pd.to_datetime(address_df['RegistrationDate'], format='%d/%m/%y', errors='coerce')
-    address_df['Year'] = address_df['RegistrationDate'].dt.year
-
-    # Merge with Google Maps coordinates (already clean and deduplicated, 1-to-1 mapping)
-    merged_df = address_df.merge(
-        pincode_coords[['pincode', 'latitude', 'longitude', 'city', 'state']],
-        left_on='CPA_PIN_CODE',
-        right_on='pincode',
-        how='left'
-    )
+    # Combined address data (Address Details.csv + TNAddress.csv) merged with the
+    # Google Maps pincode coordinates, served from the Parquet snapshot when the
+    # source CSVs are unchanged
+    return load_address_data()
 
-    # Rename columns to match expected format
-    merged_df = merged_df.rename(columns={
-        'latitude': 'Latitude',
-        'longitude': 'Longitude',
-        'state': 'StateName'
-    })
+@st.cache_data
+def load_cube():
+    """Pre-aggregate customer counts per pincode and year from the snapshot (built once, sliced per year)"""
+    df = load_data()
+    return build_pincode_cube(df, ['Year']), build_pincode_locations(df)
 
-    # Use Google Maps city if available, otherwise fall back to address city
-    merged_df['CPA_ADDR_CITY'] = merged_df['city'].fillna(merged_df['CPA_ADDR_CITY'])
+@st.cache_data
+def load_dataset_cube(selected_year='All Years'):
+    """
+    Pre-aggregate customer counts per pincode and year from the partitioned dataset.
+
+    A single year reads only that year's partitions, and "All Years" folds the
+    partitions into the cube one at a time instead of loading every row.
+    """
+    years = None if selected_year == 'All Years' else [selected_year]
+    return fold_pincode_aggregates(iter_partitions(ADDRESS_DATASET, years=years), ['Year'])
+
+def get_cube(selected_year='All Years'):
+    """
+    Cube holding the selected year.
+
+    With the partitioned dataset (written by merge_addresses.py) that is a cube
+    of just the year's partitions. Without it, it is the single all-years cube
+    built from the snapshot, which summarize_cube slices to the year.
+    """
+    if ADDRESS_DATASET.exists():
+        return load_dataset_cube(selected_year)
+    return load_cube()
 
-    # Drop rows without coordinates
-    merged_df = merged_df.dropna(subset=['Latitude', 'Longitude'])
+@st.cache_data
+def load_years():
+    """Years present in the data (read from the partition names when there is a dataset)"""
+    if ADDRESS_DATASET.exists():
+        years = dataset_partitions(ADDRESS_DATASET)['Year']
+    else:
+        years = get_cube()[0]['Year']
+    return [int(year) for year in sorted(years.dropna().unique())]
 
-    return merged_df
+@st.cache_data
+def get_pincode_summary(selected_year):
+    """Slice the pre-aggregated cube for the selected year and sum counts per pincode"""
+    cube, pincode_locations = get_cube(selected_year)
+    return summarize_cube(
+        cube,
+        pincode_locations,
+        'customer_count',
+        {'Year': selected_year if selected_year != 'All Years' else None}
+    )
+
+@st.cache_data
+def get_cluster_index(selected_year):
+    """Multi-zoom cluster hierarchy of the pincode summary for the selected year"""
+    return build_cluster_index(get_pincode_summary(selected_year), 'customer_count')
+
+def get_heat_tiles(selected_year):
+    """
+    URL template of the server-rendered heatmap tiles for the selected year.
+
+    Not cached: the tiles may have been evicted from disk since the URL was
+    last handed out, so every run checks them (and re-renders them if needed).
+    """
+    pincode_summary = get_pincode_summary(selected_year)
+    return static_heat_tiles(
+        pincode_summary['Latitude'].to_numpy(),
+        pincode_summary['Longitude'].to_numpy(),
+        pincode_summary['customer_count'].to_numpy()
+    )
+
+@st.cache_data
+def get_hex_mapping(hex_width):
+    """Pincode -> hexagon mapping at one resolution, shared by every year"""
+    _, pincode_locations = get_cube()
+    return hex_mapping(pincode_locations, hex_width)
+
+@st.cache_data
+def get_boundary_bands():
+    """
+    Simplified boundaries of the pincodes in the data, one serialized GeoJSON per zoom band.
+
+    Built once (and simplified once per boundary file, see boundaries.py); filter
+    changes only rebuild the pincode -> colour table joined to it in the browser.
+    """
+    _, pincode_locations = get_cube()
+    bands = load_simplified_boundaries(BOUNDARY_FILE)
+    covered = set(bands[-1]['geometries']) if bands else set()
+    return band_feature_collections(bands, pincode_locations['CPA_PIN_CODE']), covered
 
 # Load data
 st.title("📍 Customer Address Heatmap Dashboard")
 st.markdown("Interactive visualization of customer addresses across India")
 
 with st.spinner("Loading data..."):
-    df = load_data()
+    years = load_years()
 
 # Sidebar filters
 st.sidebar.header("🔍 Filters")
 
 # Year filter
-years = sorted(df['Year'].dropna().unique())
-year_options = ['All Years'] + [int(year) for year in years]
+year_options = ['All Years'] + years
 selected_year = st.sidebar.selectbox("Select Year", year_options)
 
 # Visualization type
 viz_type = st.sidebar.radio(
     "Visualization Type",
-    ["Clustered Markers", "Heatmap", "Both"]
+    ["Clustered Markers", "Heatmap", "Both", "Hexbin", "Choropleth"],
+    help="Hexbin sums the pincodes into equal-area hexagons, so dense areas can be compared fairly. "
+         f"Choropleth shades pincode boundaries (from {BOUNDARY_FILE}) by count or percentage"
 )
 
+# Hexagon size for the hexbin view
+if viz_type == "Hexbin":
+    hex_resolution = st.sidebar.select_slider("Hexagon Size", list(HEX_RESOLUTIONS), value="Medium (10 km)")
+
 # Display mode toggle
 display_mode = st.sidebar.radio(
     "Display Mode",
     ["Absolute Count", "Percentage"]
 )
 
-# Apply filters
-if selected_year != 'All Years':
-    filtered_df = df[df['Year'] == selected_year]
-else:
-    filtered_df = df
-
-# Aggregate data by pincode - first get total count per pincode
-pincode_counts = filtered_df.groupby('CPA_PIN_CODE').size().reset_index(name='customer_count')
+# Marker rendering mode
+marker_rendering = st.sidebar.radio(
+    "Marker Rendering",
+    ["Browser (compact)", "Server-side Clusters", "Folium Markers"],
+    help="Browser mode sends the pincode data once and builds markers in the browser, "
+         "which keeps the map small and fast with many pincodes. Server-side clusters "
+         "are precomputed per zoom level, so the browser never re-clusters markers"
+)
 
-# For each pincode, get representative location (median of all lat/longs) and most common city/state
-pincode_locations = filtered_df.groupby('CPA_PIN_CODE').agg({
-    'Latitude': 'median',  # Median latitude (should be same for all rows of a pincode after initial dedup)
-    'Longitude': 'median',  # Median longitude (should be same for all rows of a pincode after initial dedup)
-    'CPA_ADDR_CITY': lambda x: x.mode()[0] if len(x.mode()) > 0 else x.iloc[0],  # Most common city
-    'StateName': lambda x: x.mode()[0] if len(x.mode()) > 0 else x.iloc[0]  # Most common state
-}).reset_index()
+# Heatmap rendering mode
+heatmap_rendering = st.sidebar.radio(
+    "Heatmap Rendering",
+    ["Browser (Leaflet.heat)", "Server Tiles"],
+    help="Browser mode sends every point and recomputes the heatmap on each pan and zoom. "
+         "Server tiles are rendered once per filter as PNG images, so the browser cost "
+         "does not grow with the number of points"
+)
 
-# Merge counts with locations
-pincode_summary = pincode_counts.merge(pincode_locations, on='CPA_PIN_CODE')
+# Memory held by the cached data frames
+with st.sidebar.expander("💾 Data Memory"):
+    cube, pincode_locations = get_cube(selected_year)
+    cached_frames = {'Pincode cube': cube, 'Pincode locations': pincode_locations}
+    if not ADDRESS_DATASET.exists():
+        cached_frames = {'Customer rows': load_data(), **cached_frames}
+    st.dataframe(memory_report(cached_frames), hide_index=True)
 
-# Calculate percentage of total customers
-total_customers = len(filtered_df)
-pincode_summary['percentage'] = (pincode_summary['customer_count'] / total_customers * 100)
-pincode_summary = pincode_summary.sort_values('customer_count', ascending=False)
+# Slice the pre-aggregated cube for the selected year and sum counts per pincode
+pincode_summary = get_pincode_summary(selected_year)
+total_customers = int(pincode_summary['customer_count'].sum())
 
 # Display statistics
 col1, col2, col3, col4 = st.columns(4)
 with col1:
-    st.metric("Total Customers", f"{len(filtered_df):,}")
+    st.metric("Total Customers", f"{total_customers:,}")
 with col2:
     st.metric("Unique Pincodes", f"{len(pincode_summary):,}")
 with col3:
@@ -135,173 +210,164 @@ if viz_type in ["Clustered Markers", "Both"]:
     # Determine if we're in percentage mode
     is_percentage_mode = display_mode == "Percentage"
 
-    # Custom cluster function to show customer count sum instead of marker count
-    if is_percentage_mode:
-        icon_create_function = f"""
-        function(cluster) {{
-            var markers = cluster.getAllChildMarkers();
-            var sumCount = 0;
-            var sumPct = 0;
-            var totalCustomers = {total_customers};
-            for (var i = 0; i < markers.length; i++) {{
-                if (markers[i].options.customCount) {{
-                    sumCount += markers[i].options.customCount;
-                }}
-                if (markers[i].options.customPercentage) {{
-                    sumPct += markers[i].options.customPercentage;
-                }}
-            }}
-
-            var displayText = sumPct < 1 ? '<1%' : sumPct.toFixed(1) + '%';
-
-            var size = 'small';
-            if (sumPct >= 10) size = 'large';
-            else if (sumPct >= 5) size = 'medium';
-
-            var color = 'lightblue';
-            if (sumPct >= 10) color = 'red';
-            else if (sumPct >= 5) color = 'orange';
-            else if (sumPct >= 1) color = 'lightgreen';
-
-            return L.divIcon({{
-                html: '<div style="background-color:' + color + '; border-radius: 50%; text-align: center; color: black; font-weight: bold; border: 3px solid white; box-shadow: 0 0 10px rgba(0,0,0,0.5);"><span>' + displayText + '</span></div>',
-                className: 'marker-cluster marker-cluster-' + size,
-                iconSize: new L.Point(40, 40)
-            }});
-        }}
-        """
+    if marker_rendering == "Server-side Clusters":
+        # Clusters and their sums come precomputed for every zoom level
+        ClusterIndexLayer(
+            get_cluster_index(selected_year),
+            pincode_summary,
+            'customer_count',
+            is_percentage_mode,
+            'customers',
+            name="Customer Locations"
+        ).add_to(m)
     else:
-        icon_create_function = """
-        function(cluster) {
-            var markers = cluster.getAllChildMarkers();
-            var sum = 0;
-            for (var i = 0; i < markers.length; i++) {
-                if (markers[i].options.customCount) {
-                    sum += markers[i].options.customCount;
-                }
-            }
-            var size = 'small';
-            if (sum >= 5000) size = 'large';
-            else if (sum >= 1000) size = 'medium';
-
-            var color = 'lightblue';
-            if (sum > 1000) color = 'red';
-            else if (sum > 500) color = 'orange';
-            else if (sum >= 100) color = 'lightgreen';
-
-            return L.divIcon({
-                html: '<div style="background-color:' + color + '; border-radius: 50%; text-align: center; color: black; font-weight: bold; border: 3px solid white; box-shadow: 0 0 10px rgba(0,0,0,0.5);"><span>' + sum + '</span></div>',
-                className: 'marker-cluster marker-cluster-' + size,
-                iconSize: new L.Point(40, 40)
-            });
-        }
-        """
-
-    marker_cluster = MarkerCluster(
-        name="Customer Locations",
-        overlay=True,
-        control=True,
-        icon_create_function=icon_create_function
-    )
-
-    for idx, row in pincode_summary.iterrows():
-        # Format percentage for display
-        pct_display = "<1%" if row['percentage'] < 1 else f"{row['percentage']:.1f}%"
-
-        # Create popup content - always show both count and percentage
-        popup_html = f"""
-        <div style="font-family: Arial; width: 200px;">
-            <h4 style="margin: 0; color: #1f77b4;">📍 {row['CPA_ADDR_CITY']}</h4>
-            <hr style="margin: 5px 0;">
-            <b>Pincode:</b> {int(row['CPA_PIN_CODE'])}<br>
-            <b>State:</b> {row['StateName']}<br>
-            <b>Customers:</b> <span style="color: #d62728; font-weight: bold;">{row['customer_count']}</span><br>
-            <b>Percentage:</b> <span style="color: #d62728; font-weight: bold;">{pct_display}</span><br>
-            <b>Coordinates:</b> {row['Latitude']:.4f}, {row['Longitude']:.4f}
-        </div>
-        """
-
-        # Determine what to display on marker and color based on mode
-        if is_percentage_mode:
-            display_text = pct_display
-            # Color based on percentage thresholds
-            if row['percentage'] >= 10:
-                color = 'red'
-            elif row['percentage'] >= 5:
-                color = 'orange'
-            elif row['percentage'] >= 1:
-                color = 'lightgreen'
-            else:
-                color = 'lightblue'
-            tooltip_text = f"{row['CPA_ADDR_CITY']} - {pct_display} ({row['customer_count']} customers)"
-        else:
-            display_text = str(row['customer_count'])
-            # Color based on customer count thresholds
-            if row['customer_count'] > 1000:
-                color = 'red'
-            elif row['customer_count'] > 500:
-                color = 'orange'
-            elif row['customer_count'] > 100:
-                color = 'lightgreen'
-            else:
-                color = 'lightblue'
-            tooltip_text = f"{row['CPA_ADDR_CITY']} - {row['customer_count']} customers"
-
-        # Create custom DivIcon that shows the appropriate value
-        custom_icon = folium.DivIcon(
-            html=f'''
-            <div style="
-                background-color: {color};
-                border-radius: 50%;
-                width: 35px;
-                height: 35px;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                color: black;
-                font-weight: bold;
-                font-size: 11px;
-                border: 3px solid white;
-                box-shadow: 0 0 10px rgba(0,0,0,0.5);
-            ">{display_text}</div>
-            '''
+        # Custom cluster function to show customer count sum instead of marker count
+        icon_create_function = cluster_icon_function(is_percentage_mode, total_customers)
+
+        marker_cluster = MarkerCluster(
+            name="Customer Locations",
+            overlay=True,
+            control=True,
+            icon_create_function=icon_create_function
         )
 
-        # Create marker with custom properties
-        marker = folium.Marker(
-            location=[row['Latitude'], row['Longitude']],
-            popup=folium.Popup(popup_html, max_width=250),
-            tooltip=tooltip_text,
-            icon=custom_icon
-        )
-        # Add custom properties for customer count and percentage
-        marker.options['customCount'] = int(row['customer_count'])
-        marker.options['customPercentage'] = float(row['percentage'])
-        marker.add_to(marker_cluster)
-
-    marker_cluster.add_to(m)
+        if marker_rendering == "Browser (compact)":
+            # Ship the summary as one array and build the markers in the browser
+            PincodeMarkerLayer(pincode_summary, 'customer_count', is_percentage_mode, 'customers').add_to(marker_cluster)
+        else:
+            # One folium.Marker + DivIcon + Popup per pincode
+            for idx, row in pincode_summary.iterrows():
+                # Format percentage for display
+                pct_display = "<1%" if row['percentage'] < 1 else f"{row['percentage']:.1f}%"
+
+                # Create popup content - always show both count and percentage
+                popup_html = f"""
+                <div style="font-family: Arial; width: 200px;">
+                    <h4 style="margin: 0; color: #1f77b4;">📍 {row['CPA_ADDR_CITY']}</h4>
+                    <hr style="margin: 5px 0;">
+                    <b>Pincode:</b> {int(row['CPA_PIN_CODE'])}<br>
+                    <b>State:</b> {row['StateName']}<br>
+                    <b>Customers:</b> <span style="color: #d62728; font-weight: bold;">{row['customer_count']}</span><br>
+                    <b>Percentage:</b> <span style="color: #d62728; font-weight: bold;">{pct_display}</span><br>
+                    <b>Coordinates:</b> {row['Latitude']:.4f}, {row['Longitude']:.4f}
+                </div>
+                """
+
+                # Determine what to display on marker and color based on mode
+                if is_percentage_mode:
+                    display_text = pct_display
+                    # Color based on percentage thresholds
+                    if row['percentage'] >= 10:
+                        color = 'red'
+                    elif row['percentage'] >= 5:
+                        color = 'orange'
+                    elif row['percentage'] >= 1:
+                        color = 'lightgreen'
+                    else:
+                        color = 'lightblue'
+                    tooltip_text = f"{row['CPA_ADDR_CITY']} - {pct_display} ({row['customer_count']} customers)"
+                else:
+                    display_text = str(row['customer_count'])
+                    # Color based on customer count thresholds
+                    if row['customer_count'] > 1000:
+                        color = 'red'
+                    elif row['customer_count'] > 500:
+                        color = 'orange'
+                    elif row['customer_count'] > 100:
+                        color = 'lightgreen'
+                    else:
+                        color = 'lightblue'
+                    tooltip_text = f"{row['CPA_ADDR_CITY']} - {row['customer_count']} customers"
+
+                # Create custom DivIcon that shows the appropriate value
+                custom_icon = folium.DivIcon(
+                    html=f'''
+                    <div style="
+                        background-color: {color};
+                        border-radius: 50%;
+                        width: 35px;
+                        height: 35px;
+                        display: flex;
+                        align-items: center;
+                        justify-content: center;
+                        color: black;
+                        font-weight: bold;
+                        font-size: 11px;
+                        border: 3px solid white;
+                        box-shadow: 0 0 10px rgba(0,0,0,0.5);
+                    ">{display_text}</div>
+                    '''
+                )
+
+                # Create marker with custom properties
+                marker = folium.Marker(
+                    location=[row['Latitude'], row['Longitude']],
+                    popup=folium.Popup(popup_html, max_width=250),
+                    tooltip=tooltip_text,
+                    icon=custom_icon
+                )
+                # Add custom properties for customer count and percentage
+                marker.options['customCount'] = int(row['customer_count'])
+                marker.options['customPercentage'] = float(row['percentage'])
+                marker.add_to(marker_cluster)
+
+        marker_cluster.add_to(m)
 
 # Add heatmap layer
 if viz_type in ["Heatmap", "Both"]:
-    heat_data = [
-        [row['Latitude'], row['Longitude'], row['customer_count']]
-        for _, row in pincode_summary.iterrows()
-    ]
-
-    HeatMap(
-        heat_data,
-        name="Heatmap",
-        min_opacity=0.3,
-        max_zoom=18,
-        radius=15,
-        blur=20,
-        gradient={
-            0.0: 'blue',
-            0.5: 'lime',
-            0.7: 'yellow',
-            1.0: 'red'
+    if heatmap_rendering == "Server Tiles":
+        heat_tile_layer(get_heat_tiles(selected_year), name="Heatmap").add_to(m)
+    else:
+        points = heat_data(
+            pincode_summary['Latitude'].to_numpy(),
+            pincode_summary['Longitude'].to_numpy(),
+            pincode_summary['customer_count'].to_numpy()
+        )
+
+        HeatDataLayer(
+            points,
+            name="Heatmap",
+            min_opacity=0.3,
+            max_zoom=18,
+            radius=15,
+            blur=20,
+            gradient={
+                0.0: 'blue',
+                0.5: 'lime',
+                0.7: 'yellow',
+                1.0: 'red'
+            }
+        ).add_to(m)
+
+# Add hexbin layer (one GeoJSON layer of equal-area hexagons)
+if viz_type == "Hexbin":
+    hex_width = HEX_RESOLUTIONS[hex_resolution]
+    hexes = aggregate_hexes(pincode_summary, get_hex_mapping(hex_width), 'customer_count')
+    hexbin_layer(hexes, hex_width, 'customer_count', 'customers', display_mode == "Percentage").add_to(m)
+
+# Add choropleth layer (pincode polygons shaded by the display mode's value)
+if viz_type == "Choropleth":
+    if Path(BOUNDARY_FILE).exists():
+        boundary_bands, covered_pincodes = get_boundary_bands()
+        value_column = 'percentage' if display_mode == "Percentage" else 'customer_count'
+        values = {
+            pincode: (color, f"{city} - {pincode}: {count:,} customers ({percentage:.1f}%)")
+            for pincode, city, count, percentage, color in zip(
+                pincode_summary['CPA_PIN_CODE'].astype(int).tolist(),
+                pincode_summary['CPA_ADDR_CITY'].astype(str).tolist(),
+                pincode_summary['customer_count'].astype(int).tolist(),
+                pincode_summary['percentage'].tolist(),
+                count_colors(pincode_summary[value_column])
+            )
         }
-    ).add_to(m)
+        ChoroplethLayer(boundary_bands, values, name="Choropleth").add_to(m)
+
+        missing = len(set(values) - covered_pincodes)
+        if missing:
+            st.caption(f"{missing:,} of {len(values):,} pincodes have no boundary in {BOUNDARY_FILE} and are not shaded")
+    else:
+        st.warning(f"Choropleth mode needs pincode boundary polygons in {BOUNDARY_FILE} "
+                   "(a GeoJSON FeatureCollection with a Pincode property per feature)")
 
 # Add layer control if both are shown
 if viz_type == "Both":
@@ -0,0 +1,93 @@
+"""
+Benchmark: heat_data() + HeatDataLayer vs the iterrows() heat_data + HeatMap path.
+
+Generates a synthetic pincode summary (float32 coordinates and integer counts,
+as the compact load schema stores them) at several sizes. It times building the
+heatmap layer both ways, compares the size of the JSON each writes into the
+page, and checks that the points agree to within the rounding.
+
+Usage:
+    python benchmark_heat_data.py                    # 1k, 100k and 1M points
+    python benchmark_heat_data.py --sizes 1000 50000
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from folium.plugins import HeatMap
+
+from map_layers import HeatDataLayer, heat_data
+
+
+def make_synthetic_summary(n_points, seed=42):
+    """Synthetic pincode summary spread over India with skewed counts"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Latitude': rng.uniform(8, 35, n_points).astype('float32'),
+        'Longitude': rng.uniform(68, 97, n_points).astype('float32'),
+        'customer_count': rng.zipf(1.8, n_points).clip(max=50_000)
+    })
+
+
+def iterrows_layer(pincode_summary):
+    """The original path: one Series per row, then folium's per-point validation"""
+    points = [
+        [row['Latitude'], row['Longitude'], row['customer_count']]
+        for _, row in pincode_summary.iterrows()
+    ]
+    return HeatMap(points, radius=15, blur=20)
+
+
+def vectorized_layer(pincode_summary):
+    """The same layer through map_layers.heat_data and HeatDataLayer"""
+    points = heat_data(
+        pincode_summary['Latitude'].to_numpy(),
+        pincode_summary['Longitude'].to_numpy(),
+        pincode_summary['customer_count'].to_numpy()
+    )
+    return HeatDataLayer(points, radius=15, blur=20)
+
+
+def timed(func, *args):
+    """Run func once and return (result, seconds)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000],
+                        help="Point counts to benchmark")
+    args = parser.parse_args()
+
+    print("=" * 78)
+    print("heat_data() vs iterrows() - build time, payload size and parity")
+    print("=" * 78)
+    print(f"{'Points':>10} {'iterrows (s)':>13} {'Vectorized (s)':>15} {'Speedup':>8} "
+          f"{'JSON before':>12} {'JSON after':>11}  Parity")
+
+    for n_points in args.sizes:
+        summary = make_synthetic_summary(n_points)
+        expected, iterrows_seconds = timed(iterrows_layer, summary)
+        actual, vectorized_seconds = timed(vectorized_layer, summary)
+
+        expected_points = np.asarray(expected.data, dtype='float64')
+        actual_points = np.asarray(actual.data, dtype='float64')
+        parity = expected_points.shape == actual_points.shape and \
+            np.allclose(expected_points, actual_points, rtol=0, atol=1e-6)
+
+        before_mb = len(json.dumps(expected.data)) / 1e6
+        after_mb = len(json.dumps(actual.data)) / 1e6
+        print(f"{n_points:>10,} {iterrows_seconds:>13.3f} {vectorized_seconds:>15.3f} "
+              f"{iterrows_seconds / vectorized_seconds:>7.1f}x {before_mb:>10.2f}MB {after_mb:>9.2f}MB  "
+              f"{'✅' if parity else '❌'}")
+
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: vectorized most_frequent() vs the lambda-based mode() aggregation.
+
+Generates synthetic address rows (pincode, city, state) at several sizes,
+checks that aggregates.most_frequent returns exactly what the old
+groupby().agg(lambda x: x.mode()[0]) returned, and times both.
+
+Usage:
+    python benchmark_mode.py                      # 100k, 1M and 10M rows
+    python benchmark_mode.py --sizes 100000 500000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from aggregates import most_frequent
+
+
+def make_synthetic_rows(n_rows, n_pincodes=3600, seed=42):
+    """Synthetic address rows with a dominant city per pincode plus noise and nulls"""
+    rng = np.random.default_rng(seed)
+    pincodes = 110000 + rng.choice(n_pincodes * 10, n_pincodes, replace=False)
+    cities = np.array([f"City {i}" for i in range(500)], dtype=object)
+    states = np.array([f"State {i}" for i in range(30)], dtype=object)
+
+    pincode_idx = rng.integers(0, n_pincodes, n_rows)
+    # 80% of rows carry the pincode's own city, the rest a random one
+    own_city = rng.random(n_rows) < 0.8
+    city = np.where(own_city, cities[pincode_idx % len(cities)], cities[rng.integers(0, len(cities), n_rows)])
+    city[rng.random(n_rows) < 0.02] = None
+    state = states[pincode_idx % len(states)].copy()
+    state[rng.random(n_rows) < 0.05] = None
+
+    return pd.DataFrame({
+        'CPA_PIN_CODE': pincodes[pincode_idx],
+        'CPA_ADDR_CITY': city,
+        'StateName': state
+    })
+
+
+def lambda_mode(df):
+    """The original per-group Python lambda aggregation"""
+    return df.groupby('CPA_PIN_CODE').agg({
+        'CPA_ADDR_CITY': lambda x: x.mode()[0] if len(x.mode()) > 0 else x.iloc[0],
+        'StateName': lambda x: x.mode()[0] if len(x.mode()) > 0 else x.iloc[0]
+    })
+
+
+def vectorized_mode(df):
+    """The same aggregation through aggregates.most_frequent"""
+    return pd.DataFrame({
+        'CPA_ADDR_CITY': most_frequent(df, 'CPA_PIN_CODE', 'CPA_ADDR_CITY'),
+        'StateName': most_frequent(df, 'CPA_PIN_CODE', 'StateName')
+    })
+
+
+def as_categorical(df):
+    """The same rows with categorical city/state columns (as the compact load schema stores them)"""
+    return df.astype({'CPA_ADDR_CITY': 'category', 'StateName': 'category'})
+
+
+def timed(func, *args):
+    """Run func once and return (result, seconds)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000, 10_000_000],
+                        help="Row counts to benchmark")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("most_frequent() vs lambda mode() - parity and speed")
+    print("=" * 70)
+    print("Columns: object = plain string columns, category = categorical city/state")
+    print(f"{'Rows':>12} {'Columns':>9} {'Lambda (s)':>12} {'Vectorized (s)':>16} {'Speedup':>9}  Parity")
+
+    for n_rows in args.sizes:
+        df = make_synthetic_rows(n_rows)
+        expected, lambda_seconds = timed(lambda_mode, df)
+
+        for label, frame in [('object', df), ('category', as_categorical(df))]:
+            actual, vectorized_seconds = timed(vectorized_mode, frame)
+            actual = actual.astype(object)
+
+            parity = expected.equals(actual)
+            print(f"{n_rows:>12,} {label:>9} {lambda_seconds:>12.2f} {vectorized_seconds:>16.2f} "
+                  f"{lambda_seconds / vectorized_seconds:>8.1f}x  {'✅' if parity else '❌'}")
+
+            if not parity:
+                mismatched = (expected != actual) & ~(expected.isna() & actual.isna())
+                print(f"  ❌ {int(mismatched.any(axis=1).sum())} pincodes differ")
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
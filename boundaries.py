@@ -0,0 +1,297 @@
+"""
+Pincode boundary polygons, simplified per zoom band and cached on disk.
+
+Boundaries are read once from a local GeoJSON file (one or more Polygon or
+MultiPolygon features per pincode) and simplified for every zoom band in
+ZOOM_BANDS. The simplification keeps the topology, like TopoJSON: rings are
+split into arcs at the points where neighbouring pincodes meet, every shared
+arc is simplified once (Douglas-Peucker), and both neighbours use the same
+simplified arc. Adjacent pincodes therefore never open gaps or overlap,
+however coarse the band.
+
+The simplified bands are written to .snapshots/ as JSON, keyed by the
+boundary file's contents and the band settings, so the simplification runs
+only when the boundary file changes.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+
+from data_loader import SNAPSHOT_DIR, sources_key
+
+BOUNDARY_FILE = 'pincode_boundaries.geojson'
+
+# Feature properties that may hold the pincode (first match wins)
+PINCODE_PROPERTIES = ['Pincode', 'pincode', 'PINCODE', 'PIN_CODE', 'pin_code', 'CPA_PIN_CODE']
+
+# (min_zoom, max_zoom, simplification tolerance in degrees), coarsest first
+ZOOM_BANDS = [
+    (0, 7, 0.005),     # ~500 m
+    (8, 10, 0.001),    # ~100 m
+    (11, 18, 0.0002)   # ~20 m
+]
+
+# Coordinates are matched between neighbouring rings at this precision (~0.1 m)
+QUANTIZE_DECIMALS = 6
+
+# Decimals kept in the simplified output (~1 m)
+OUTPUT_DECIMALS = 5
+
+
+def read_boundaries(path=BOUNDARY_FILE):
+    """
+    Polygons per pincode from a GeoJSON FeatureCollection.
+
+    Returns:
+        dict: pincode (int) -> list of polygons, each a list of closed rings
+        (numpy arrays of [lon, lat]), outer ring first
+    """
+    with open(path, encoding='utf-8') as f:
+        collection = json.load(f)
+
+    shapes = {}
+    for feature in collection.get('features', []):
+        properties = feature.get('properties') or {}
+        geometry = feature.get('geometry') or {}
+        key = next((name for name in PINCODE_PROPERTIES if properties.get(name) not in (None, '')), None)
+        if key is None or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+            continue
+        try:
+            pincode = int(float(properties[key]))
+        except (TypeError, ValueError):
+            continue
+
+        polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+        for polygon in polygons:
+            rings = [np.asarray(ring, dtype='float64')[:, :2] for ring in polygon if len(ring) >= 4]
+            if rings:
+                shapes.setdefault(pincode, []).append(rings)
+    return shapes
+
+
+def build_topology(shapes):
+    """
+    Split every ring into arcs shared between neighbouring rings.
+
+    A point is a junction when its neighbouring points differ between the
+    rings it belongs to, i.e. where one shared boundary ends and another
+    begins. Rings are cut at junctions, and an arc met again (in either
+    direction) is stored once.
+
+    Returns:
+        tuple: (points, arcs, topology)
+            points: (n, 2) unique [lon, lat] coordinates
+            arcs: list of point-index arrays
+            topology: pincode -> polygons -> rings -> list of (arc, reversed)
+    """
+    rings = [ring for polygons in shapes.values() for polygon in polygons for ring in polygon]
+    if not rings:
+        return np.empty((0, 2)), [], {}
+
+    # Open rings (without the closing point), identified by quantized coordinates
+    open_rings = [ring[:-1] if np.array_equal(ring[0], ring[-1]) else ring for ring in rings]
+    lengths = np.array([len(ring) for ring in open_rings])
+    quantized = np.round(np.concatenate(open_rings) * 10 ** QUANTIZE_DECIMALS).astype('int64')
+    _, first, point_ids = np.unique(quantized, axis=0, return_index=True, return_inverse=True)
+    point_ids = point_ids.ravel()
+    points = np.concatenate(open_rings)[first]
+
+    # Previous and next point of every occurrence, within its own ring
+    starts = np.r_[0, np.cumsum(lengths)[:-1]]
+    ring_of = np.repeat(np.arange(len(lengths)), lengths)
+    position = np.arange(len(point_ids)) - starts[ring_of]
+    previous = point_ids[starts[ring_of] + (position - 1) % lengths[ring_of]]
+    following = point_ids[starts[ring_of] + (position + 1) % lengths[ring_of]]
+
+    # Junctions: points seen with more than one distinct pair of neighbours
+    pairs = np.unique(np.column_stack([point_ids, np.minimum(previous, following), np.maximum(previous, following)]), axis=0)
+    junction = np.bincount(pairs[:, 0], minlength=len(points)) > 1
+
+    arcs = []
+    arc_keys = {}
+
+    def arc_ref(ids):
+        key = tuple(ids.tolist())
+        if key in arc_keys:
+            return arc_keys[key], False
+        reversed_key = key[::-1]
+        if reversed_key in arc_keys:
+            return arc_keys[reversed_key], True
+        arc_keys[key] = len(arcs)
+        arcs.append(ids)
+        return len(arcs) - 1, False
+
+    ring_refs = []
+    for start, length in zip(starts, lengths):
+        ids = point_ids[start:start + length]
+        cuts = np.flatnonzero(junction[ids])
+        if len(cuts) == 0:
+            # A ring that shares no boundary, or shares all of it (an enclave):
+            # one closed arc from its lowest point, so both sides find the same arc
+            rotated = np.roll(ids, -int(np.argmin(ids)))
+            ring_refs.append([arc_ref(np.r_[rotated, rotated[0]])])
+            continue
+
+        rotated = np.roll(ids, -int(cuts[0]))
+        rotated = np.r_[rotated, rotated[0]]
+        cut_positions = np.r_[np.flatnonzero(junction[rotated[:-1]]), len(rotated) - 1]
+        ring_refs.append([
+            arc_ref(rotated[begin:end + 1])
+            for begin, end in zip(cut_positions[:-1], cut_positions[1:])
+        ])
+
+    # Regroup the ring references by pincode and polygon, in reading order
+    topology = {}
+    refs = iter(ring_refs)
+    for pincode, polygons in shapes.items():
+        topology[pincode] = [[next(refs) for _ in polygon] for polygon in polygons]
+    return points, arcs, topology
+
+
+def douglas_peucker(coords, tolerance):
+    """
+    Points of a line to keep so it stays within tolerance of the original.
+
+    Both end points are always kept. A closed line is split at its point
+    farthest from the start first, so the start and end segment is not degenerate.
+
+    Returns:
+        numpy.ndarray: Boolean keep mask
+    """
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[[0, -1]] = True
+    if len(coords) < 3:
+        return keep
+
+    stack = [(0, len(coords) - 1)]
+    if np.array_equal(coords[0], coords[-1]):
+        farthest = int(np.argmax(np.hypot(*(coords - coords[0]).T)))
+        keep[farthest] = True
+        stack = [(0, farthest), (farthest, len(coords) - 1)]
+
+    while stack:
+        begin, end = stack.pop()
+        if end - begin < 2:
+            continue
+        segment = coords[end] - coords[begin]
+        offsets = coords[begin + 1:end] - coords[begin]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(*offsets.T)
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = begin + 1 + farthest
+            keep[split] = True
+            stack.extend([(begin, split), (split, end)])
+    return keep
+
+
+def simplify_topology(points, arcs, topology, tolerance):
+    """
+    GeoJSON geometry of every pincode with each shared arc simplified once.
+
+    Rings that collapse to fewer than three distinct points are dropped, as
+    are polygons whose outer ring collapses.
+
+    Returns:
+        dict: pincode -> GeoJSON Polygon/MultiPolygon geometry
+    """
+    simplified = []
+    for ids in arcs:
+        coords = points[ids]
+        simplified.append(coords[douglas_peucker(coords, tolerance)].round(OUTPUT_DECIMALS))
+
+    geometries = {}
+    for pincode, polygons in topology.items():
+        polygon_coords = []
+        for rings in polygons:
+            ring_coords = []
+            for refs in rings:
+                parts = [simplified[arc][::-1] if is_reversed else simplified[arc] for arc, is_reversed in refs]
+                ring = np.concatenate([parts[0]] + [part[1:] for part in parts[1:]])
+                if len(np.unique(ring, axis=0)) >= 3:
+                    ring_coords.append(ring.tolist())
+                elif not ring_coords:
+                    break  # The outer ring collapsed; drop the polygon
+            if ring_coords:
+                polygon_coords.append(ring_coords)
+
+        if len(polygon_coords) == 1:
+            geometries[pincode] = {'type': 'Polygon', 'coordinates': polygon_coords[0]}
+        elif polygon_coords:
+            geometries[pincode] = {'type': 'MultiPolygon', 'coordinates': polygon_coords}
+    return geometries
+
+
+def boundary_cache_path(path, cache_dir=SNAPSHOT_DIR):
+    """Cache file for the current boundary file contents and band settings"""
+    key = hashlib.sha256(f"{sources_key([path])}{ZOOM_BANDS}{OUTPUT_DECIMALS}".encode()).hexdigest()[:16]
+    return Path(cache_dir) / f"pincode_boundaries-{key}.json"
+
+
+def load_simplified_boundaries(path=BOUNDARY_FILE, cache_dir=SNAPSHOT_DIR):
+    """
+    Simplified pincode geometries for every zoom band, from the disk cache when possible.
+
+    Returns:
+        list: One dict per ZOOM_BANDS entry with min_zoom, max_zoom, tolerance
+        and geometries (pincode -> GeoJSON geometry)
+    """
+    cache_path = boundary_cache_path(path, cache_dir)
+    if cache_path.exists():
+        with open(cache_path, encoding='utf-8') as f:
+            bands = json.load(f)
+        for band in bands:
+            band['geometries'] = {int(pincode): geometry for pincode, geometry in band['geometries'].items()}
+        return bands
+
+    points, arcs, topology = build_topology(read_boundaries(path))
+    bands = [
+        {
+            'min_zoom': min_zoom,
+            'max_zoom': max_zoom,
+            'tolerance': tolerance,
+            'geometries': simplify_topology(points, arcs, topology, tolerance)
+        }
+        for min_zoom, max_zoom, tolerance in ZOOM_BANDS
+    ]
+
+    # Write to a temporary file first, then drop caches of older boundary files
+    cache_path.parent.mkdir(exist_ok=True)
+    tmp_path = cache_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(bands, f, separators=(',', ':'))
+    tmp_path.replace(cache_path)
+    for stale in cache_path.parent.glob('pincode_boundaries-*.json'):
+        if stale != cache_path:
+            stale.unlink()
+
+    return bands
+
+
+def band_feature_collections(bands, pincodes):
+    """
+    Serialized GeoJSON of each band, limited to the given pincodes.
+
+    Built once and reused across filter changes; the values are joined in the
+    browser (see map_layers.ChoroplethLayer).
+
+    Returns:
+        list: (min_zoom, max_zoom, FeatureCollection JSON string) per band
+    """
+    pincodes = {int(pincode) for pincode in pincodes}
+    collections = []
+    for band in bands:
+        features = [
+            {'type': 'Feature', 'properties': {'pincode': pincode}, 'geometry': geometry}
+            for pincode, geometry in band['geometries'].items()
+            if pincode in pincodes
+        ]
+        collection = json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':'))
+        collections.append((band['min_zoom'], band['max_zoom'], collection))
+    return collections
@@ -0,0 +1,106 @@
+"""
+Server-side multi-zoom clustering of the pincode summary.
+
+Builds a supercluster-style hierarchy in Python: pincodes are projected to Web
+Mercator pixels and, from the deepest zoom upwards, the clusters of zoom z+1 are
+merged on a grid of `radius`-pixel cells to form zoom z. Every cluster carries
+its summed count and percentage, so the browser only has to draw the clusters
+of the zoom level it is showing instead of re-clustering (and re-summing)
+every marker on each zoom.
+"""
+
+import numpy as np
+
+# Web Mercator tile size in pixels
+TILE_SIZE = 256
+
+
+def mercator_xy(lat, lon):
+    """Project lat/lon (degrees) to Web Mercator world coordinates in [0, 1]"""
+    lat = np.clip(np.asarray(lat, dtype='float64'), -85.0511, 85.0511)
+    x = (np.asarray(lon, dtype='float64') + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(lat))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)
+    return x, y
+
+
+def mercator_latlon(x, y):
+    """Inverse of mercator_xy"""
+    lon = x * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y))))
+    return lat, lon
+
+
+def build_cluster_index(pincode_summary, count_column, min_zoom=0, max_zoom=16, radius=60):
+    """
+    Build the per-zoom cluster hierarchy for a pincode summary.
+
+    Args:
+        pincode_summary (pd.DataFrame): Per-pincode summary with Latitude, Longitude,
+            percentage and the count column
+        count_column (str): Name of the count column (e.g. 'customer_count')
+        min_zoom (int): Lowest zoom level to build
+        max_zoom (int): Highest zoom level at which pincodes may still be clustered
+        radius (int): Cluster cell size in screen pixels
+
+    Returns:
+        dict: zoom -> dict of equal-length arrays:
+            lat, lon: Cluster position (mean of its pincodes, in Mercator space)
+            count, percentage: Summed over the cluster's pincodes
+            size: Number of pincodes in the cluster
+            point: Row position in pincode_summary for single-pincode clusters, else -1
+            expansion_zoom: First zoom at which the cluster splits into several
+        A level identical to the one below it (nothing merged between them)
+        is omitted; the browser keeps showing the lower level.
+    """
+    x, y = mercator_xy(pincode_summary['Latitude'].to_numpy(), pincode_summary['Longitude'].to_numpy())
+    n_points = len(x)
+
+    # Deepest level: one cluster per pincode
+    level = {
+        'x': x,
+        'y': y,
+        'count': pincode_summary[count_column].to_numpy().astype('int64'),
+        'percentage': pincode_summary['percentage'].to_numpy().astype('float64'),
+        'size': np.ones(n_points, dtype='int64'),
+        'point': np.arange(n_points),
+        'expansion_zoom': np.full(n_points, max_zoom + 1)
+    }
+
+    levels = {}
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        # Grid cell of every zoom+1 cluster at this zoom
+        scale = TILE_SIZE * 2 ** zoom / radius
+        cell_x = np.floor(level['x'] * scale).astype('int64')
+        cell_y = np.floor(level['y'] * scale).astype('int64')
+        _, parent = np.unique(cell_x * (int(scale) + 1) + cell_y, return_inverse=True)
+        n_clusters = parent.max() + 1 if len(parent) else 0
+
+        size = np.bincount(parent, weights=level['size'], minlength=n_clusters).astype('int64')
+        children = np.bincount(parent, minlength=n_clusters)
+
+        # Single-child clusters inherit their child's point and expansion zoom
+        only_child = np.full(n_clusters, -1)
+        only_child[parent] = np.arange(len(parent))
+        single = children == 1
+
+        merged = {
+            'x': np.bincount(parent, weights=level['x'] * level['size'], minlength=n_clusters) / size,
+            'y': np.bincount(parent, weights=level['y'] * level['size'], minlength=n_clusters) / size,
+            'count': np.bincount(parent, weights=level['count'], minlength=n_clusters).astype('int64'),
+            'percentage': np.bincount(parent, weights=level['percentage'], minlength=n_clusters),
+            'size': size,
+            'point': np.where(single, level['point'][only_child], -1),
+            'expansion_zoom': np.where(single, level['expansion_zoom'][only_child], zoom + 1)
+        }
+
+        # Nothing merged at this zoom: the level above is identical, keep only this one
+        if n_clusters == len(parent):
+            levels.pop(zoom + 1, None)
+        levels[zoom] = merged
+        level = merged
+
+    for zoom, merged in levels.items():
+        merged['lat'], merged['lon'] = mercator_latlon(merged.pop('x'), merged.pop('y'))
+
+    return dict(sorted(levels.items()))
@@ -1,117 +1,334 @@
+"""
+Static heatmap builder.
+
+Single map (default): merges Address Details.csv with the India Post pincode
+reference and writes address_heatmap.html, printing previews and statistics.
+
+Batch mode: loads and merges the data once, counts it per location and filter
+dimension, and renders every combination of the chosen dimensions (e.g. each
+year × each state, plus "all") as its own HTML map in parallel worker
+processes. A manifest.json in the output directory lists every map with its
+filters and counts.
+
+With --tiles the heat layer is rendered server-side as PNG tiles in a
+<map name>_tiles/ directory next to each map (see heat_tiles.py), instead of
+shipping every point to Leaflet.heat in the browser.
+
+Usage:
+    python create_heatmap.py
+    python create_heatmap.py --batch reports/ --by year --by state
+    python create_heatmap.py --batch reports/ --source BlrSurgeryOnly.csv --by year --by patient_type
+    python create_heatmap.py --batch reports/ --by year --tiles
+"""
+
+import argparse
+import itertools
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
 import pandas as pd
 import folium
-from folium.plugins import HeatMap
-
-print("Loading CSV files...")
-
-# Load the address details
-address_df = pd.read_csv('Address Details.csv')
-print(f"Loaded {len(address_df)} address records")
-
-# Load the pincode lat/long reference data
-pincode_df = pd.read_csv('pincode_with_lat-long.csv', low_memory=False)
-print(f"Loaded {len(pincode_df)} pincode records")
-
-print("\nData Preview:")
-print("\nAddress Details columns:", address_df.columns.tolist())
-print("Address Details sample:")
-print(address_df.head())
-
-print("\nPincode Data columns:", pincode_df.columns.tolist())
-print("Pincode Data sample:")
-print(pincode_df.head())
-
-# Clean the data
-print("\nCleaning data...")
-# Remove any leading/trailing whitespace and convert pincodes to integers
-address_df['CPA_PIN_CODE'] = pd.to_numeric(address_df['CPA_PIN_CODE'], errors='coerce')
-pincode_df['Pincode'] = pd.to_numeric(pincode_df['Pincode'], errors='coerce')
-
-# Convert Latitude and Longitude to numeric (handle mixed types)
-pincode_df['Latitude'] = pd.to_numeric(pincode_df['Latitude'], errors='coerce')
-pincode_df['Longitude'] = pd.to_numeric(pincode_df['Longitude'], errors='coerce')
-
-# Drop rows with missing pincodes
-address_df = address_df.dropna(subset=['CPA_PIN_CODE'])
-pincode_df = pincode_df.dropna(subset=['Pincode', 'Latitude', 'Longitude'])
-
-print(f"After cleaning: {len(address_df)} address records, {len(pincode_df)} pincode records")
-
-# Merge the dataframes
-print("\nMerging data...")
-merged_df = address_df.merge(
-    pincode_df[['Pincode', 'Latitude', 'Longitude', 'OfficeName', 'District', 'StateName']],
-    left_on='CPA_PIN_CODE',
-    right_on='Pincode',
-    how='left'
-)
-
-# Check merge success
-print(f"Merged {len(merged_df)} records")
-print(f"Records with valid coordinates: {merged_df[['Latitude', 'Longitude']].notna().all(axis=1).sum()}")
-
-# Remove rows without coordinates
-merged_df = merged_df.dropna(subset=['Latitude', 'Longitude'])
-print(f"Final records with coordinates: {len(merged_df)}")
-
-# Aggregate data - count addresses per location
-print("\nAggregating data by location...")
-location_counts = merged_df.groupby(['Latitude', 'Longitude']).size().reset_index(name='count')
-print(f"Unique locations: {len(location_counts)}")
-print(f"Total addresses mapped: {location_counts['count'].sum()}")
-
-# Create the heatmap
-print("\nCreating heatmap...")
-
-# Calculate center of map based on data
-center_lat = location_counts['Latitude'].mean()
-center_lon = location_counts['Longitude'].mean()
-
-# Create base map
-m = folium.Map(
-    location=[center_lat, center_lon],
-    zoom_start=6,
-    tiles='OpenStreetMap'
-)
-
-# Prepare data for heatmap - [latitude, longitude, weight]
-heat_data = [
-    [row['Latitude'], row['Longitude'], row['count']]
-    for _, row in location_counts.iterrows()
-]
-
-# Add heatmap layer
-HeatMap(
-    heat_data,
-    min_opacity=0.3,
-    max_zoom=18,
-    radius=15,
-    blur=20,
-    gradient={
-        0.0: 'blue',
-        0.5: 'lime',
-        0.7: 'yellow',
-        1.0: 'red'
+
+from data_loader import ADDRESS_FILE, PINCODE_COORDS_FILE, build_address_data, clean_patient_types
+from heat_tiles import HeatTileRenderer, heat_tile_layer
+from map_layers import HeatDataLayer, heat_data
+
+OUTPUT_FILE = 'address_heatmap.html'
+
+# Batch dimensions: CLI name -> column of the merged rows
+BATCH_DIMENSIONS = {
+    'year': 'Year',
+    'patient_type': 'BSM_MINOR_CD',
+    'state': 'StateName',
+    'location': 'RRH_LOCATION_CD'
+}
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def create_heatmap_map(location_counts, zoom_start=6, tiles_dir=None):
+    """
+    Folium map with one heatmap layer over [Latitude, Longitude, count] rows.
+
+    With tiles_dir the layer is rendered into PNG tiles there and the map loads
+    them by a URL relative to itself, so tiles_dir must sit next to the saved HTML.
+    """
+    # Calculate center of map based on data
+    center_lat = location_counts['Latitude'].mean()
+    center_lon = location_counts['Longitude'].mean()
+
+    # Create base map
+    m = folium.Map(
+        location=[center_lat, center_lon],
+        zoom_start=zoom_start,
+        tiles='OpenStreetMap'
+    )
+
+    if tiles_dir is not None:
+        HeatTileRenderer(
+            location_counts['Latitude'].to_numpy(),
+            location_counts['Longitude'].to_numpy(),
+            location_counts['count'].to_numpy()
+        ).write_tiles(tiles_dir)
+        heat_tile_layer(f"{Path(tiles_dir).name}/{{z}}/{{x}}/{{y}}.png").add_to(m)
+        return m
+
+    # Prepare data for heatmap - [latitude, longitude, weight]
+    points = heat_data(
+        location_counts['Latitude'].to_numpy(),
+        location_counts['Longitude'].to_numpy(),
+        location_counts['count'].to_numpy()
+    )
+
+    # Add heatmap layer
+    HeatDataLayer(
+        points,
+        min_opacity=0.3,
+        max_zoom=18,
+        radius=15,
+        blur=20,
+        gradient={
+            0.0: 'blue',
+            0.5: 'lime',
+            0.7: 'yellow',
+            1.0: 'red'
+        }
+    ).add_to(m)
+
+    return m
+
+
+def tiles_dir_for(output_path):
+    """Tile directory next to a map file: reports/heatmap_all.html -> reports/heatmap_all_tiles"""
+    output_path = Path(output_path)
+    return output_path.with_name(f"{output_path.stem}_tiles")
+
+
+def build_single_heatmap(tiles=False):
+    """The original one-shot build: Address Details.csv + India Post reference -> address_heatmap.html"""
+    print("Loading CSV files...")
+
+    # Load the address details
+    address_df = pd.read_csv('Address Details.csv')
+    print(f"Loaded {len(address_df)} address records")
+
+    # Load the pincode lat/long reference data
+    pincode_df = pd.read_csv('pincode_with_lat-long.csv', low_memory=False)
+    print(f"Loaded {len(pincode_df)} pincode records")
+
+    print("\nData Preview:")
+    print("\nAddress Details columns:", address_df.columns.tolist())
+    print("Address Details sample:")
+    print(address_df.head())
+
+    print("\nPincode Data columns:", pincode_df.columns.tolist())
+    print("Pincode Data sample:")
+    print(pincode_df.head())
+
+    # Clean the data
+    print("\nCleaning data...")
+    # Remove any leading/trailing whitespace and convert pincodes to integers
+    address_df['CPA_PIN_CODE'] = pd.to_numeric(address_df['CPA_PIN_CODE'], errors='coerce')
+    pincode_df['Pincode'] = pd.to_numeric(pincode_df['Pincode'], errors='coerce')
+
+    # Convert Latitude and Longitude to numeric (handle mixed types)
+    pincode_df['Latitude'] = pd.to_numeric(pincode_df['Latitude'], errors='coerce')
+    pincode_df['Longitude'] = pd.to_numeric(pincode_df['Longitude'], errors='coerce')
+
+    # Drop rows with missing pincodes
+    address_df = address_df.dropna(subset=['CPA_PIN_CODE'])
+    pincode_df = pincode_df.dropna(subset=['Pincode', 'Latitude', 'Longitude'])
+
+    print(f"After cleaning: {len(address_df)} address records, {len(pincode_df)} pincode records")
+
+    # Merge the dataframes
+    print("\nMerging data...")
+    merged_df = address_df.merge(
+        pincode_df[['Pincode', 'Latitude', 'Longitude', 'OfficeName', 'District', 'StateName']],
+        left_on='CPA_PIN_CODE',
+        right_on='Pincode',
+        how='left'
+    )
+
+    # Check merge success
+    print(f"Merged {len(merged_df)} records")
+    print(f"Records with valid coordinates: {merged_df[['Latitude', 'Longitude']].notna().all(axis=1).sum()}")
+
+    # Remove rows without coordinates
+    merged_df = merged_df.dropna(subset=['Latitude', 'Longitude'])
+    print(f"Final records with coordinates: {len(merged_df)}")
+
+    # Aggregate data - count addresses per location
+    print("\nAggregating data by location...")
+    location_counts = merged_df.groupby(['Latitude', 'Longitude']).size().reset_index(name='count')
+    print(f"Unique locations: {len(location_counts)}")
+    print(f"Total addresses mapped: {location_counts['count'].sum()}")
+
+    # Create the heatmap
+    print("\nCreating heatmap...")
+    m = create_heatmap_map(location_counts, tiles_dir=tiles_dir_for(OUTPUT_FILE) if tiles else None)
+
+    # Save the map
+    m.save(OUTPUT_FILE)
+    print(f"\nHeatmap saved to: {OUTPUT_FILE}")
+
+    # Print statistics
+    center_lat = location_counts['Latitude'].mean()
+    center_lon = location_counts['Longitude'].mean()
+    print("\nStatistics:")
+    print(f"- Total unique locations: {len(location_counts)}")
+    print(f"- Total addresses: {location_counts['count'].sum()}")
+    print(f"- Average addresses per location: {location_counts['count'].mean():.2f}")
+    print(f"- Max addresses at one location: {location_counts['count'].max()}")
+    print(f"- Map center: ({center_lat:.4f}, {center_lon:.4f})")
+
+    # Show top 10 locations
+    print("\nTop 10 locations by address count:")
+    top_locations = merged_df.groupby(['CPA_ADDR_CITY', 'CPA_PIN_CODE', 'Latitude', 'Longitude']).size().reset_index(name='count').sort_values('count', ascending=False).head(10)
+    for idx, row in top_locations.iterrows():
+        print(f"  {row['CPA_ADDR_CITY']}, PIN: {int(row['CPA_PIN_CODE'])} - {row['count']} addresses")
+
+    print(f"\nDone! Open '{OUTPUT_FILE}' in a web browser to view the heatmap.")
+
+
+def slugify(value):
+    """File-name-safe lower-case form of a filter value"""
+    return re.sub(r'[^a-z0-9]+', '-', str(value).lower()).strip('-') or 'blank'
+
+
+def batch_variants(location_cube, dimensions):
+    """
+    Every combination of 'all' and the observed values of each dimension.
+
+    Yields:
+        dict: Dimension column -> value (None means all values)
+    """
+    choices = [[None] + sorted(location_cube[column].dropna().unique().tolist()) for column in dimensions]
+    for values in itertools.product(*choices):
+        yield dict(zip(dimensions, values))
+
+
+def variant_counts(location_cube, filters):
+    """Counts per location for one variant, summed over the unfiltered dimensions"""
+    mask = pd.Series(True, index=location_cube.index)
+    for column, value in filters.items():
+        if value is not None:
+            mask &= location_cube[column] == value
+    return location_cube[mask].groupby(['Latitude', 'Longitude'])['count'].sum().reset_index()
+
+
+def variant_file_name(filters):
+    """e.g. heatmap_year-2024_state-karnataka.html (heatmap_all.html for no filters)"""
+    names = {column: name for name, column in BATCH_DIMENSIONS.items()}
+    parts = [f"{names[column]}-{slugify(value)}" for column, value in filters.items() if value is not None]
+    return f"heatmap_{'_'.join(parts) or 'all'}.html"
+
+
+def render_heatmap_file(location_counts, output_path, tiles=False):
+    """Worker: render one heatmap and write it (runs in a separate process)"""
+    tiles_dir = tiles_dir_for(output_path) if tiles else None
+    if tiles_dir is not None:
+        shutil.rmtree(tiles_dir, ignore_errors=True)
+    create_heatmap_map(location_counts, tiles_dir=tiles_dir).save(output_path)
+    return os.path.getsize(output_path)
+
+
+def build_batch(output_dir, dimension_names, source_file=ADDRESS_FILE, coords_file=PINCODE_COORDS_FILE,
+                workers=None, tiles=False):
+    """
+    Render one heatmap per combination of the chosen dimensions.
+
+    Args:
+        output_dir (str): Directory for the maps and manifest.json
+        dimension_names (list): Keys of BATCH_DIMENSIONS (e.g. ['year', 'state'])
+        source_file (str): Address or surgery extract
+        coords_file (str): Pincode coordinates CSV
+        workers (int): Render processes (default: one per CPU)
+        tiles (bool): Render the heat layers as PNG tiles next to each map
+
+    Returns:
+        dict: The manifest
+    """
+    start = time.time()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    dimensions = [BATCH_DIMENSIONS[name] for name in dimension_names]
+
+    # Load and merge once, then count per location and dimension value
+    print(f"Loading {source_file}...")
+    rows = build_address_data(source_file, coords_file)
+    missing = [column for column in dimensions if column not in rows.columns]
+    if missing:
+        raise ValueError(f"{source_file} has no {', '.join(missing)} column")
+    if 'BSM_MINOR_CD' in rows.columns:
+        # Same patient types as surgery_dashboard.py shows
+        rows['BSM_MINOR_CD'] = clean_patient_types(rows['BSM_MINOR_CD'])
+    location_cube = rows.groupby(['Latitude', 'Longitude', *dimensions], dropna=False, observed=True).size().reset_index(name='count')
+    print(f"Loaded {len(rows):,} rows into {len(location_cube):,} location cells")
+
+    # Slice every variant in this process; workers only get their own small count table
+    jobs = []
+    for filters in batch_variants(location_cube, dimensions):
+        location_counts = variant_counts(location_cube, filters)
+        if not location_counts.empty:
+            jobs.append((filters, location_counts, output_dir / variant_file_name(filters)))
+
+    print(f"Rendering {len(jobs)} maps with {workers or os.cpu_count()} workers...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        sizes = list(pool.map(render_heatmap_file, [job[1] for job in jobs], [job[2] for job in jobs],
+                              [tiles] * len(jobs)))
+
+    maps = []
+    for (filters, location_counts, path), size in zip(jobs, sizes):
+        maps.append({
+            'file': path.name,
+            'filters': {name: filters[column] for name, column in BATCH_DIMENSIONS.items() if column in filters},
+            'total': int(location_counts['count'].sum()),
+            'locations': len(location_counts),
+            'max_at_location': int(location_counts['count'].max()),
+            'bytes': size,
+            'tiles': tiles_dir_for(path).name if tiles else None
+        })
+
+    manifest = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'source': str(source_file),
+        'dimensions': dimension_names,
+        'seconds': round(time.time() - start, 2),
+        'maps': maps
     }
-).add_to(m)
-
-# Save the map
-output_file = 'address_heatmap.html'
-m.save(output_file)
-print(f"\nHeatmap saved to: {output_file}")
-
-# Print statistics
-print("\nStatistics:")
-print(f"- Total unique locations: {len(location_counts)}")
-print(f"- Total addresses: {location_counts['count'].sum()}")
-print(f"- Average addresses per location: {location_counts['count'].mean():.2f}")
-print(f"- Max addresses at one location: {location_counts['count'].max()}")
-print(f"- Map center: ({center_lat:.4f}, {center_lon:.4f})")
-
-# Show top 10 locations
-print("\nTop 10 locations by address count:")
-top_locations = merged_df.groupby(['CPA_ADDR_CITY', 'CPA_PIN_CODE', 'Latitude', 'Longitude']).size().reset_index(name='count').sort_values('count', ascending=False).head(10)
-for idx, row in top_locations.iterrows():
-    print(f"  {row['CPA_ADDR_CITY']}, PIN: {int(row['CPA_PIN_CODE'])} - {row['count']} addresses")
-
-print("\nDone! Open 'address_heatmap.html' in a web browser to view the heatmap.")
+
+    # Write the manifest last and atomically, so it only ever lists finished maps
+    tmp_path = output_dir / f"{MANIFEST_FILE}.tmp"
+    tmp_path.write_text(json.dumps(manifest, indent=2, default=str))
+    tmp_path.replace(output_dir / MANIFEST_FILE)
+
+    print(f"\n✅ Wrote {len(maps)} maps and {MANIFEST_FILE} to {output_dir} in {manifest['seconds']}s")
+    return manifest
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build static address heatmaps")
+    parser.add_argument('--batch', metavar='OUTPUT_DIR',
+                        help="Render a matrix of maps into OUTPUT_DIR instead of the single address_heatmap.html")
+    parser.add_argument('--by', action='append', choices=list(BATCH_DIMENSIONS), default=[],
+                        help="Batch dimension, repeatable (maps for every combination plus 'all')")
+    parser.add_argument('--source', default=ADDRESS_FILE, help="Extract to map in batch mode (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=None, help="Render processes (default: one per CPU)")
+    parser.add_argument('--tiles', action='store_true',
+                        help="Render the heat layer server-side as PNG tiles next to each map instead of Leaflet.heat")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.batch:
+        build_batch(args.batch, args.by, source_file=args.source, workers=args.workers, tiles=args.tiles)
+    else:
+        build_single_heatmap(tiles=args.tiles)
@@ -0,0 +1,270 @@
+"""
+Shared data loading for the heatmap dashboards.
+
+Cleans the raw address extract, merges it with the Google Maps pincode
+coordinates and keeps a columnar (Parquet) snapshot of the result, so a cold
+start only has to read the snapshot instead of re-parsing and re-merging the
+CSVs. Snapshots are keyed by a hash of every source file and rebuilt
+automatically when any source changes.
+
+Build the snapshot ahead of time with:
+    python data_loader.py
+
+Partitioned datasets
+--------------------
+merge_addresses.py can also write the cleaned rows as a Hive-style partitioned
+Parquet dataset (datasets/addresses/Year=2024/RRH_LOCATION_CD=BLR/...). Readers
+then pick partitions by their directory names alone, so a year filter reads only
+that year's files, and iter_partitions hands them out one partition at a time
+for callers that fold rows into an aggregate instead of holding them all.
+"""
+
+import hashlib
+from pathlib import Path
+from urllib.parse import unquote
+
+import pandas as pd
+
+# Source files
+ADDRESS_FILE = 'Combined_Address_Details.csv'
+PINCODE_COORDS_FILE = 'pincode_coordinates_google.csv'
+
+# Snapshot location (ignored by git, safe to delete at any time)
+SNAPSHOT_DIR = Path('.snapshots')
+
+# Source columns the dashboards use (RRH_MR_NUM and CPA_ADDR_AREA are never read)
+SOURCE_COLUMNS = ['CPA_PIN_CODE', 'CPA_ADDR_CITY', 'RRH_LOCATION_CD', 'RegistrationDate', 'BSM_MINOR_CD']
+
+# Compact dtypes of the merged rows kept in the dashboards' caches; the date is
+# only needed to derive Year and is dropped, as are columns not listed here
+ROW_SCHEMA = {
+    'CPA_PIN_CODE': 'int32',
+    'Year': 'Int16',  # Nullable: rows without a parsable date
+    'Latitude': 'float32',
+    'Longitude': 'float32',
+    'CPA_ADDR_CITY': 'category',
+    'StateName': 'category',
+    'RRH_LOCATION_CD': 'category',
+    'BSM_MINOR_CD': 'category'
+}
+
+# Partitioned datasets written by merge_addresses.py
+DATASET_DIR = Path('datasets')
+ADDRESS_DATASET = DATASET_DIR / 'addresses'
+PARTITION_COLUMNS = ['Year', 'RRH_LOCATION_CD']
+
+# Directory name pyarrow uses for a null partition value
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sources_key(sources):
+    """Combine the digests of all source files into one short snapshot key"""
+    combined = hashlib.sha256()
+    for source in sources:
+        combined.update(Path(source).name.encode())
+        combined.update(file_digest(source).encode())
+    return combined.hexdigest()[:16]
+
+
+def snapshot_path(name, sources):
+    """Path of the snapshot for the current contents of the source files"""
+    return SNAPSHOT_DIR / f"{name}-{sources_key(sources)}.parquet"
+
+
+def load_snapshot(path):
+    """Load a snapshot written by write_snapshot"""
+    return pd.read_parquet(path)
+
+
+def write_snapshot(path, df):
+    """Write a snapshot and drop stale snapshots of the same dataset"""
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True)
+
+    # Write to a temporary file first so a crash never leaves a partial snapshot
+    tmp_path = path.with_suffix('.tmp')
+    df.to_parquet(tmp_path, index=False)
+    tmp_path.replace(path)
+
+    # Remove snapshots built from older versions of the sources
+    name = path.stem.rsplit('-', 1)[0]
+    for stale in path.parent.glob(f"{name}-*.parquet"):
+        if stale != path:
+            stale.unlink()
+
+    return path
+
+
+def add_year(df):
+    """Parse the registration date and derive the registration year"""
+    df['RegistrationDate'] = pd.to_datetime(df['RegistrationDate'], format='%d/%m/%y', errors='coerce')
+    df['Year'] = df['RegistrationDate'].dt.year.astype('Int64')
+    return df
+
+
+def clean_patient_types(patient_types):
+    """Surgery patient types (BSM_MINOR_CD) as text, with missing ones as 'Unknown' and padding stripped"""
+    return patient_types.astype(object).fillna('Unknown').astype(str).str.strip()
+
+
+def merge_with_coordinates(df, pincode_coords):
+    """Clean pincodes, derive the registration year and attach coordinates"""
+    # Clean pincodes
+    df['CPA_PIN_CODE'] = pd.to_numeric(df['CPA_PIN_CODE'], errors='coerce')
+    df = df.dropna(subset=['CPA_PIN_CODE']).astype({'CPA_PIN_CODE': 'int64'})
+
+    return attach_coordinates(add_year(df), pincode_coords)
+
+
+def attach_coordinates(df, pincode_coords):
+    """Attach coordinates, city and state to rows with clean pincodes"""
+    # Merge with Google Maps coordinates (already clean and deduplicated, 1-to-1 mapping)
+    merged_df = df.merge(
+        pincode_coords[['pincode', 'latitude', 'longitude', 'city', 'state']],
+        left_on='CPA_PIN_CODE',
+        right_on='pincode',
+        how='left'
+    )
+
+    # Rename columns to match expected format
+    merged_df = merged_df.rename(columns={
+        'latitude': 'Latitude',
+        'longitude': 'Longitude',
+        'state': 'StateName'
+    })
+
+    # Use Google Maps city if available, otherwise fall back to address city
+    merged_df['CPA_ADDR_CITY'] = merged_df['city'].fillna(merged_df['CPA_ADDR_CITY'])
+    merged_df = merged_df.drop(columns=['pincode', 'city'])
+
+    # Drop rows without coordinates
+    merged_df = merged_df.dropna(subset=['Latitude', 'Longitude'])
+
+    return merged_df.reset_index(drop=True)
+
+
+def apply_schema(df):
+    """Keep the ROW_SCHEMA columns present in df, cast to their compact dtypes"""
+    columns = [column for column in ROW_SCHEMA if column in df.columns]
+    return df[columns].astype({column: ROW_SCHEMA[column] for column in columns})
+
+
+def read_source_csv(path):
+    """Read only the used columns of an address/surgery extract"""
+    return pd.read_csv(path, usecols=lambda column: column in SOURCE_COLUMNS)
+
+
+def memory_report(frames):
+    """Deep memory use of named frames, one row per frame"""
+    return pd.DataFrame([
+        {
+            'Frame': name,
+            'Rows': len(df),
+            'Columns': df.shape[1],
+            'Memory (MB)': round(df.memory_usage(deep=True).sum() / 1e6, 2)
+        }
+        for name, df in frames.items()
+    ])
+
+
+def build_address_data(address_file=ADDRESS_FILE, coords_file=PINCODE_COORDS_FILE):
+    """Build the merged address frame from the source CSVs, in the compact ROW_SCHEMA"""
+    address_df = read_source_csv(address_file)
+    pincode_coords = pd.read_csv(coords_file)
+    return apply_schema(merge_with_coordinates(address_df, pincode_coords))
+
+
+def load_address_data(address_file=ADDRESS_FILE, coords_file=PINCODE_COORDS_FILE):
+    """Load the merged address frame, from the snapshot when it is up to date"""
+    path = snapshot_path('addresses', [address_file, coords_file])
+    if path.exists():
+        # Snapshots written before the compact schema are cast on load
+        return apply_schema(load_snapshot(path))
+
+    # Sources changed (or first run) - rebuild from the CSVs and refresh the snapshot
+    df = build_address_data(address_file, coords_file)
+    write_snapshot(path, df)
+    return df
+
+
+def write_partitioned(chunk, dataset_dir):
+    """Append a chunk of rows with clean pincodes to a partitioned dataset (adds one file per partition)"""
+    add_year(chunk.copy()).to_parquet(dataset_dir, partition_cols=PARTITION_COLUMNS, index=False)
+
+
+def dataset_partitions(dataset_dir=ADDRESS_DATASET):
+    """
+    List the partitions of a dataset from its directory names, without reading any data.
+
+    Returns:
+        pd.DataFrame: Year (Int64, NA for rows without a date), RRH_LOCATION_CD and path
+    """
+    rows = []
+    for path in sorted(Path(dataset_dir).glob('Year=*/RRH_LOCATION_CD=*')):
+        year = unquote(path.parent.name.split('=', 1)[1])
+        location = unquote(path.name.split('=', 1)[1])
+        rows.append({
+            'Year': None if year == NULL_PARTITION else int(year),
+            'RRH_LOCATION_CD': None if location == NULL_PARTITION else location,
+            'path': path
+        })
+    return pd.DataFrame(rows, columns=['Year', 'RRH_LOCATION_CD', 'path']).astype({'Year': 'Int64'})
+
+
+def iter_partitions(dataset_dir=ADDRESS_DATASET, years=None, locations=None, coords_file=PINCODE_COORDS_FILE,
+                    extra_columns=()):
+    """
+    Yield the rows of the selected partitions one partition at a time, merged with coordinates.
+
+    Args:
+        dataset_dir (Path): Partitioned dataset written by merge_addresses.py
+        years (list): Years to read (None reads all, including rows without a date)
+        locations (list): RRH_LOCATION_CD values to read (None reads all)
+        coords_file (str): Pincode coordinates CSV
+        extra_columns (iterable): Columns to read besides pincode and city (e.g. 'BSM_MINOR_CD')
+
+    Yields:
+        pd.DataFrame: Rows in the compact ROW_SCHEMA
+    """
+    partitions = dataset_partitions(dataset_dir)
+    if years is not None:
+        partitions = partitions[partitions['Year'].isin(years)]
+    if locations is not None:
+        partitions = partitions[partitions['RRH_LOCATION_CD'].isin(locations)]
+
+    pincode_coords = pd.read_csv(coords_file)
+    for partition in partitions.itertuples(index=False):
+        # Partition values live in the directory names, not in the files
+        df = pd.read_parquet(partition.path, columns=['CPA_PIN_CODE', 'CPA_ADDR_CITY', *extra_columns])
+        df['Year'] = pd.array([partition.Year] * len(df), dtype='Int64')
+        df['RRH_LOCATION_CD'] = partition.RRH_LOCATION_CD
+        yield apply_schema(attach_coordinates(df, pincode_coords))
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Building address data snapshot")
+    print("=" * 60)
+
+    df = build_address_data()
+    path = write_snapshot(snapshot_path('addresses', [ADDRESS_FILE, PINCODE_COORDS_FILE]), df)
+
+    print(f"\n✅ Wrote {len(df):,} rows to {path}")
+    print(f"   Columns: {', '.join(df.columns)}")
+
+    # Memory of the compact frame against reading and merging every column as inferred
+    raw_df = merge_with_coordinates(pd.read_csv(ADDRESS_FILE), pd.read_csv(PINCODE_COORDS_FILE))
+    report = memory_report({'All columns, inferred dtypes': raw_df, 'Compact schema': df})
+    print("\nMemory report:")
+    print(report.to_string(index=False))
+    print(f"   {report['Memory (MB)'].iloc[0] / report['Memory (MB)'].iloc[1]:.1f}x smaller")
+    print("=" * 60)
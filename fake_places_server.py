@@ -0,0 +1,166 @@
+"""
+Local fake Google Places server for exercising the hospital fetchers offline.
+
+Serves the three Places endpoints fetch_eye_hospitals_comprehensive.py uses
+(nearby search, text search, place details) from a seeded set of synthetic
+hospitals around Bangalore: a dense core plus scattered suburbs, so the
+quadtree splits. Each request takes --latency seconds, and a next_page_token
+returns INVALID_REQUEST until it is 2 seconds old, like the real API.
+
+Usage:
+    python fake_places_server.py --port 8765 &
+    python fetch_eye_hospitals_comprehensive.py --base-url http://localhost:8765
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import radians, sin, cos, sqrt, atan2
+from urllib.parse import parse_qs, urlparse
+
+PAGE_SIZE = 20
+MAX_RESULTS = 60
+TOKEN_READY_AFTER = 2.0
+
+
+def make_places(n_places=800, seed=7):
+    """Synthetic hospitals: half in a dense central core, the rest spread over the metro area"""
+    rng = random.Random(seed)
+    places = {}
+    for i in range(n_places):
+        if i < n_places // 2:
+            lat, lon = rng.gauss(12.97, 0.03), rng.gauss(77.59, 0.03)
+        else:
+            lat, lon = rng.uniform(12.70, 13.25), rng.uniform(77.30, 77.90)
+        place_id = f"fake-{i:05d}"
+        places[place_id] = {
+            'place_id': place_id,
+            'name': f"Fake Eye Hospital {i}",
+            'geometry': {'location': {'lat': lat, 'lng': lon}},
+            'rating': round(rng.uniform(3.0, 5.0), 1),
+            'user_ratings_total': int(rng.lognormvariate(4.5, 1.2)),
+            'types': ['hospital', 'health', 'point_of_interest', 'establishment'],
+            'vicinity': f"{i} Fake Road, Bangalore"
+        }
+    return places
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+class FakePlaces:
+    """Search/details logic plus page-token and request bookkeeping"""
+
+    def __init__(self, places, latency=0.0):
+        self.places = places
+        self.latency = latency
+        self.requests = {'nearbysearch': 0, 'textsearch': 0, 'details': 0}
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def _page(self, matches):
+        """First page of a result list, with a token for the rest"""
+        matches = sorted(matches, key=lambda p: -p['user_ratings_total'])[:MAX_RESULTS]
+        return self._slice(matches, 0)
+
+    def _slice(self, matches, start):
+        body = {'status': 'OK' if matches else 'ZERO_RESULTS', 'results': matches[start:start + PAGE_SIZE]}
+        if start + PAGE_SIZE < len(matches):
+            token = uuid.uuid4().hex
+            with self._lock:
+                self._tokens[token] = (time.monotonic(), matches, start + PAGE_SIZE)
+            body['next_page_token'] = token
+        return body
+
+    def _from_token(self, token):
+        with self._lock:
+            entry = self._tokens.get(token)
+        if entry is None or time.monotonic() - entry[0] < TOKEN_READY_AFTER:
+            return {'status': 'INVALID_REQUEST', 'results': []}
+        _, matches, start = entry
+        return self._slice(matches, start)
+
+    def handle(self, endpoint, params):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        time.sleep(self.latency)
+
+        if 'pagetoken' in params:
+            return self._from_token(params['pagetoken'])
+
+        if endpoint == 'nearbysearch':
+            lat, lon = map(float, params['location'].split(','))
+            radius_km = float(params.get('radius', 50000)) / 1000
+            return self._page([
+                p for p in self.places.values()
+                if distance_km(lat, lon, p['geometry']['location']['lat'], p['geometry']['location']['lng']) <= radius_km
+            ])
+
+        if endpoint == 'textsearch':
+            return self._page(list(self.places.values()))
+
+        if endpoint == 'details':
+            place = self.places.get(params.get('placeid', params.get('place_id')))
+            if place is None:
+                return {'status': 'NOT_FOUND'}
+            return {'status': 'OK', 'result': dict(place, formatted_address=place['vicinity'])}
+
+        return {'status': 'INVALID_REQUEST'}
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/stats':
+                body = fake.requests
+            else:
+                # /maps/api/place/<endpoint>/json
+                endpoint = url.path.rstrip('/').split('/')[-2]
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                body = fake.handle(endpoint, params)
+
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=8765, latency=0.2, n_places=800):
+    """Start the fake server on a background thread and return it"""
+    fake = FakePlaces(make_places(n_places), latency=latency)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(fake))
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Google Places server")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds per request (default: 0.2)")
+    parser.add_argument('--places', type=int, default=800, help="Number of synthetic hospitals")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.places)
+    print(f"Fake Places server on http://127.0.0.1:{args.port} ({args.places} places, {args.latency}s latency)")
+    print(f"Request counts: http://127.0.0.1:{args.port}/stats")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,67 +1,312 @@
 import pandas as pd
-import googlemaps
-from dotenv import load_dotenv
+import argparse
+import json
 import os
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-# Load environment variables
-load_dotenv()
-GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
-
-# Initialize Google Maps client
-gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
+from maps_client import create_client, is_transient_error, network_rate_limiter
+from offline_geocoder import REFERENCE_FILE, is_country_centroid, load_offline_geocoder
+from rate_limit import TokenBucket, call_with_retry
 
 # Output cache file
 CACHE_FILE = 'pincode_coordinates_google.csv'
 
-def get_coordinates_for_pincode(pincode):
+# Append-only journal of results not yet compacted into CACHE_FILE
+JOURNAL_FILE = 'pincode_coordinates_google.journal.jsonl'
+
+# Pincodes the API had no result for, so later runs don't buy them again
+NOT_FOUND_FILE = 'pincode_coordinates_google.not_found.csv'
+
+# Concurrency defaults - the Geocoding API allows 50 requests/second, stay below it
+DEFAULT_WORKERS = 8
+DEFAULT_QPS = 40
+
+
+def geocode_pincode(client, pincode):
+    """
+    Geocode one Indian pincode with any client exposing googlemaps' geocode().
+
+    Returns the result dict, or None when the API has no result. Raises on
+    API/transport errors so callers can retry them.
+    """
+    # Query format: "Pincode XXXXXX, India"
+    geocode_result = client.geocode(f"Pincode {int(pincode)}, India")
+
+    if not geocode_result:
+        return None
+
+    location = geocode_result[0]['geometry']['location']
+    address_components = geocode_result[0]['address_components']
+
+    # Extract city/locality and state
+    city = None
+    state = None
+    for component in address_components:
+        if 'locality' in component['types']:
+            city = component['long_name']
+        elif 'administrative_area_level_1' in component['types']:
+            state = component['long_name']
+
+    return {
+        'pincode': int(pincode),
+        'latitude': location['lat'],
+        'longitude': location['lng'],
+        'city': city,
+        'state': state,
+        'formatted_address': geocode_result[0]['formatted_address']
+    }
+
+
+def geocode_with_retry(client, pincode, rate_limiter=None):
+    """Geocode one pincode, retrying transient errors; raises if it still fails"""
+    # Cached responses don't use up the budget when the client limits its own network requests
+    rate_limiter = network_rate_limiter(client, rate_limiter)
+
+    def attempt():
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        return geocode_pincode(client, pincode)
+
+    return call_with_retry(attempt, is_transient=is_transient_error)
+
+
+def get_coordinates_for_pincode(pincode, client=None, rate_limiter=None):
     """Fetch lat/long for a given Indian pincode using Google Maps Geocoding API"""
     try:
-        # Query format: "Pincode XXXXXX, India"
-        geocode_result = gmaps.geocode(f"Pincode {int(pincode)}, India")
-
-        if geocode_result:
-            location = geocode_result[0]['geometry']['location']
-            address_components = geocode_result[0]['address_components']
-
-            # Extract city/locality and state
-            city = None
-            state = None
-            for component in address_components:
-                if 'locality' in component['types']:
-                    city = component['long_name']
-                elif 'administrative_area_level_1' in component['types']:
-                    state = component['long_name']
-
-            return {
-                'pincode': int(pincode),
-                'latitude': location['lat'],
-                'longitude': location['lng'],
-                'city': city,
-                'state': state,
-                'formatted_address': geocode_result[0]['formatted_address']
-            }
-        else:
+        result = geocode_with_retry(client or create_client(), pincode, rate_limiter)
+        if result is None:
             print(f"  ❌ No results for pincode {int(pincode)}")
-            return None
+        return result
     except Exception as e:
         print(f"  ❌ Error fetching pincode {int(pincode)}: {e}")
         return None
 
-def main():
+
+class GeocodeJournal:
+    """
+    Append-only JSONL log of geocode outcomes, fsync'd after every entry.
+
+    Each paid API response is on disk as soon as it arrives, so an interrupted
+    run loses nothing and the next run resumes after the last journaled pincode.
+    Pincodes with no result are journaled too, and compaction keeps them in
+    NOT_FOUND_FILE, so they are not re-bought either.
+    Errors are not journaled and get retried on the next run. append() may be
+    called from several worker threads at once.
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = Path(path)
+        self._file = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the journal into {pincode: result or None}, skipping a torn last line"""
+        entries = {}
+        if not self.path.exists():
+            return entries
+
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Partial write from a crash
+                entries[entry['pincode']] = entry.get('result')
+        return entries
+
+    def append(self, pincode, result):
+        """Durably record the outcome for one pincode (result None = no result)"""
+        entry = {'pincode': int(pincode), 'status': 'ok' if result else 'not_found', 'result': result}
+        with self._lock:
+            if self._file is None:
+                # Start on a fresh line in case the last run died mid-write
+                needs_newline = self.path.exists() and self.path.stat().st_size > 0 and not self.path.read_bytes().endswith(b'\n')
+                self._file = open(self.path, 'a', encoding='utf-8')
+                if needs_newline:
+                    self._file.write('\n')
+
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove(self):
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+def load_not_found(not_found_file=NOT_FOUND_FILE):
+    """Pincodes earlier runs got no API result for"""
+    if not Path(not_found_file).exists():
+        return set()
+    return set(pd.read_csv(not_found_file)['pincode'].astype('int64').tolist())
+
+
+def compact_journal(journal, base_df=None, cache_file=CACHE_FILE, not_found=None, not_found_file=NOT_FOUND_FILE):
+    """
+    Fold the journaled results into the cache CSV and delete the journal.
+
+    Journaled results replace rows for the same pincode in base_df. Journaled
+    pincodes without a result are added to the not_found set and written to
+    not_found_file. Both files are written to a temporary file and renamed, so
+    they are never left half-written.
+
+    Returns:
+        pd.DataFrame: The compacted cache
+    """
+    entries = journal.load()
+    not_found = (set(not_found or ()) - entries.keys()) | {pincode for pincode, result in entries.items() if not result}
+    new_df = pd.DataFrame([result for result in entries.values() if result])
+
+    if base_df is not None and not base_df.empty:
+        base_df = base_df[~base_df['pincode'].isin(entries.keys())]
+        combined_df = pd.concat([base_df, new_df], ignore_index=True)
+    else:
+        combined_df = new_df
+
+    tmp_file = f"{cache_file}.tmp"
+    combined_df.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, cache_file)
+
+    if not_found:
+        tmp_file = f"{not_found_file}.tmp"
+        pd.DataFrame({'pincode': sorted(not_found)}).to_csv(tmp_file, index=False)
+        os.replace(tmp_file, not_found_file)
+    else:
+        Path(not_found_file).unlink(missing_ok=True)
+
+    journal.remove()
+    return combined_df
+
+
+def fetch_coordinates_concurrently(pincodes, client, workers=DEFAULT_WORKERS, qps=DEFAULT_QPS, journal=None):
+    """
+    Geocode pincodes on a thread pool under one shared requests-per-second budget.
+
+    Args:
+        pincodes (list): Pincodes to geocode
+        client: Google Maps client (or a stub with the same geocode() method)
+        workers (int): Number of concurrent requests
+        qps (float): Maximum requests per second across all workers
+        journal (GeocodeJournal): Optional journal that records each outcome as it arrives
+
+    Returns:
+        list: Result dicts for every pincode that resolved, in input order
+    """
+    rate_limiter = TokenBucket(qps)
+    results = {}
+
+    def fetch(pincode):
+        result = geocode_with_retry(client, pincode, rate_limiter)
+        # Persist in the worker, before anything else, so neither a crash nor
+        # Ctrl-C in the main thread can lose a paid result
+        if journal is not None:
+            journal.append(pincode, result)
+        return result
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(fetch, pincode): pincode for pincode in pincodes}
+
+        for i, future in enumerate(as_completed(futures), 1):
+            pincode = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[{i}/{len(pincodes)}] Pincode {int(pincode)} ❌ Error: {e}")
+                continue
+
+            if result:
+                results[pincode] = result
+                print(f"[{i}/{len(pincodes)}] Pincode {int(pincode)} ✅ {result['latitude']:.6f}, {result['longitude']:.6f}")
+            else:
+                print(f"[{i}/{len(pincodes)}] Pincode {int(pincode)} ❌ No results")
+    except KeyboardInterrupt:
+        # Drop the queued pincodes; requests already in flight finish and are journaled
+        print("\n⚠️  Interrupted - waiting for in-flight requests to be journaled")
+        executor.shutdown(cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    return [results[pincode] for pincode in pincodes if pincode in results]
+
+
+def resolve_offline(geocoder, pincodes, journal=None):
+    """
+    Resolve pincodes from the offline reference index, journaling every hit.
+
+    Returns:
+        tuple: (list of result dicts, list of pincodes left for the API)
+    """
+    results = []
+    unresolved = []
+    for pincode in pincodes:
+        result = geocoder.lookup(pincode)
+        if result is None:
+            unresolved.append(pincode)
+            continue
+
+        result.pop('match')
+        results.append(result)
+        if journal is not None:
+            journal.append(pincode, result)
+
+    return results, unresolved
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch pincode coordinates from the Google Maps Geocoding API")
+    parser.add_argument('--non-interactive', action='store_true',
+                        help="Never prompt; use --cache-mode and proceed without confirmation")
+    parser.add_argument('--cache-mode', choices=['use', 'append', 'refetch'], default='append',
+                        help="What to do with an existing cache file in non-interactive mode (default: append)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"Concurrent requests (default: {DEFAULT_WORKERS})")
+    parser.add_argument('--qps', type=float, default=DEFAULT_QPS,
+                        help=f"Maximum requests per second (default: {DEFAULT_QPS})")
+    parser.add_argument('--reference-file', default=REFERENCE_FILE,
+                        help=f"Pincode reference CSV for offline geocoding (default: {REFERENCE_FILE})")
+    parser.add_argument('--no-offline', action='store_true',
+                        help="Skip the offline reference lookup and send every pincode to the API")
+    return parser.parse_args(argv)
+
+
+def main(argv=None, client=None):
+    args = parse_args(argv)
+
     print("=" * 60)
     print("Google Maps Pincode Coordinate Fetcher")
     print("=" * 60)
 
+    # Results journaled by an interrupted run are already paid for
+    journal = GeocodeJournal()
+    journaled = journal.load()
+    if journaled:
+        print(f"\n♻️  Found {len(journaled)} journaled results from an interrupted run in '{JOURNAL_FILE}'")
+
     # Check if cache exists
     if Path(CACHE_FILE).exists():
         print(f"\n⚠️  Cache file '{CACHE_FILE}' already exists!")
-        response = input("Do you want to (U)se existing, (A)ppend new pincodes, or (R)efetch all? [U/A/R]: ").strip().upper()
+        if args.non_interactive:
+            response = args.cache_mode[0].upper()
+            print(f"   Non-interactive mode: {args.cache_mode}")
+        else:
+            response = input("Do you want to (U)se existing, (A)ppend new pincodes, or (R)efetch all? [U/A/R]: ").strip().upper()
 
         if response == 'U':
-            print(f"✅ Using existing cache file: {CACHE_FILE}")
             cached_df = pd.read_csv(CACHE_FILE)
+            if journaled:
+                # Don't leave paid results behind in the journal
+                cached_df = compact_journal(journal, cached_df, not_found=load_not_found())
+                print(f"   Compacted journaled results into {CACHE_FILE}")
+            print(f"✅ Using existing cache file: {CACHE_FILE}")
             print(f"   Found {len(cached_df)} cached pincodes")
             return
         elif response == 'A':
@@ -69,11 +314,16 @@ def main():
             cached_pincodes = set(cached_df['pincode'].values)
             print(f"   Found {len(cached_pincodes)} cached pincodes, will fetch new ones only")
         else:
+            cached_df = None
             cached_pincodes = set()
             print("   Will refetch all pincodes")
     else:
+        cached_df = None
         cached_pincodes = set()
 
+    # Pincodes the API had no result for are not bought again (unless refetching all)
+    not_found = load_not_found() if cached_df is not None else set()
+
     # Load address data from all CSV files
     print("\nLoading address data...")
 
@@ -96,11 +346,38 @@ def main():
     unique_pincodes = sorted(all_pincodes)
     print(f"\nTotal unique pincodes across all files: {len(unique_pincodes)}")
 
-    # Filter out already cached pincodes
-    pincodes_to_fetch = [p for p in unique_pincodes if p not in cached_pincodes]
+    # Filter out already cached and already journaled pincodes
+    pincodes_to_fetch = [p for p in unique_pincodes if p not in cached_pincodes and int(p) not in journaled]
+
+    # Resolve what the local pincode reference can before paying for any API calls
+    offline = None if args.no_offline else load_offline_geocoder(args.reference_file)
+    if offline is not None:
+        # Cached entries Google could only place at India's centroid get a (free) offline retry
+        retry_pincodes = []
+        if cached_df is not None:
+            at_centroid = is_country_centroid(cached_df['latitude'], cached_df['longitude'])
+            retry_pincodes = [p for p in cached_df.loc[at_centroid, 'pincode'] if int(p) not in journaled]
+
+        offline_results, pincodes_to_fetch = resolve_offline(offline, pincodes_to_fetch, journal)
+        retried_results, _ = resolve_offline(offline, retry_pincodes, journal)
+        print(f"\nOffline reference '{args.reference_file}': resolved {len(offline_results)} new pincodes, "
+              f"re-placed {len(retried_results)} cached India-centroid fallbacks")
+        journaled = journal.load()
+    elif not args.no_offline:
+        print(f"\nOffline reference '{args.reference_file}' not found, skipping offline geocoding")
+
+    # Offline lookups are free, so only the API skips the known misses
+    known_misses = [p for p in pincodes_to_fetch if int(p) in not_found]
+    if known_misses:
+        pincodes_to_fetch = [p for p in pincodes_to_fetch if int(p) not in not_found]
+        print(f"Skipping {len(known_misses)} pincodes the API had no result for before (see {NOT_FOUND_FILE})")
+
     print(f"Need to fetch {len(pincodes_to_fetch)} pincodes from Google Maps API")
 
     if len(pincodes_to_fetch) == 0:
+        if journaled:
+            combined_df = compact_journal(journal, cached_df, not_found=not_found)
+            print(f"\n✅ Compacted journaled results into {CACHE_FILE} ({len(combined_df)} pincodes)")
         print("\n✅ All pincodes already cached!")
         return
 
@@ -108,44 +385,35 @@ def main():
     print(f"   Google Maps API pricing: https://developers.google.com/maps/billing-and-pricing/pricing")
     print(f"   Geocoding API: $5 per 1000 requests (after free tier)")
 
-    confirm = input("\nProceed? [y/N]: ").strip().lower()
-    if confirm != 'y':
-        print("❌ Cancelled")
-        return
-
-    # Fetch coordinates
-    print("\nFetching coordinates from Google Maps...")
-    results = []
-
-    for i, pincode in enumerate(pincodes_to_fetch, 1):
-        print(f"[{i}/{len(pincodes_to_fetch)}] Fetching pincode {int(pincode)}...", end='')
-
-        result = get_coordinates_for_pincode(pincode)
-        if result:
-            results.append(result)
-            print(f" ✅ {result['latitude']:.6f}, {result['longitude']:.6f}")
-
-        # Rate limiting: Google Maps allows 50 requests/second, but let's be conservative
-        if i % 10 == 0:
-            time.sleep(1)  # Pause every 10 requests
+    if not args.non_interactive:
+        confirm = input("\nProceed? [y/N]: ").strip().lower()
+        if confirm != 'y':
+            print("❌ Cancelled")
+            return
 
-    # Combine with cached data if appending
-    if cached_pincodes:
-        cached_df = pd.read_csv(CACHE_FILE)
-        new_df = pd.DataFrame(results)
-        combined_df = pd.concat([cached_df, new_df], ignore_index=True)
-    else:
-        combined_df = pd.DataFrame(results)
+    # Fetch coordinates, journaling every outcome as it arrives
+    print(f"\nFetching coordinates from Google Maps ({args.workers} workers, max {args.qps:g} requests/s)...")
+    print(f"   Progress is journaled to {JOURNAL_FILE} - rerun to resume if interrupted")
+    try:
+        results = fetch_coordinates_concurrently(
+            pincodes_to_fetch,
+            client or create_client(),
+            workers=args.workers,
+            qps=args.qps,
+            journal=journal
+        )
+    finally:
+        journal.close()
 
-    # Save to cache
-    combined_df.to_csv(CACHE_FILE, index=False)
+    # Compact cached data + journal (offline hits, this run and any resumed one) into the cache file
+    combined_df = compact_journal(journal, cached_df, not_found=not_found)
     print(f"\n✅ Saved {len(results)} new coordinates to {CACHE_FILE}")
     print(f"   Total pincodes in cache: {len(combined_df)}")
 
     # Summary
     print("\n" + "=" * 60)
     print("Summary:")
-    print(f"  Total pincodes processed: {len(results)}")
+    print(f"  Total pincodes processed: {len(pincodes_to_fetch)}")
     print(f"  Successful: {len(results)}")
     print(f"  Cache file: {CACHE_FILE}")
     print("=" * 60)
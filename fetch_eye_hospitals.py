@@ -7,11 +7,12 @@ Fallback sample data is provided for demonstration purposes.
 """
 
 import os
-import googlemaps
 import pandas as pd
 from dotenv import load_dotenv
 import time
 
+from maps_client import create_client
+
 # Load environment variables
 load_dotenv()
 API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
@@ -158,7 +159,7 @@ def fetch_eye_hospitals_from_api(min_reviews=100):
     Returns:
         pd.DataFrame: DataFrame with hospital details or None if API fails
     """
-    gmaps = googlemaps.Client(key=API_KEY)
+    gmaps = create_client()
     hospitals = []
     next_page_token = None
     request_count = 0
@@ -1,58 +1,44 @@
 """
 Comprehensive Eye Hospital Fetcher for Bangalore
 Uses multiple strategies to ensure complete coverage:
-1. Grid-based searching (divide Bangalore into zones)
+1. Adaptive grid searching (quadtree cells split where results saturate)
 2. Multiple keyword variations
 3. Text Search API (when available)
 4. Deduplication and consolidation
 """
 
-import os
-import googlemaps
+import argparse
+import json
+from googlemaps.exceptions import ApiError
 import pandas as pd
-from dotenv import load_dotenv
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from math import radians, sin, cos, sqrt, atan2
+from pathlib import Path
 
-# Load environment variables
-load_dotenv()
-API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
-
-if not API_KEY:
-    raise ValueError("GOOGLE_MAPS_API_KEY not found in .env file")
-
-# Initialize Google Maps client
-gmaps = googlemaps.Client(key=API_KEY)
+from maps_client import create_client, is_transient_error, network_rate_limiter
+from rate_limit import TokenBucket, call_with_retry
 
 # Bangalore parameters
 BANGALORE_CENTER = (12.9716, 77.5946)
 SEARCH_RADIUS = 25000  # 25km radius for Bangalore metro area
 
-# Grid parameters - divide Bangalore into zones for comprehensive coverage
-GRID_POINTS = [
-    # Central Bangalore
-    (12.9716, 77.5946),  # Center
-    # North
-    (13.0500, 77.5946),
-    (13.1200, 77.5946),
-    # South
-    (12.8900, 77.5946),
-    (12.8100, 77.5946),
-    # East
-    (12.9716, 77.7000),
-    (12.9716, 77.8000),
-    # West
-    (12.9716, 77.4800),
-    (12.9716, 77.3800),
-    # Northeast
-    (13.0500, 77.7000),
-    # Northwest
-    (13.0500, 77.4800),
-    # Southeast
-    (12.8900, 77.7000),
-    # Southwest
-    (12.8900, 77.4800),
-]
+# Adaptive grid parameters - area covered by the quadtree search: (south, west, north, east)
+SEARCH_BOUNDS = (12.70, 77.30, 13.25, 77.90)
+
+# Nearby Search returns at most 3 pages of 20 results; a search that fills
+# them all is saturated and may be hiding more places, so its cell is split
+MAX_PAGES = 3
+PAGE_SIZE = 20
+
+# Text searches are limited to 2 pages per keyword
+TEXT_MAX_PAGES = 2
+
+# Deepest split (cell side halves per level: ~60km at 0, ~2km at 5)
+MAX_CELL_DEPTH = 5
+
+# Nearby Search radius limit in meters
+MAX_SEARCH_RADIUS = 50000
 
 # Multiple keywords to try
 KEYWORDS = [
@@ -66,6 +52,43 @@ KEYWORDS = [
     "cataract hospital",
 ]
 
+# Place details fetched per hospital (note: 'types' field not allowed in place details API)
+DETAILS_FIELDS = ['name', 'formatted_address', 'geometry', 'rating',
+                  'user_ratings_total', 'website', 'formatted_phone_number',
+                  'opening_hours']
+
+# Persistent place details cache - one JSON object per line, keyed by place_id
+DETAILS_CACHE_FILE = 'place_details_cache.jsonl'
+DETAILS_CACHE_MAX_AGE_DAYS = 30
+
+# Search streams and details calls run concurrently under one shared requests-per-second budget
+# (streams spend most of their time waiting on page tokens, so use more workers than cores)
+PLACES_WORKERS = 16
+PLACES_QPS = 10
+
+# A next_page_token only becomes valid ~2 seconds after it is issued (waited per stream)
+NEXT_PAGE_DELAY = 2.0
+
+
+def is_transient_page_error(error):
+    """Like is_transient_error, plus INVALID_REQUEST for a page token that isn't valid yet"""
+    return is_transient_error(error) or (isinstance(error, ApiError) and error.status == 'INVALID_REQUEST')
+
+
+def places_request(rate_limiter, func, *args, is_transient=is_transient_error, **kwargs):
+    """
+    One Places API call under the shared rate limit, retrying transient errors.
+
+    rate_limiter is None when the client applies the limit to its network
+    requests itself (see maps_client.network_rate_limiter).
+    """
+    def attempt():
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        return func(*args, **kwargs)
+
+    return call_with_retry(attempt, is_transient=is_transient)
+
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two points in kilometers"""
@@ -82,125 +105,349 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     return distance
 
 
-def fetch_hospitals_grid_search(min_reviews=100, search_radius=15000):
+class PlaceDetailsCache:
+    """
+    Place details keyed by place_id, persisted as an append-only JSONL file.
+
+    Entries older than max_age_days are ignored (and refetched), so ratings and
+    review counts don't go stale forever.
+    """
+
+    def __init__(self, path=DETAILS_CACHE_FILE, max_age_days=DETAILS_CACHE_MAX_AGE_DAYS):
+        self.path = Path(path)
+        self.max_age = max_age_days * 86400
+        self._entries = {}
+
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Partial write from an interrupted run
+                    self._entries[entry['place_id']] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, place_id):
+        """Cached details for a place, or None if missing or expired"""
+        entry = self._entries.get(place_id)
+        if entry is None or time.time() - entry['fetched_at'] > self.max_age:
+            return None
+        return entry['details']
+
+    def put(self, place_id, details):
+        entry = {'place_id': place_id, 'fetched_at': time.time(), 'details': details}
+        self._entries[place_id] = entry
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+
+
+def fetch_place_details(client, place_ids, rate_limiter, cache=None, workers=PLACES_WORKERS):
+    """
+    Fetch place details for many places, cache first, the rest in parallel.
+
+    Args:
+        client: Google Maps client (or a stub with the same place() method)
+        place_ids (list): Places to fetch details for
+        rate_limiter (TokenBucket): Shared Places requests-per-second budget (see places_request)
+        cache (PlaceDetailsCache): Persistent details cache (optional)
+        workers (int): Concurrent details requests
+
+    Returns:
+        tuple: (dict of place_id -> details, number of API requests sent over the network)
+    """
+    details = {}
+    to_fetch = []
+    for place_id in place_ids:
+        cached = cache.get(place_id) if cache is not None else None
+        if cached is not None:
+            details[place_id] = cached
+        else:
+            to_fetch.append(place_id)
+
+    print(f"Place details: {len(details)} cached, {len(to_fetch)} to fetch")
+    if not to_fetch:
+        return details, 0
+
+    requests_made = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(places_request, rate_limiter, client.place, place_id=place_id, fields=DETAILS_FIELDS): place_id
+            for place_id in to_fetch
+        }
+        for future in as_completed(futures):
+            place_id = futures[future]
+            try:
+                response = future.result()
+                details[place_id] = response['result']
+            except Exception as e:
+                print(f"  ! Error fetching details for {place_id}: {str(e)}")
+                continue
+
+            # Responses replayed from the client's response cache cost nothing
+            if not getattr(response, 'from_cache', False):
+                requests_made += 1
+            if cache is not None:
+                cache.put(place_id, details[place_id])
+
+    return details, requests_made
+
+
+def hospital_from_details(place_id, place_data, **extra):
+    """Hospital row from a place details result plus search metadata"""
+    return {
+        'name': place_data.get('name', 'N/A'),
+        'address': place_data.get('formatted_address', 'N/A'),
+        'latitude': place_data['geometry']['location']['lat'],
+        'longitude': place_data['geometry']['location']['lng'],
+        'rating': place_data.get('rating', None),
+        'review_count': place_data.get('user_ratings_total', 0),
+        'phone': place_data.get('formatted_phone_number', 'N/A'),
+        'website': place_data.get('website', 'N/A'),
+        'place_id': place_id,
+        **extra
+    }
+
+
+def hospitals_from_candidates(client, candidates, min_reviews, rate_limiter, details_cache=None, workers=PLACES_WORKERS):
     """
-    Search for eye hospitals using grid-based approach.
-    Divides Bangalore into zones to ensure comprehensive coverage.
+    Phase 2 of a search: fetch details for the candidates that passed the
+    nearby/text payload filter and build the hospital rows.
 
     Args:
+        client: Google Maps client
+        candidates (dict): place_id -> search metadata (zone, keyword, ...)
+        min_reviews (int): Minimum number of reviews (rechecked against the details)
+        rate_limiter (TokenBucket): Shared Places requests-per-second budget (see places_request)
+        details_cache (PlaceDetailsCache): Persistent details cache
+        workers (int): Concurrent details requests
+
+    Returns:
+        tuple: (dict of place_id -> hospital info, number of API requests sent over the network)
+    """
+    details, requests_made = fetch_place_details(client, list(candidates), rate_limiter, details_cache, workers)
+
+    hospitals = {}
+    for place_id, metadata in candidates.items():
+        place_data = details.get(place_id)
+        if place_data is None or place_data.get('user_ratings_total', 0) < min_reviews:
+            continue
+        try:
+            hospitals[place_id] = hospital_from_details(place_id, place_data, **metadata)
+        except KeyError:
+            continue
+
+    return hospitals, requests_made
+
+
+def split_cell(bounds):
+    """Split a (south, west, north, east) cell into its four quadrants"""
+    south, west, north, east = bounds
+    mid_lat = (south + north) / 2
+    mid_lon = (west + east) / 2
+    return [
+        (mid_lat, west, north, mid_lon),  # NW
+        (mid_lat, mid_lon, north, east),  # NE
+        (south, west, mid_lat, mid_lon),  # SW
+        (south, mid_lon, mid_lat, east),  # SE
+    ]
+
+
+def cell_search_circle(bounds):
+    """Center and radius (meters) of the smallest circle covering a cell"""
+    south, west, north, east = bounds
+    center = ((south + north) / 2, (west + east) / 2)
+    radius = haversine_distance(center[0], center[1], north, east) * 1000
+    return center, min(int(radius) + 1, MAX_SEARCH_RADIUS)
+
+
+def search_pages(rate_limiter, search, max_pages, **params):
+    """
+    Run one search stream (nearby or text) through all its pages.
+
+    Only this stream waits for its next_page_token to become valid; other
+    streams keep using the shared rate limit meanwhile.
+
+    Returns:
+        tuple: (list of places, number of requests sent over the network, saturated flag)
+    """
+    places = []
+    requests_made = 0
+    next_page_token = None
+
+    for page_num in range(1, max_pages + 1):
+        if next_page_token:
+            # A token from a cached page is already valid in the cache
+            if not getattr(result, 'from_cache', False):
+                time.sleep(NEXT_PAGE_DELAY)
+            result = places_request(rate_limiter, search, page_token=next_page_token,
+                                    is_transient=is_transient_page_error, **params)
+        else:
+            result = places_request(rate_limiter, search, **params)
+
+        if not getattr(result, 'from_cache', False):
+            requests_made += 1
+        places.extend(result.get('results', []))
+
+        # Check for next page
+        next_page_token = result.get('next_page_token')
+        if not next_page_token:
+            break
+
+    return places, requests_made, len(places) >= max_pages * PAGE_SIZE
+
+
+def search_nearby_pages(client, rate_limiter, location, radius, keyword):
+    """Nearby search for hospitals matching keyword within radius of location"""
+    return search_pages(rate_limiter, client.places_nearby, MAX_PAGES,
+                        location=location, radius=radius, keyword=keyword, type="hospital")
+
+
+def fetch_hospitals_grid_search(client, min_reviews=100, bounds=SEARCH_BOUNDS, max_depth=MAX_CELL_DEPTH,
+                                details_cache=None, rate_limiter=None, workers=PLACES_WORKERS):
+    """
+    Search for eye hospitals using an adaptive quadtree grid.
+
+    Each keyword starts with one cell covering the whole search area. A cell
+    whose search saturates (fills all 3 result pages) is split into four
+    quadrants that are searched in turn; a cell returning fewer results is
+    complete. Dense areas get small cells and sparse areas stay coarse, so
+    coverage is complete with far fewer calls than a fixed grid.
+
+    Runs in two phases: nearby searches collect candidates, filtered on the
+    review count in the search payload, then place details are fetched (in
+    parallel, cache first) only for the candidates that passed. Cell searches
+    of all keywords run concurrently under one shared rate limit.
+
+    Args:
+        client: Google Maps client (or a stub with places_nearby() and place())
         min_reviews (int): Minimum number of reviews
-        search_radius (int): Radius in meters for each grid point
+        bounds (tuple): (south, west, north, east) area to cover
+        max_depth (int): Deepest quadtree split
+        details_cache (PlaceDetailsCache): Persistent place details cache
+        rate_limiter (TokenBucket): Shared Places requests-per-second budget
+        workers (int): Concurrent search streams / details requests
 
     Returns:
         pd.DataFrame: Hospital data with deduplication
     """
-    all_hospitals = {}  # Use dict with place_id as key for deduplication
+    rate_limiter = rate_limiter or TokenBucket(PLACES_QPS)
+    request_limiter = network_rate_limiter(client, rate_limiter)  # Cache hits are not throttled
+    candidates = {}  # place_id -> search metadata, for places passing the review filter
     total_requests = 0
-    zones_searched = 0
+    below_min_reviews = set()
+    cell_report = []
 
     print("\n" + "="*70)
-    print("GRID-BASED SEARCH FOR EYE HOSPITALS")
+    print("ADAPTIVE GRID SEARCH FOR EYE HOSPITALS")
     print("="*70)
-    print(f"Search Strategy: Dividing Bangalore into {len(GRID_POINTS)} zones")
-    print(f"Radius per zone: {search_radius}m")
+    print(f"Search Strategy: Quadtree over {bounds}, split on {MAX_PAGES * PAGE_SIZE}-result saturation")
+    print(f"Maximum depth: {max_depth}")
     print(f"Minimum reviews: {min_reviews}")
     print(f"Keywords to try: {len(KEYWORDS)}")
+    print(f"Concurrency: {workers} streams, max {rate_limiter.rate:g} requests/s")
     print("="*70 + "\n")
 
-    for zone_idx, (lat, lon) in enumerate(GRID_POINTS, 1):
-        print(f"\n[Zone {zone_idx}/{len(GRID_POINTS)}] Searching around ({lat:.4f}, {lon:.4f})")
-        zone_hospitals = 0
+    # Phase 1: nearby searches - the payload already has user_ratings_total, filter on it
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit(keyword, cell_id, cell_bounds, depth):
+            location, radius = cell_search_circle(cell_bounds)
+            future = executor.submit(search_nearby_pages, client, request_limiter, location, radius, keyword)
+            pending[future] = (keyword, cell_id, cell_bounds, depth, radius)
 
+        # One stream per (keyword, cell); results are merged here, on one thread
+        pending = {}
         for keyword in KEYWORDS:
-            try:
-                next_page_token = None
-                page_num = 0
-
-                while True:
-                    page_num += 1
-
-                    # Search using Nearby Search API
-                    places_result = gmaps.places_nearby(
-                        location=(lat, lon),
-                        radius=search_radius,
-                        keyword=keyword,
-                        type="hospital",
-                        page_token=next_page_token
-                    )
-
-                    total_requests += 1
-
-                    if not places_result.get('results'):
-                        break
-
-                    # Process results
-                    for place in places_result['results']:
-                        try:
-                            place_id = place['place_id']
-
-                            # Skip if already found
-                            if place_id in all_hospitals:
-                                continue
-
-                            # Get detailed place info
-                            details = gmaps.place(
-                                place_id=place_id,
-                                fields=['name', 'formatted_address', 'geometry', 'rating',
-                                       'user_ratings_total', 'website', 'formatted_phone_number',
-                                       'opening_hours']
-                            )
-
-                            total_requests += 1
-
-                            place_data = details['result']
-                            review_count = place_data.get('user_ratings_total', 0)
-
-                            # Filter by minimum reviews
-                            if review_count >= min_reviews:
-                                hospital_info = {
-                                    'name': place_data.get('name', 'N/A'),
-                                    'address': place_data.get('formatted_address', 'N/A'),
-                                    'latitude': place_data['geometry']['location']['lat'],
-                                    'longitude': place_data['geometry']['location']['lng'],
-                                    'rating': place_data.get('rating', None),
-                                    'review_count': review_count,
-                                    'phone': place_data.get('formatted_phone_number', 'N/A'),
-                                    'website': place_data.get('website', 'N/A'),
-                                    'place_id': place_id,
-                                    'types': place_data.get('types', []),
-                                    'zone': zone_idx,
-                                    'keyword_found': keyword
-                                }
-
-                                all_hospitals[place_id] = hospital_info
-                                zone_hospitals += 1
-
-                            # Rate limiting
-                            if total_requests % 10 == 0:
-                                time.sleep(1)
-
-                        except Exception as e:
-                            continue
-
-                    # Check for next page
-                    next_page_token = places_result.get('next_page_token')
-                    if not next_page_token or page_num >= 3:  # Max 3 pages (60 results)
-                        break
-
-                    time.sleep(1)
-
-            except Exception as e:
-                continue
-
-        zones_searched += 1
-        if zone_hospitals > 0:
-            print(f"  ✓ Found {zone_hospitals} new hospitals in this zone")
-
-        # Rate limiting between zones
-        time.sleep(0.5)
-
-    print(f"\n✓ Grid search complete: {zones_searched} zones, {len(all_hospitals)} unique hospitals")
-    print(f"Total API requests: {total_requests}\n")
+            submit(keyword, '0', bounds, 0)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                keyword, cell_id, cell_bounds, depth, radius = pending.pop(future)
+
+                try:
+                    places, requests_made, saturated = future.result()
+                except Exception as e:
+                    print(f"  ! [{keyword}] Cell {cell_id}: {str(e)}")
+                    continue
+
+                total_requests += requests_made
+                new_hospitals = 0
+
+                for place in places:
+                    place_id = place.get('place_id')
+
+                    # Skip if already found
+                    if place_id is None or place_id in candidates:
+                        continue
+
+                    # Filter by minimum reviews before paying for details
+                    if place.get('user_ratings_total', 0) < min_reviews:
+                        below_min_reviews.add(place_id)
+                        continue
+
+                    candidates[place_id] = {
+                        'types': place.get('types', []),
+                        'zone': cell_id,
+                        'keyword_found': keyword
+                    }
+                    new_hospitals += 1
+
+                split = saturated and depth < max_depth
+                cell_report.append({
+                    'keyword': keyword,
+                    'cell': cell_id,
+                    'depth': depth,
+                    'radius_m': radius,
+                    'requests': requests_made,
+                    'results': len(places),
+                    'new_hospitals': new_hospitals,
+                    'saturated': saturated,
+                    'split': split
+                })
+                if split:
+                    note = ' -> split'
+                elif saturated:
+                    note = ' -> still saturated at max depth'
+                else:
+                    note = ''
+                print(f"  [{keyword}] Cell {cell_id:<8} r={radius / 1000:5.1f}km  {requests_made} requests, "
+                      f"{len(places):2d} results, {new_hospitals} new{note}")
+
+                if split:
+                    for quadrant, child in enumerate(split_cell(cell_bounds)):
+                        submit(keyword, f"{cell_id}{quadrant}", child, depth + 1)
+
+    report_df = pd.DataFrame(cell_report)
+    if not report_df.empty:
+        print("\nRequests per cell depth:")
+        by_depth = report_df.groupby('depth').agg(cells=('cell', 'size'), requests=('requests', 'sum'),
+                                                  new_hospitals=('new_hospitals', 'sum'))
+        print(by_depth.to_string())
+
+        # Cells that could not be split further may still hide places beyond their 3 pages
+        truncated = report_df[report_df['saturated'] & ~report_df['split']].sort_values(['keyword', 'cell'])
+        if truncated.empty:
+            print(f"\nNo cell saturated at maximum depth {max_depth}: coverage is complete")
+        else:
+            print(f"\n⚠️  {len(truncated)} cells still saturated at maximum depth {max_depth} "
+                  f"(coverage there may be incomplete):")
+            for keyword, cell_id in zip(truncated['keyword'], truncated['cell']):
+                print(f"  [{keyword}] Cell {cell_id}")
+
+    print(f"\nNearby search: {len(candidates)} candidates, "
+          f"{len(below_min_reviews - candidates.keys())} skipped below {min_reviews} reviews")
+
+    # Phase 2: details only for the survivors
+    all_hospitals, details_requests = hospitals_from_candidates(
+        client, candidates, min_reviews, request_limiter, details_cache, workers
+    )
+    total_requests += details_requests
+
+    print(f"\n✓ Grid search complete: {len(cell_report)} cells, {len(all_hospitals)} unique hospitals")
+    print(f"Total API requests: {total_requests} ({details_requests} place details)\n")
 
     if all_hospitals:
         df = pd.DataFrame(list(all_hospitals.values()))
@@ -210,18 +457,28 @@ def fetch_hospitals_grid_search(min_reviews=100, search_radius=15000):
         return pd.DataFrame()
 
 
-def fetch_hospitals_text_search(min_reviews=100):
+def fetch_hospitals_text_search(client, min_reviews=100, details_cache=None, rate_limiter=None, workers=PLACES_WORKERS):
     """
     Alternative: Use Text Search API (typically returns more results)
     Note: Text Search returns different result set, complementary to Nearby Search
 
+    Like the grid search, filters on the search payload first and fetches
+    place details only for the places that pass. Keywords are searched
+    concurrently under one shared rate limit.
+
     Args:
+        client: Google Maps client (or a stub with places() and place())
         min_reviews (int): Minimum number of reviews
+        details_cache (PlaceDetailsCache): Persistent place details cache
+        rate_limiter (TokenBucket): Shared Places requests-per-second budget
+        workers (int): Concurrent search streams / details requests
 
     Returns:
         pd.DataFrame: Hospital data
     """
-    all_hospitals = {}
+    rate_limiter = rate_limiter or TokenBucket(PLACES_QPS)
+    request_limiter = network_rate_limiter(client, rate_limiter)  # Cache hits are not throttled
+    candidates = {}
     total_requests = 0
 
     print("\n" + "="*70)
@@ -230,102 +487,63 @@ def fetch_hospitals_text_search(min_reviews=100):
     print(f"Minimum reviews: {min_reviews}")
     print("="*70 + "\n")
 
-    try:
-        for keyword_idx, keyword in enumerate(KEYWORDS, 1):
-            print(f"[{keyword_idx}/{len(KEYWORDS)}] Searching for '{keyword}' in Bangalore...")
+    # Text Search API - can return more results; one stream per keyword
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(search_pages, request_limiter, client.places, TEXT_MAX_PAGES, query=f"{keyword} Bangalore"): keyword
+            for keyword in KEYWORDS
+        }
 
+        for future in as_completed(futures):
+            keyword = futures[future]
             try:
-                next_page_token = None
-                page_num = 0
-                keyword_results = 0
-
-                while True:
-                    page_num += 1
-
-                    # Text Search API - can return more results
-                    search_result = gmaps.places_text(
-                        query=f"{keyword} Bangalore",
-                        page_token=next_page_token
-                    )
-
-                    total_requests += 1
-
-                    if not search_result.get('results'):
-                        break
-
-                    for place in search_result['results']:
-                        try:
-                            # Filter by Bangalore location
-                            location = place.get('geometry', {}).get('location', {})
-                            lat, lon = location.get('lat'), location.get('lng')
-
-                            # Check if within Bangalore bounds (rough)
-                            distance = haversine_distance(
-                                BANGALORE_CENTER[0], BANGALORE_CENTER[1], lat, lon
-                            )
-
-                            if distance > 50:  # More than 50km away
-                                continue
-
-                            place_id = place['place_id']
+                places, requests_made, _ = future.result()
+            except Exception as e:
+                print(f"  ! Error searching for '{keyword}': {str(e)}")
+                continue
 
-                            if place_id in all_hospitals:
-                                continue
+            total_requests += requests_made
+            keyword_results = 0
 
-                            # Get detailed info (note: 'types' field not allowed in place details API)
-                            details = gmaps.place(
-                                place_id=place_id,
-                                fields=['name', 'formatted_address', 'geometry', 'rating',
-                                       'user_ratings_total', 'website', 'formatted_phone_number',
-                                       'opening_hours']
-                            )
+            for place in places:
+                try:
+                    # Filter by Bangalore location
+                    location = place.get('geometry', {}).get('location', {})
+                    lat, lon = location.get('lat'), location.get('lng')
 
-                            total_requests += 1
+                    # Check if within Bangalore bounds (rough)
+                    distance = haversine_distance(
+                        BANGALORE_CENTER[0], BANGALORE_CENTER[1], lat, lon
+                    )
 
-                            place_data = details['result']
-                            review_count = place_data.get('user_ratings_total', 0)
+                    if distance > 50:  # More than 50km away
+                        continue
 
-                            if review_count >= min_reviews:
-                                hospital_info = {
-                                    'name': place_data.get('name', 'N/A'),
-                                    'address': place_data.get('formatted_address', 'N/A'),
-                                    'latitude': place_data['geometry']['location']['lat'],
-                                    'longitude': place_data['geometry']['location']['lng'],
-                                    'rating': place_data.get('rating', None),
-                                    'review_count': review_count,
-                                    'phone': place_data.get('formatted_phone_number', 'N/A'),
-                                    'website': place_data.get('website', 'N/A'),
-                                    'place_id': place_id,
-                                    'search_method': 'text_search'
-                                }
+                    place_id = place['place_id']
 
-                                all_hospitals[place_id] = hospital_info
-                                keyword_results += 1
+                    if place_id in candidates:
+                        continue
 
-                            if total_requests % 10 == 0:
-                                time.sleep(1)
+                    # Filter by minimum reviews before paying for details
+                    if place.get('user_ratings_total', 0) < min_reviews:
+                        continue
 
-                        except Exception as e:
-                            continue
+                    candidates[place_id] = {'search_method': 'text_search'}
+                    keyword_results += 1
 
-                    next_page_token = search_result.get('next_page_token')
-                    if not next_page_token or page_num >= 2:
-                        break
+                except Exception as e:
+                    continue
 
-                    time.sleep(1)
+            print(f"  ✓ Found {keyword_results} hospitals for '{keyword}' ({requests_made} requests)")
 
-                if keyword_results > 0:
-                    print(f"  ✓ Found {keyword_results} hospitals for '{keyword}'")
-
-            except Exception as e:
-                print(f"  ! Error searching for '{keyword}': {str(e)}")
-                continue
-
-    except Exception as e:
-        print(f"Text search error: {str(e)}")
+    # Phase 2: details only for the survivors
+    all_hospitals, details_requests = hospitals_from_candidates(
+        client, candidates, min_reviews, request_limiter, details_cache, workers
+    )
+    total_requests += details_requests
 
     print(f"\n✓ Text search complete: {len(all_hospitals)} unique hospitals")
-    print(f"Total API requests: {total_requests}\n")
+    print(f"Total API requests: {total_requests} ({details_requests} place details)\n")
 
     if all_hospitals:
         df = pd.DataFrame(list(all_hospitals.values()))
@@ -392,30 +610,52 @@ def save_hospitals_to_csv(df, filename='eye_hospitals_bangalore_comprehensive.cs
         return None
 
 
-if __name__ == "__main__":
-    import sys
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Comprehensive eye hospital search for Bangalore")
+    parser.add_argument('--grid-only', action='store_true', help="Only run the grid (nearby) search")
+    parser.add_argument('--text-only', action='store_true', help="Only run the text search")
+    parser.add_argument('--workers', type=int, default=PLACES_WORKERS,
+                        help=f"Concurrent search streams / details requests (default: {PLACES_WORKERS})")
+    parser.add_argument('--qps', type=float, default=PLACES_QPS,
+                        help=f"Maximum Places requests per second across all streams (default: {PLACES_QPS})")
+    parser.add_argument('--base-url', default=None,
+                        help="Send requests to another server, e.g. http://localhost:8765 for fake_places_server.py")
+    return parser.parse_args(argv)
+
+
+def main(argv=None, client=None):
+    args = parse_args(argv)
+    use_grid_only = args.grid_only
+    use_text_only = args.text_only
 
-    # Check command line arguments
-    use_grid_only = '--grid-only' in sys.argv
-    use_text_only = '--text-only' in sys.argv
+    client = client or create_client(args.base_url)
+
+    # One budget shared by every search stream and details request
+    rate_limiter = TokenBucket(args.qps)
 
     print("\n🔍 COMPREHENSIVE EYE HOSPITAL SEARCH FOR BANGALORE")
     print("=" * 70)
 
     all_results = []
 
+    # Details already fetched by earlier runs are reused instead of re-requested
+    details_cache = PlaceDetailsCache()
+    print(f"Place details cache: {len(details_cache)} places in {DETAILS_CACHE_FILE}")
+
     # Grid-based search (best for local exhaustive coverage)
     if not use_text_only:
         print("\nPhase 1: Grid-Based Search")
         print("-" * 70)
-        grid_hospitals = fetch_hospitals_grid_search(min_reviews=100, search_radius=15000)
+        grid_hospitals = fetch_hospitals_grid_search(client, min_reviews=100, details_cache=details_cache,
+                                                     rate_limiter=rate_limiter, workers=args.workers)
         all_results.append(grid_hospitals)
 
     # Text search (good for finding additional results)
     if not use_grid_only:
         print("\nPhase 2: Text Search")
         print("-" * 70)
-        text_hospitals = fetch_hospitals_text_search(min_reviews=100)
+        text_hospitals = fetch_hospitals_text_search(client, min_reviews=100, details_cache=details_cache,
+                                                     rate_limiter=rate_limiter, workers=args.workers)
         all_results.append(text_hospitals)
 
     # Combine results
@@ -443,3 +683,7 @@ if __name__ == "__main__":
         print("No hospitals found matching criteria")
 
     print(f"\nSearch Method Used: {search_method}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Server-rendered heatmap tiles.
+
+The HeatMap plugin (Leaflet.heat) sends every point to the browser and
+recomputes the density on every pan and zoom. HeatTileRenderer does that work
+once in NumPy and cuts the result into 256px PNG tiles on the standard XYZ
+(Web Mercator) grid. The browser then only loads images, so its cost no longer
+depends on the number of points.
+
+Each zoom level is drawn with Leaflet.heat's stamping and colouring:
+- Points are merged into cells of radius/2 pixels, placed at their weighted centre.
+- Each cell stamps a disc of the given radius, blurred by `blur`.
+- A cell's strength is its weight / the largest cell weight, but at least min_opacity.
+- Stamps are alpha-composited and the alpha is coloured through the same gradient.
+The strength differs from Leaflet.heat's, which scales weights by
+1/2^(maxZoom - zoom) against a fixed max. Here each zoom level is normalized
+to its own largest cell instead, so the hottest cell is full strength at every
+zoom. The largest cell is taken over the whole zoom level, not per tile, so
+neighbouring tiles join without seams.
+
+Usage:
+    renderer = HeatTileRenderer(lat, lon, counts)
+    renderer.write_tiles('tiles/')                  # tiles/{z}/{x}/{y}.png
+    heat_tile_layer('tiles/{z}/{x}/{y}.png').add_to(m)
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import folium
+import numpy as np
+from PIL import Image, ImageColor
+
+# Same look as the HeatMap layers in the dashboards
+HEAT_RADIUS = 15
+HEAT_BLUR = 20
+HEAT_MIN_OPACITY = 0.3
+HEAT_GRADIENT = {
+    0.0: 'blue',
+    0.5: 'lime',
+    0.7: 'yellow',
+    1.0: 'red'
+}
+
+TILE_SIZE = 256
+
+# Zoom levels rendered; Leaflet scales the MAX_ZOOM tiles up beyond that
+MIN_ZOOM = 0
+MAX_ZOOM = 11
+
+# Stamp strengths are rounded to this many levels, so each level is a single convolution
+STRENGTH_LEVELS = 16
+
+# Tiles reached by fewer cells add each stamp directly instead of convolving
+DIRECT_STAMP_LIMIT = 400
+
+# zlib level for tile PNGs: 1 encodes ~2.5x faster than the default 6 for ~1.6x larger tiles
+PNG_COMPRESS_LEVEL = 1
+
+# Tiles for the dashboards, served by Streamlit at /app/static/ (see .streamlit/config.toml)
+STATIC_TILE_DIR = Path(__file__).parent / 'static' / 'heat_tiles'
+STATIC_TILE_URL = '/app/static/heat_tiles'
+
+# Tile sets kept in STATIC_TILE_DIR; the least recently used beyond this are deleted
+STATIC_TILE_SETS = 32
+
+# Temporary render directories older than this (seconds) are left over from a crash
+STALE_RENDER_AGE = 3600
+
+
+def mercator_pixels(lat, lon, zoom):
+    """Global Web Mercator pixel coordinates at a zoom level"""
+    world = TILE_SIZE * 2 ** zoom
+    lat = np.radians(np.clip(np.asarray(lat, dtype='float64'), -85.0511, 85.0511))
+    x = (np.asarray(lon, dtype='float64') + 180) / 360 * world
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * world
+    return x, y
+
+
+def gradient_lut(gradient):
+    """256 RGB colours for alpha 0-255, interpolated between the gradient stops"""
+    stops = sorted(gradient.items())
+    positions = [position for position, _ in stops]
+    colors = np.array([ImageColor.getrgb(color)[:3] for _, color in stops], dtype='float64')
+    ramp = np.linspace(0, 1, 256)
+    return np.column_stack([np.interp(ramp, positions, colors[:, channel]) for channel in range(3)]).round().astype('uint8')
+
+
+def stamp_kernel(radius, blur):
+    """A disc of the given radius blurred by `blur` (as a canvas shadowBlur), peak 1"""
+    extent = radius + blur
+    offsets = np.arange(-extent, extent + 1)
+    disc = (offsets[:, None] ** 2 + offsets[None, :] ** 2 <= radius ** 2).astype('float64')
+
+    sigma = max(blur / 2, 1e-6)
+    gaussian = np.exp(-offsets ** 2 / (2 * sigma ** 2))
+    gaussian /= gaussian.sum()
+    blurred = np.apply_along_axis(np.convolve, 0, disc, gaussian, mode='same')
+    blurred = np.apply_along_axis(np.convolve, 1, blurred, gaussian, mode='same')
+    return blurred / blurred.max()
+
+
+class HeatTileRenderer:
+    """
+    Render a weighted point set as heatmap PNG tiles.
+
+    Args:
+        lat, lon (array-like): Point coordinates in degrees
+        weights (array-like): Weight per point (default 1 each)
+        radius, blur, min_opacity, gradient: As for folium's HeatMap
+    """
+
+    def __init__(self, lat, lon, weights=None, radius=HEAT_RADIUS, blur=HEAT_BLUR,
+                 min_opacity=HEAT_MIN_OPACITY, gradient=HEAT_GRADIENT):
+        lat = np.asarray(lat, dtype='float64')
+        lon = np.asarray(lon, dtype='float64')
+        weights = np.ones(len(lat)) if weights is None else np.asarray(weights, dtype='float64')
+        valid = np.isfinite(lat) & np.isfinite(lon) & np.isfinite(weights) & (weights > 0)
+        self.lat, self.lon, self.weights = lat[valid], lon[valid], weights[valid]
+
+        self.radius = radius
+        self.blur = blur
+        self.min_opacity = min_opacity
+        self.margin = radius + blur
+        self.cell_size = max(radius / 2, 1)
+        self.lut = gradient_lut(gradient)
+
+        # Per strength level: FFT of log(1 - level * kernel) on the padded tile grid
+        size = TILE_SIZE + 2 * self.margin
+        self._grid_shape = (size + 2 * self.margin, size + 2 * self.margin)
+        kernel = stamp_kernel(radius, blur)
+        self.levels = np.linspace(min_opacity, 1, STRENGTH_LEVELS)
+        self._log_kernels = [np.log1p(-np.minimum(level * kernel, 1 - 1e-6)) for level in self.levels]
+        self._kernel_ffts = [np.fft.rfft2(log_kernel, self._grid_shape) for log_kernel in self._log_kernels]
+        self._zooms = {}
+
+    def cells(self, zoom):
+        """
+        The points of one zoom level merged into radius/2 cells.
+
+        Returns:
+            tuple: (x, y, level) per cell - pixel position and strength level index
+        """
+        if zoom not in self._zooms:
+            x, y = mercator_pixels(self.lat, self.lon, zoom)
+            cell_keys = np.floor(x / self.cell_size).astype('int64') * (2 ** 40) + np.floor(y / self.cell_size).astype('int64')
+            _, inverse = np.unique(cell_keys, return_inverse=True)
+            total = np.bincount(inverse, weights=self.weights)
+            cell_x = np.bincount(inverse, weights=self.weights * x) / total
+            cell_y = np.bincount(inverse, weights=self.weights * y) / total
+
+            strength = np.clip(total / total.max(), self.min_opacity, 1) if len(total) else total
+            level = np.abs(strength[:, None] - self.levels[None, :]).argmin(axis=1)
+            self._zooms[zoom] = (np.round(cell_x).astype('int64'), np.round(cell_y).astype('int64'), level)
+        return self._zooms[zoom]
+
+    def tiles(self, zoom):
+        """
+        Tiles touched by any cell's stamp at one zoom level.
+
+        Returns:
+            dict: (x, y) tile -> indices of the cells that reach it
+        """
+        x, y, _ = self.cells(zoom)
+        n_tiles = 2 ** zoom
+        pairs = []
+        for dx in (-self.margin, self.margin):
+            for dy in (-self.margin, self.margin):
+                tile_x = np.floor((x + dx) / TILE_SIZE).astype('int64')
+                tile_y = np.floor((y + dy) / TILE_SIZE).astype('int64')
+                inside = (tile_x >= 0) & (tile_x < n_tiles) & (tile_y >= 0) & (tile_y < n_tiles)
+                pairs.append(np.column_stack([tile_x, tile_y, np.arange(len(x))])[inside])
+
+        pairs = np.unique(np.concatenate(pairs), axis=0)
+        tiles = {}
+        if len(pairs):
+            starts = np.flatnonzero(np.r_[True, (np.diff(pairs[:, :2], axis=0) != 0).any(axis=1)])
+            for chunk in np.split(pairs, starts[1:]):
+                tiles[(int(chunk[0, 0]), int(chunk[0, 1]))] = chunk[:, 2]
+        return tiles
+
+    def render_tile(self, zoom, tile_x, tile_y, cells=None):
+        """
+        RGBA pixels of one tile.
+
+        Args:
+            cells (array-like): Indices of the cells that reach the tile (default: search all)
+
+        Returns:
+            numpy.ndarray: (256, 256, 4) uint8
+        """
+        x, y, level = self.cells(zoom)
+        size = TILE_SIZE + 2 * self.margin
+        if cells is None:
+            cells = self.tiles(zoom).get((tile_x, tile_y), [])
+
+        # Cell positions on a tile grid padded by the stamp extent
+        grid_x = x[cells] - tile_x * TILE_SIZE + self.margin
+        grid_y = y[cells] - tile_y * TILE_SIZE + self.margin
+        inside = (grid_x >= 0) & (grid_x < size) & (grid_y >= 0) & (grid_y < size)
+        grid_x, grid_y, cell_levels = grid_x[inside], grid_y[inside], level[cells][inside]
+
+        # Alpha compositing: 1 - alpha = product of (1 - stamp), i.e. a sum of logs -
+        # stamped one by one for a few cells, else one convolution per strength level
+        log_transparency = np.zeros(self._grid_shape)
+        if len(grid_x) < DIRECT_STAMP_LIMIT:
+            extent = 2 * self.margin + 1
+            for cell_x, cell_y, index in zip(grid_x.tolist(), grid_y.tolist(), cell_levels.tolist()):
+                log_transparency[cell_y:cell_y + extent, cell_x:cell_x + extent] += self._log_kernels[index]
+        else:
+            for index in np.unique(cell_levels):
+                counts = np.zeros(self._grid_shape)
+                chosen = cell_levels == index
+                np.add.at(counts, (grid_y[chosen], grid_x[chosen]), 1)
+                log_transparency += np.fft.irfft2(np.fft.rfft2(counts) * self._kernel_ffts[index], self._grid_shape)
+
+        # Stamps land shifted by the kernel extent; keep the tile itself
+        start = 2 * self.margin
+        window = log_transparency[start:start + TILE_SIZE, start:start + TILE_SIZE]
+        alpha = np.clip(np.round((1 - np.exp(np.minimum(window, 0))) * 255), 0, 255).astype('uint8')
+
+        rgba = np.empty((TILE_SIZE, TILE_SIZE, 4), dtype='uint8')
+        rgba[..., :3] = self.lut[alpha]
+        rgba[..., 3] = alpha
+        return rgba
+
+    def write_tiles(self, output_dir, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+        """
+        Write {z}/{x}/{y}.png for every tile with any heat in it.
+
+        Returns:
+            int: Number of tiles written
+        """
+        output_dir = Path(output_dir)
+        written = 0
+        for zoom in range(min_zoom, max_zoom + 1):
+            for (tile_x, tile_y), cells in self.tiles(zoom).items():
+                rgba = self.render_tile(zoom, tile_x, tile_y, cells)
+                if not rgba[..., 3].any():
+                    continue
+                path = output_dir / str(zoom) / str(tile_x) / f"{tile_y}.png"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(tile_png(rgba))
+                written += 1
+        return written
+
+
+def tile_png(rgba):
+    """PNG bytes of an RGBA tile"""
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, 'RGBA').save(buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+    return buffer.getvalue()
+
+
+def heat_tile_layer(url, name="Heatmap", max_native_zoom=MAX_ZOOM, **kwargs):
+    """Overlay TileLayer for rendered heat tiles"""
+    return folium.TileLayer(
+        tiles=url,
+        attr='Heatmap',
+        name=name,
+        overlay=True,
+        control=True,
+        min_zoom=MIN_ZOOM,
+        max_native_zoom=max_native_zoom,
+        max_zoom=18,
+        **kwargs
+    )
+
+
+def static_heat_tiles(lat, lon, weights=None, tile_dir=STATIC_TILE_DIR, url_root=STATIC_TILE_URL,
+                      keep=STATIC_TILE_SETS):
+    """
+    Render tiles for a point set under Streamlit's static folder, once per distinct input.
+
+    The directory name is a hash of the points and the heat settings, so a
+    changed filter gets new tiles and an unchanged one reuses the old ones.
+    Only the `keep` most recently used tile sets are kept (see evict_tile_sets),
+    so call this every time the URL is used rather than caching the URL: a set
+    that was evicted meanwhile is rendered again.
+
+    Returns:
+        str: XYZ URL template of the tiles
+    """
+    lat = np.ascontiguousarray(lat, dtype='float64')
+    lon = np.ascontiguousarray(lon, dtype='float64')
+    weights = np.ascontiguousarray(np.ones(len(lat)) if weights is None else weights, dtype='float64')
+
+    digest = hashlib.sha1()
+    for array in (lat, lon, weights):
+        digest.update(array.tobytes())
+    digest.update(repr((HEAT_RADIUS, HEAT_BLUR, HEAT_MIN_OPACITY, HEAT_GRADIENT, MIN_ZOOM, MAX_ZOOM)).encode())
+    key = digest.hexdigest()[:16]
+
+    target = Path(tile_dir) / key
+    if not target.exists():
+        # Render into a directory of this render's own, so a half-written set is
+        # never served and sessions rendering the same key do not collide
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f"{key}.", suffix='.tmp', dir=target.parent))
+        HeatTileRenderer(lat, lon, weights).write_tiles(tmp_dir)
+        try:
+            tmp_dir.rename(target)
+        except OSError:
+            # Another session finished the same tiles first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        evict_tile_sets(tile_dir, keep)
+    else:
+        # Mark the set as recently used
+        os.utime(target)
+
+    return f"{url_root}/{key}/{{z}}/{{x}}/{{y}}.png"
+
+
+def evict_tile_sets(tile_dir=STATIC_TILE_DIR, keep=STATIC_TILE_SETS):
+    """
+    Delete all but the `keep` most recently used tile sets, and crashed renders.
+
+    Returns:
+        int: Number of directories deleted
+    """
+    tile_dir = Path(tile_dir)
+    if not tile_dir.exists():
+        return 0
+
+    now = time.time()
+    tile_sets = []
+    stale = []
+    for path in tile_dir.iterdir():
+        try:
+            modified = path.stat().st_mtime
+        except FileNotFoundError:
+            continue  # Renamed or deleted by another session meanwhile
+        if path.name.endswith('.tmp'):
+            if now - modified > STALE_RENDER_AGE:
+                stale.append(path)
+        elif path.is_dir():
+            tile_sets.append((modified, path))
+
+    tile_sets.sort(reverse=True)
+    stale += [path for _, path in tile_sets[keep:]]
+    for path in stale:
+        shutil.rmtree(path, ignore_errors=True)
+    return len(stale)
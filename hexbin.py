@@ -0,0 +1,190 @@
+"""
+Hexagonal binning of the pincode summary.
+
+Every address of a pincode sits on one pincode centroid, so a marker or heat
+blob shows how large a pincode is as much as how many people it holds. Hex
+binning sums pincodes into a grid of equal-area hexagons instead:
+- Pincode centroids are projected with a sinusoidal (equal-area) projection
+  centred on India.
+- Each centroid is snapped to a pointy-top hexagon of the chosen width.
+- The hexagons are drawn as a single GeoJSON polygon layer.
+
+The pincode -> hexagon mapping depends only on the pincode locations and the
+hexagon width. It is computed once per resolution (hex_mapping), and a filter
+change is only a merge and a groupby (aggregate_hexes).
+"""
+
+import folium
+import numpy as np
+import pandas as pd
+
+from map_layers import count_colors
+from spatial_index import EARTH_RADIUS_KM
+
+# Central meridian of the projection (the middle of India)
+CENTRAL_MERIDIAN = 80.0
+
+# Selectable resolutions: label -> hexagon width across flats in km
+HEX_RESOLUTIONS = {
+    "Coarse (25 km)": 25,
+    "Medium (10 km)": 10,
+    "Fine (4 km)": 4,
+    "Very Fine (1.5 km)": 1.5
+}
+
+
+def project(lat, lon):
+    """Sinusoidal projection to km (equal-area, so equal hexagons cover equal ground)"""
+    lat = np.radians(np.asarray(lat, dtype='float64'))
+    lon = np.radians(np.asarray(lon, dtype='float64') - CENTRAL_MERIDIAN)
+    return EARTH_RADIUS_KM * lon * np.cos(lat), EARTH_RADIUS_KM * lat
+
+
+def unproject(x, y):
+    """Inverse of project"""
+    lat = np.asarray(y, dtype='float64') / EARTH_RADIUS_KM
+    lon = np.asarray(x, dtype='float64') / (EARTH_RADIUS_KM * np.cos(lat))
+    return np.degrees(lat), np.degrees(lon) + CENTRAL_MERIDIAN
+
+
+def hex_cells(lat, lon, width_km):
+    """
+    Axial (q, r) coordinates of the pointy-top hexagon containing each point.
+
+    Args:
+        lat, lon (array-like): Coordinates in degrees
+        width_km (float): Hexagon width across flats
+
+    Returns:
+        tuple: (q, r) integer arrays
+    """
+    size = width_km / np.sqrt(3)  # Centre to corner
+    x, y = project(lat, lon)
+    q = (np.sqrt(3) / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+
+    # Round in cube coordinates (q + r + s = 0), fixing the component that moved most
+    s = -q - r
+    q_round, r_round, s_round = np.round(q), np.round(r), np.round(s)
+    q_diff, r_diff, s_diff = np.abs(q_round - q), np.abs(r_round - r), np.abs(s_round - s)
+    fix_q = (q_diff > r_diff) & (q_diff > s_diff)
+    fix_r = ~fix_q & (r_diff > s_diff)
+    q_round = np.where(fix_q, -r_round - s_round, q_round)
+    r_round = np.where(fix_r, -q_round - s_round, r_round)
+    return q_round.astype('int64'), r_round.astype('int64')
+
+
+def hex_polygons(q, r, width_km):
+    """
+    Corner rings of hexagons in GeoJSON order.
+
+    Returns:
+        numpy.ndarray: (n, 7, 2) closed rings of [lon, lat]
+    """
+    size = width_km / np.sqrt(3)
+    q = np.asarray(q, dtype='float64')
+    r = np.asarray(r, dtype='float64')
+    center_x = size * np.sqrt(3) * (q + r / 2)
+    center_y = size * 1.5 * r
+
+    angles = np.radians(30 + 60 * np.arange(7))  # The 7th corner closes the ring
+    lat, lon = unproject(center_x[:, None] + size * np.cos(angles), center_y[:, None] + size * np.sin(angles))
+    return np.stack([lon, lat], axis=-1)
+
+
+def hex_mapping(pincode_locations, width_km):
+    """
+    Hexagon of every pincode at one resolution.
+
+    Args:
+        pincode_locations (pd.DataFrame): CPA_PIN_CODE, Latitude, Longitude
+        width_km (float): Hexagon width across flats
+
+    Returns:
+        pd.DataFrame: CPA_PIN_CODE, hex_q, hex_r
+    """
+    located = pincode_locations.dropna(subset=['Latitude', 'Longitude'])
+    q, r = hex_cells(located['Latitude'].to_numpy(), located['Longitude'].to_numpy(), width_km)
+    return pd.DataFrame({'CPA_PIN_CODE': located['CPA_PIN_CODE'].to_numpy(), 'hex_q': q, 'hex_r': r})
+
+
+def aggregate_hexes(pincode_summary, mapping, count_column):
+    """
+    Sum a pincode summary into hexagons.
+
+    Args:
+        pincode_summary (pd.DataFrame): Per-pincode summary (see aggregates.summarize_cube)
+        mapping (pd.DataFrame): Output of hex_mapping
+        count_column (str): Name of the count column (e.g. 'customer_count')
+
+    Returns:
+        pd.DataFrame: One row per hexagon with hex_q, hex_r, the summed count,
+        pincodes (number of pincodes), city (of the largest pincode in the
+        hexagon) and percentage, sorted by count descending
+    """
+    binned = pincode_summary.merge(mapping, on='CPA_PIN_CODE').sort_values(count_column, ascending=False)
+    hexes = binned.groupby(['hex_q', 'hex_r'], sort=False).agg(**{
+        count_column: (count_column, 'sum'),
+        'pincodes': ('CPA_PIN_CODE', 'size'),
+        'city': ('CPA_ADDR_CITY', 'first')
+    }).reset_index()
+
+    total = hexes[count_column].sum()
+    hexes['percentage'] = hexes[count_column] / total * 100 if total else 0.0
+    return hexes.sort_values(count_column, ascending=False, ignore_index=True)
+
+
+def hexbin_layer(hexes, width_km, count_column, unit, is_percentage_mode=False, name="Hexbin"):
+    """
+    All hexagons as one GeoJSON layer, coloured on a log scale of their count or percentage.
+
+    Args:
+        hexes (pd.DataFrame): Output of aggregate_hexes
+        width_km (float): Hexagon width the hexes were binned at
+        count_column (str): Name of the count column
+        unit (str): What is counted, for the tooltip (e.g. 'customers')
+        is_percentage_mode (bool): Colour by share of the total and list it first in the tooltip
+    """
+    value_column = 'percentage' if is_percentage_mode else count_column
+    if is_percentage_mode:
+        fields = ['city', 'percentage', 'count', 'pincodes']
+        aliases = ['Largest pincode city:', 'Percentage:', f"{unit.title()}:", 'Pincodes:']
+    else:
+        fields = ['city', 'count', 'percentage', 'pincodes']
+        aliases = ['Largest pincode city:', f"{unit.title()}:", 'Percentage:', 'Pincodes:']
+
+    rings = hex_polygons(hexes['hex_q'].to_numpy(), hexes['hex_r'].to_numpy(), width_km).round(6)
+
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+            'properties': {
+                'count': count,
+                'percentage': f"{percentage:.1f}%",
+                'pincodes': pincodes,
+                'city': str(city),
+                'color': color
+            }
+        }
+        for ring, count, percentage, pincodes, city, color in zip(
+            rings.tolist(),
+            hexes[count_column].astype(int).tolist(),
+            hexes['percentage'].tolist(),
+            hexes['pincodes'].tolist(),
+            hexes['city'].tolist(),
+            count_colors(hexes[value_column])
+        )
+    ]
+
+    return folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        name=name,
+        style_function=lambda feature: {
+            'fillColor': feature['properties']['color'],
+            'color': feature['properties']['color'],
+            'weight': 1,
+            'fillOpacity': 0.6
+        },
+        tooltip=folium.GeoJsonTooltip(fields=fields, aliases=aliases)
+    )
@@ -0,0 +1,584 @@
+"""
+Shared folium map layers for the heatmap dashboards.
+
+PincodeMarkerLayer ships the whole pincode summary to the browser as one
+compact array and builds every marker, icon, tooltip and popup there from a
+single JS template, instead of emitting one folium.Marker + DivIcon + Popup
+per pincode. The markers carry the same customCount/customPercentage options,
+so the cluster icon functions below keep summing them exactly as before.
+
+ClusterIndexLayer draws clusters precomputed in Python (clustering.py) for the
+current zoom level only, for pincode sets too large for Leaflet MarkerCluster
+to re-cluster smoothly on every zoom.
+
+PrerenderedLayer holds a layer already rendered to HTML/JS strings (see
+prerender), so a cached layer can be replayed into every new map without
+rendering its markers again. PopupLookup fills placeholders in such a layer's
+popups from a small table that is rebuilt when only those values change.
+
+heat_data builds HeatMap points directly from column arrays. HeatDataLayer
+draws those points without folium's per-point validation loop.
+
+ChoroplethLayer shades pincode polygons. The geometry of every zoom band
+arrives already serialized (see boundaries.py), and only the small pincode ->
+colour table is rebuilt when the filters change.
+"""
+
+import numpy as np
+from branca.colormap import LinearColormap
+from branca.element import Element, MacroElement
+from folium import Map
+from folium.elements import JSCSSMixin
+from folium.map import Layer
+from folium.plugins import HeatMap
+from jinja2 import Template
+
+# JS helpers shared by the browser-built layers. They expect `percentageMode` and
+# `unit` in scope and build the same icons, tooltips and popups as the
+# per-row folium markers.
+PINCODE_MARKER_JS = """
+            var unitTitle = unit.charAt(0).toUpperCase() + unit.slice(1);
+
+            function pctText(pct) {
+                return pct < 1 ? '<1%' : pct.toFixed(1) + '%';
+            }
+
+            function markerColor(count, pct) {
+                if (percentageMode) {
+                    if (pct >= 10) return 'red';
+                    if (pct >= 5) return 'orange';
+                    if (pct >= 1) return 'lightgreen';
+                    return 'lightblue';
+                }
+                if (count > 1000) return 'red';
+                if (count > 500) return 'orange';
+                if (count > 100) return 'lightgreen';
+                return 'lightblue';
+            }
+
+            // r = [lat, lon, count, pct, pincode, city, state]
+            function pincodeMarker(r) {
+                var pctDisplay = pctText(r[3]);
+                var displayText = percentageMode ? pctDisplay : String(r[2]);
+                var tooltip = percentageMode
+                    ? r[5] + ' - ' + pctDisplay + ' (' + r[2] + ' ' + unit + ')'
+                    : r[5] + ' - ' + r[2] + ' ' + unit;
+
+                var icon = L.divIcon({
+                    className: 'empty',
+                    html: '<div style="background-color: ' + markerColor(r[2], r[3]) + '; border-radius: 50%; ' +
+                          'width: 35px; height: 35px; display: flex; align-items: center; justify-content: center; ' +
+                          'color: black; font-weight: bold; font-size: 11px; border: 3px solid white; ' +
+                          'box-shadow: 0 0 10px rgba(0,0,0,0.5);">' + displayText + '</div>'
+                });
+
+                var popup =
+                    '<div style="font-family: Arial; width: 200px;">' +
+                    '<h4 style="margin: 0; color: #1f77b4;">📍 ' + r[5] + '</h4>' +
+                    '<hr style="margin: 5px 0;">' +
+                    '<b>Pincode:</b> ' + r[4] + '<br>' +
+                    '<b>State:</b> ' + r[6] + '<br>' +
+                    '<b>' + unitTitle + ':</b> <span style="color: #d62728; font-weight: bold;">' + r[2] + '</span><br>' +
+                    '<b>Percentage:</b> <span style="color: #d62728; font-weight: bold;">' + pctDisplay + '</span><br>' +
+                    '<b>Coordinates:</b> ' + r[0].toFixed(4) + ', ' + r[1].toFixed(4) +
+                    '</div>';
+
+                return L.marker([r[0], r[1]], {
+                    icon: icon,
+                    customCount: r[2],
+                    customPercentage: r[3]
+                }).bindTooltip(tooltip).bindPopup(popup, {maxWidth: 250});
+            }
+
+            // Same look and thresholds as cluster_icon_function
+            function clusterIcon(sumCount, sumPct) {
+                var size = 'small';
+                var color = 'lightblue';
+                var displayText;
+                if (percentageMode) {
+                    displayText = pctText(sumPct);
+                    if (sumPct >= 10) size = 'large';
+                    else if (sumPct >= 5) size = 'medium';
+                    if (sumPct >= 10) color = 'red';
+                    else if (sumPct >= 5) color = 'orange';
+                    else if (sumPct >= 1) color = 'lightgreen';
+                } else {
+                    displayText = String(sumCount);
+                    if (sumCount >= 5000) size = 'large';
+                    else if (sumCount >= 1000) size = 'medium';
+                    if (sumCount > 1000) color = 'red';
+                    else if (sumCount > 500) color = 'orange';
+                    else if (sumCount >= 100) color = 'lightgreen';
+                }
+                return L.divIcon({
+                    html: '<div style="background-color:' + color + '; border-radius: 50%; text-align: center; color: black; font-weight: bold; border: 3px solid white; box-shadow: 0 0 10px rgba(0,0,0,0.5);"><span>' + displayText + '</span></div>',
+                    className: 'marker-cluster marker-cluster-' + size,
+                    iconSize: new L.Point(40, 40)
+                });
+            }
+"""
+
+
+# Colours of count-shaded areas (hexbins, choropleth), the same as the heatmap gradient
+COUNT_COLORS = ['blue', 'lime', 'yellow', 'red']
+COUNT_COLOR_STOPS = [0.0, 0.5, 0.7, 1.0]
+
+
+def count_colors(counts):
+    """Hex colour per count, on a log scale up to the largest count"""
+    counts = np.asarray(counts, dtype='float64')
+    scale = np.log1p(counts) / np.log1p(counts.max()) if len(counts) and counts.max() > 0 else counts
+    colormap = LinearColormap(COUNT_COLORS, index=COUNT_COLOR_STOPS, vmin=0, vmax=1)
+    return [colormap(level) for level in scale.tolist()]
+
+
+def cluster_icon_function(is_percentage_mode, total):
+    """JS iconCreateFunction that labels clusters with the summed count or percentage"""
+    if is_percentage_mode:
+        return f"""
+        function(cluster) {{
+            var markers = cluster.getAllChildMarkers();
+            var sumCount = 0;
+            var sumPct = 0;
+            var total = {total};
+            for (var i = 0; i < markers.length; i++) {{
+                if (markers[i].options.customCount) {{
+                    sumCount += markers[i].options.customCount;
+                }}
+                if (markers[i].options.customPercentage) {{
+                    sumPct += markers[i].options.customPercentage;
+                }}
+            }}
+
+            var displayText = sumPct < 1 ? '<1%' : sumPct.toFixed(1) + '%';
+
+            var size = 'small';
+            if (sumPct >= 10) size = 'large';
+            else if (sumPct >= 5) size = 'medium';
+
+            var color = 'lightblue';
+            if (sumPct >= 10) color = 'red';
+            else if (sumPct >= 5) color = 'orange';
+            else if (sumPct >= 1) color = 'lightgreen';
+
+            return L.divIcon({{
+                html: '<div style="background-color:' + color + '; border-radius: 50%; text-align: center; color: black; font-weight: bold; border: 3px solid white; box-shadow: 0 0 10px rgba(0,0,0,0.5);"><span>' + displayText + '</span></div>',
+                className: 'marker-cluster marker-cluster-' + size,
+                iconSize: new L.Point(40, 40)
+            }});
+        }}
+        """
+
+    return """
+        function(cluster) {
+            var markers = cluster.getAllChildMarkers();
+            var sum = 0;
+            for (var i = 0; i < markers.length; i++) {
+                if (markers[i].options.customCount) {
+                    sum += markers[i].options.customCount;
+                }
+            }
+            var size = 'small';
+            if (sum >= 5000) size = 'large';
+            else if (sum >= 1000) size = 'medium';
+
+            var color = 'lightblue';
+            if (sum > 1000) color = 'red';
+            else if (sum > 500) color = 'orange';
+            else if (sum >= 100) color = 'lightgreen';
+
+            return L.divIcon({
+                html: '<div style="background-color:' + color + '; border-radius: 50%; text-align: center; color: black; font-weight: bold; border: 3px solid white; box-shadow: 0 0 10px rgba(0,0,0,0.5);"><span>' + sum + '</span></div>',
+                className: 'marker-cluster marker-cluster-' + size,
+                iconSize: new L.Point(40, 40)
+            });
+        }
+        """
+
+
+def pincode_rows(pincode_summary, count_column):
+    """
+    Pack the pincode summary into compact [lat, lon, count, pct, pincode, city, state] rows.
+
+    Coordinates are rounded to 6 decimals (~0.1 m) and percentages to 4, which is
+    well below anything shown on the map but keeps the payload small.
+    """
+    return list(zip(
+        pincode_summary['Latitude'].round(6).tolist(),
+        pincode_summary['Longitude'].round(6).tolist(),
+        pincode_summary[count_column].astype(int).tolist(),
+        pincode_summary['percentage'].round(4).tolist(),
+        pincode_summary['CPA_PIN_CODE'].astype(int).tolist(),
+        pincode_summary['CPA_ADDR_CITY'].astype(str).tolist(),
+        pincode_summary['StateName'].astype(str).tolist()
+    ))
+
+
+def heat_data(lat, lon, weights=None, normalize=False, precision=6):
+    """
+    Build the [lat, lon, weight] points of a heatmap straight from column arrays.
+
+    Rows with a missing coordinate or weight are dropped. Coordinates are converted
+    to float64 before rounding, so float32 columns come out as 12.9716, not
+    12.971599578857422. Integer weights stay integers.
+
+    Args:
+        lat, lon (array-like): Coordinates in degrees
+        weights (array-like): Weight per point (None for unweighted [lat, lon] points)
+        normalize (bool): Scale weights to 0-1 by the largest weight
+        precision (int): Decimals kept for coordinates and normalized weights (None to keep all)
+
+    Returns:
+        list: One [lat, lon, weight] or [lat, lon] list per point
+    """
+    columns = [np.asarray(lat, dtype='float64'), np.asarray(lon, dtype='float64')]
+    if weights is not None:
+        columns.append(np.asarray(weights, dtype='float64'))
+
+    valid = np.logical_and.reduce([np.isfinite(column) for column in columns])
+    columns = [column[valid] for column in columns]
+
+    if precision is not None:
+        columns[:2] = [column.round(precision) for column in columns[:2]]
+
+    if weights is not None:
+        weight = columns[2]
+        if normalize:
+            peak = weight.max() if len(weight) else 0
+            weight = weight / peak if peak > 0 else weight
+            if precision is not None:
+                weight = weight.round(precision)
+        elif np.array_equal(weight, weight.round()):
+            weight = weight.astype('int64')
+        columns[2] = weight
+
+    return [list(point) for point in zip(*(column.tolist() for column in columns))]
+
+
+class HeatDataLayer(HeatMap):
+    """
+    HeatMap over points that are already clean, e.g. the output of heat_data().
+
+    folium's HeatMap validates every point in a Python loop. heat_data() has
+    already dropped missing values, so this layer stores the points as they are.
+    Options and rendering are the same as HeatMap.
+    """
+
+    def __init__(self, data, **kwargs):
+        super().__init__([], **kwargs)
+        self.data = data
+
+
+class PincodeMarkerLayer(MacroElement):
+    """
+    Browser-built pincode markers, added as a child of a MarkerCluster.
+
+    Args:
+        pincode_summary (pd.DataFrame): Per-pincode summary with Latitude, Longitude,
+            CPA_PIN_CODE, CPA_ADDR_CITY, StateName, percentage and the count column
+        count_column (str): Name of the count column (e.g. 'customer_count')
+        is_percentage_mode (bool): Label and color markers by percentage instead of count
+        unit (str): Plural noun for the count in tooltips and popups (e.g. 'customers')
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var cluster = {{ this._parent.get_name() }};
+            var rows = {{ this.rows|tojson }};
+            var percentageMode = {{ this.is_percentage_mode|tojson }};
+            var unit = {{ this.unit|tojson }};
+            {{ this.marker_js }}
+
+            var markers = new Array(rows.length);
+            for (var i = 0; i < rows.length; i++) {
+                markers[i] = pincodeMarker(rows[i]);
+            }
+
+            // One bulk insert so the cluster group only re-clusters once
+            cluster.addLayers(markers);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, pincode_summary, count_column, is_percentage_mode, unit):
+        super().__init__()
+        self._name = 'PincodeMarkerLayer'
+        self.rows = pincode_rows(pincode_summary, count_column)
+        self.is_percentage_mode = is_percentage_mode
+        self.unit = unit
+        self.marker_js = PINCODE_MARKER_JS
+
+
+class ClusterIndexLayer(JSCSSMixin, Layer):
+    """
+    Pincode markers pre-clustered in Python for every zoom level.
+
+    Draws only the clusters of the current zoom level (see
+    clustering.build_cluster_index) and swaps them on zoomend, so the browser
+    never walks child markers to re-cluster or re-sum them. Single-pincode
+    clusters are drawn as regular pincode markers; clicking a cluster zooms to
+    the level where it splits.
+
+    Args:
+        cluster_index (dict): Output of clustering.build_cluster_index
+        pincode_summary (pd.DataFrame): Summary the index was built from
+        count_column (str): Name of the count column (e.g. 'customer_count')
+        is_percentage_mode (bool): Label and color markers by percentage instead of count
+        unit (str): Plural noun for the count in tooltips and popups (e.g. 'customers')
+        name (str): Layer name shown in the LayerControl
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.layerGroup();
+        (function() {
+            var layer = {{ this.get_name() }};
+            var map = {{ this._parent.get_name() }};
+            var points = {{ this.points|tojson }};
+            var levels = {{ this.levels|tojson }};
+            var percentageMode = {{ this.is_percentage_mode|tojson }};
+            var unit = {{ this.unit|tojson }};
+            {{ this.marker_js }}
+
+            var zooms = Object.keys(levels).map(Number).sort(function(a, b) { return a - b; });
+
+            function levelFor(zoom) {
+                var level = zooms[0];
+                for (var i = 0; i < zooms.length; i++) {
+                    if (zooms[i] <= zoom) level = zooms[i];
+                }
+                return level;
+            }
+
+            // c = [lat, lon, count, pct, point, expansionZoom]
+            function clusterMarker(c) {
+                var marker = L.marker([c[0], c[1]], {icon: clusterIcon(c[2], c[3])});
+                marker.on('click', function() { map.setView([c[0], c[1]], c[5]); });
+                return marker;
+            }
+
+            var drawnLevel = null;
+            function redraw() {
+                var level = levelFor(map.getZoom());
+                if (level === drawnLevel) return;
+                drawnLevel = level;
+
+                var clusters = levels[level];
+                var markers = new Array(clusters.length);
+                for (var i = 0; i < clusters.length; i++) {
+                    var c = clusters[i];
+                    markers[i] = c[4] >= 0 ? pincodeMarker(points[c[4]]) : clusterMarker(c);
+                }
+                layer.clearLayers();
+                for (var j = 0; j < markers.length; j++) {
+                    layer.addLayer(markers[j]);
+                }
+            }
+
+            map.on('zoomend', redraw);
+            redraw();
+        })();
+        {% endmacro %}
+    """)
+
+    # Reuse the MarkerCluster stylesheets for the marker-cluster-* icon classes
+    default_css = [
+        ("markerclustercss", "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/MarkerCluster.css"),
+        ("markerclusterdefaultcss", "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/MarkerCluster.Default.css")
+    ]
+
+    def __init__(self, cluster_index, pincode_summary, count_column, is_percentage_mode, unit, name=None):
+        super().__init__(name=name, overlay=True, control=True, show=True)
+        self._name = 'ClusterIndexLayer'
+        self.points = pincode_rows(pincode_summary, count_column)
+        self.levels = {
+            zoom: list(zip(
+                level['lat'].round(6).tolist(),
+                level['lon'].round(6).tolist(),
+                level['count'].tolist(),
+                level['percentage'].round(4).tolist(),
+                level['point'].tolist(),
+                level['expansion_zoom'].tolist()
+            ))
+            for zoom, level in cluster_index.items()
+        }
+        self.is_percentage_mode = is_percentage_mode
+        self.unit = unit
+        self.marker_js = PINCODE_MARKER_JS
+
+
+class RenderedElement(Element):
+    """Already rendered HTML/JS, emitted as is"""
+
+    def __init__(self, text):
+        super().__init__()
+        self.text = text
+
+    def render(self, **kwargs):
+        return self.text
+
+
+class PrerenderedLayer(Layer):
+    """
+    A layer rendered once and replayed into any map.
+
+    Holds the header, html and script fragments the layer contributed to its
+    figure, as plain strings, so it pickles into st.cache_data and adding it to
+    a new map costs a string copy instead of one template render per marker.
+    Keeps the original layer's JS name, so LayerControl entries still work.
+    Create one with prerender().
+    """
+
+    def __init__(self, layer_name, overlay, control, show, element_name, map_name, fragments):
+        super().__init__(name=layer_name, overlay=overlay, control=control, show=show)
+        self.element_name = element_name
+        self.map_name = map_name
+        self.fragments = fragments
+
+    def get_name(self):
+        return self.element_name
+
+    def render(self, **kwargs):
+        figure = self.get_root()
+        map_name = self._parent.get_name()
+        for section, fragments in self.fragments.items():
+            for name, text in fragments:
+                getattr(figure, section).add_child(RenderedElement(text.replace(self.map_name, map_name)), name=name)
+
+
+def prerender(layer):
+    """
+    Render a folium layer (and everything in it) once on a scratch map.
+
+    Returns:
+        PrerenderedLayer: The rendered layer, ready to be added to any map
+    """
+    scratch = Map(tiles=None)
+    layer.add_to(scratch)
+    figure = scratch.get_root()
+    sections = ('header', 'html', 'script')
+    existing = {section: set(getattr(figure, section)._children) for section in sections}
+
+    layer.render()
+
+    fragments = {
+        section: [
+            (name, element.render())
+            for name, element in getattr(figure, section)._children.items()
+            if name not in existing[section]
+        ]
+        for section in sections
+    }
+    return PrerenderedLayer(
+        layer.layer_name, layer.overlay, layer.control, layer.show,
+        layer.get_name(), scratch.get_name(), fragments
+    )
+
+
+class PopupLookup(MacroElement):
+    """
+    Fill popup placeholders from a key -> HTML table when a popup opens.
+
+    Lets a cached layer show values that change more often than the layer
+    itself: its popups contain `<span class="{css_class}" data-key="...">`
+    and only this table is rebuilt when the values change.
+
+    Args:
+        values (dict): HTML per placeholder key
+        css_class (str): Class of the placeholder elements
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var values = {{ this.values|tojson }};
+            {{ this._parent.get_name() }}.on('popupopen', function(e) {
+                var slots = e.popup.getElement().querySelectorAll('.{{ this.css_class }}');
+                for (var i = 0; i < slots.length; i++) {
+                    slots[i].innerHTML = values[slots[i].dataset.key] || '';
+                }
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, values, css_class):
+        super().__init__()
+        self._name = 'PopupLookup'
+        self.values = {str(key): value for key, value in values.items()}
+        self.css_class = css_class
+
+
+class ChoroplethLayer(Layer):
+    """
+    Pincode polygons shaded by value, drawn at the detail of the current zoom band.
+
+    The geometry of each band comes in as a FeatureCollection JSON string that is
+    built once (boundaries.band_feature_collections) and written into the page
+    as is. Per filter change only `values` is rebuilt. The browser joins it to
+    the features by pincode, draws only pincodes that have a value, and swaps
+    bands on zoomend.
+
+    Args:
+        bands (list): (min_zoom, max_zoom, FeatureCollection JSON) per band, coarsest first
+        values (dict): pincode -> (fill colour, tooltip text)
+        name (str): Layer name shown in the LayerControl
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.layerGroup();
+        (function() {
+            var layer = {{ this.get_name() }};
+            var map = {{ this._parent.get_name() }};
+            var values = {{ this.values|tojson }};
+            var bands = [
+                {%- for min_zoom, max_zoom, collection in this.bands %}
+                {minZoom: {{ min_zoom }}, maxZoom: {{ max_zoom }}, data: {{ collection }}},
+                {%- endfor %}
+            ];
+
+            function bandFor(zoom) {
+                for (var i = 0; i < bands.length; i++) {
+                    if (zoom <= bands[i].maxZoom) return bands[i];
+                }
+                return bands[bands.length - 1];
+            }
+
+            // Each band's GeoJSON layer is built the first time it is shown
+            var drawnBand = null;
+            function redraw() {
+                var band = bandFor(map.getZoom());
+                if (band === drawnBand) return;
+                drawnBand = band;
+
+                if (!band.layer) {
+                    band.layer = L.geoJSON(band.data, {
+                        filter: function(feature) {
+                            return values.hasOwnProperty(feature.properties.pincode);
+                        },
+                        style: function(feature) {
+                            var color = values[feature.properties.pincode][0];
+                            return {fillColor: color, color: color, weight: 1, opacity: 0.8, fillOpacity: 0.6};
+                        },
+                        onEachFeature: function(feature, shape) {
+                            shape.bindTooltip(values[feature.properties.pincode][1]);
+                        }
+                    });
+                }
+                layer.clearLayers();
+                layer.addLayer(band.layer);
+            }
+
+            map.on('zoomend', redraw);
+            redraw();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, bands, values, name=None):
+        super().__init__(name=name, overlay=True, control=True, show=True)
+        self._name = 'ChoroplethLayer'
+        self.bands = bands
+        self.values = {str(pincode): list(value) for pincode, value in values.items()}
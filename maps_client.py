@@ -0,0 +1,270 @@
+"""
+Shared Google Maps client with a persistent response cache.
+
+Every googlemaps call (geocode, places_nearby, places, place, ...) goes
+through Client._request, so CachedClient caches there: each successful
+response is stored in a SQLite file keyed by a hash of the request
+(server, endpoint and parameters minus credentials). Entries expire after a
+TTL, and the cache is bounded to max_entries, evicting the least recently used.
+
+Rate limits are applied the same way, per request that reaches the network
+(see network_rate_limiter), so responses served from the cache never wait
+for the requests-per-second budget.
+
+Cache modes (GOOGLE_MAPS_CACHE_MODE, or the mode argument):
+    cache   - serve fresh cached responses, fetch and store the rest (default)
+    refresh - always fetch, store the new responses
+    replay  - serve only from cache, never touch the network; a miss raises
+              ReplayMiss (offline development, deterministic test runs)
+    off     - plain googlemaps client
+
+Usage:
+    python maps_client.py stats
+    python maps_client.py prune      # drop expired entries
+    python maps_client.py clear
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import googlemaps
+from dotenv import load_dotenv
+from googlemaps.exceptions import ApiError, Timeout, TransportError
+
+load_dotenv()
+API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+
+CACHE_FILE = '.maps_cache.sqlite'
+CACHE_MODES = ('cache', 'refresh', 'replay', 'off')
+DEFAULT_CACHE_MODE = os.getenv('GOOGLE_MAPS_CACHE_MODE', 'cache')
+DEFAULT_TTL_DAYS = 30
+DEFAULT_MAX_ENTRIES = 50_000
+
+# Request parameters that identify the caller, not the request
+CREDENTIAL_PARAMS = {'key', 'client', 'signature', 'channel'}
+
+# API statuses worth retrying (everything else, e.g. REQUEST_DENIED, is permanent)
+TRANSIENT_STATUSES = {'OVER_QUERY_LIMIT', 'UNKNOWN_ERROR'}
+
+# Any well-formed key works when no request reaches Google (replay, fake servers)
+PLACEHOLDER_KEY = 'AIza-offline-placeholder-key'
+
+
+def is_transient_error(error):
+    """True for network errors, timeouts and rate-limit responses"""
+    if isinstance(error, (TransportError, Timeout)):
+        return True
+    return isinstance(error, ApiError) and error.status in TRANSIENT_STATUSES
+
+
+class ReplayMiss(ApiError):
+    """A request had no cached response in replay mode"""
+
+    def __init__(self, url):
+        super().__init__('REPLAY_MISS', f"No cached response for {url}")
+
+
+class CachedResponse(dict):
+    """A response body served from the cache (callers can skip e.g. page-token waits)"""
+    from_cache = True
+
+
+def request_key(base_url, url, params, post_json=None):
+    """Stable hash of a request, ignoring credentials and parameter order"""
+    items = params.items() if isinstance(params, dict) else params
+    signature = [
+        base_url,
+        url,
+        sorted((str(k), str(v)) for k, v in items if k not in CREDENTIAL_PARAMS),
+        post_json
+    ]
+    return hashlib.sha256(json.dumps(signature, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed response store with TTL expiry and LRU eviction.
+
+    Args:
+        path (str): SQLite file
+        ttl_days (float): Age after which an entry is no longer served
+        max_entries (int): Entry limit; least recently used entries are evicted beyond it
+    """
+
+    def __init__(self, path=CACHE_FILE, ttl_days=DEFAULT_TTL_DAYS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, url TEXT, body TEXT, stored_at REAL, used_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self._db.commit()
+
+    def get(self, key):
+        """Cached body for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT body, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        return CachedResponse(json.loads(row[0]))
+
+    def put(self, key, url, body):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, url, body, stored_at, used_at) VALUES (?, ?, ?, ?, ?)",
+                (key, url, json.dumps(body), now, now)
+            )
+            # Evict least recently used entries beyond the limit
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+
+    def prune(self):
+        """Delete expired entries, returning how many were removed"""
+        with self._lock:
+            removed = self._db.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl,)).rowcount
+            self._db.commit()
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self):
+        """Entry counts per endpoint"""
+        with self._lock:
+            rows = self._db.execute("SELECT url, COUNT(*) FROM responses GROUP BY url ORDER BY url").fetchall()
+        return dict(rows)
+
+
+class RateLimitedClient(googlemaps.Client):
+    """googlemaps.Client that takes a token from rate_limiter (if set) before every network request"""
+
+    rate_limiter = None
+
+    def _request(self, *args, **kwargs):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        return super()._request(*args, **kwargs)
+
+
+class CachedClient(RateLimitedClient):
+    """
+    googlemaps.Client that serves and stores responses through a ResponseCache.
+
+    Only cache misses reach RateLimitedClient._request, so only they are rate limited.
+
+    Args:
+        cache (ResponseCache): Response store
+        mode (str): 'cache', 'refresh' or 'replay' (see module docstring)
+        **kwargs: Passed to googlemaps.Client
+    """
+
+    def __init__(self, cache, mode='cache', **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.mode = mode
+
+    def _request(self, url, params, first_request_time=None, retry_counter=0, base_url=None,
+                 accepts_clientid=True, extract_body=None, requests_kwargs=None, post_json=None):
+        # Retries (first_request_time set) and custom body extraction go straight to the network
+        if first_request_time is not None or extract_body is not None:
+            return super()._request(url, params, first_request_time, retry_counter, base_url,
+                                    accepts_clientid, extract_body, requests_kwargs, post_json)
+
+        key = request_key(base_url or self.base_url, url, params, post_json)
+        if self.mode != 'refresh':
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+            if self.mode == 'replay':
+                raise ReplayMiss(url)
+
+        body = super()._request(url, params, base_url=base_url, accepts_clientid=accepts_clientid,
+                                requests_kwargs=requests_kwargs, post_json=post_json)
+        self.cache.put(key, url, body)
+        return body
+
+
+def create_client(base_url=None, mode=DEFAULT_CACHE_MODE, cache_path=CACHE_FILE,
+                  ttl_days=DEFAULT_TTL_DAYS, max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    Create the Google Maps client used by all fetch scripts.
+
+    Args:
+        base_url (str): Send requests to another server, e.g. fake_places_server.py
+        mode (str): Cache mode - 'cache', 'refresh', 'replay' or 'off'
+        cache_path (str): SQLite response cache file
+        ttl_days (float): Response time-to-live
+        max_entries (int): Cache size limit (LRU eviction)
+    """
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode '{mode}', expected one of {CACHE_MODES}")
+
+    # No API key needed when nothing reaches Google
+    offline = base_url is not None or mode == 'replay'
+    if not API_KEY and not offline:
+        raise ValueError("GOOGLE_MAPS_API_KEY not found in .env file")
+
+    kwargs = {'key': API_KEY or PLACEHOLDER_KEY}
+    if base_url:
+        kwargs['base_url'] = base_url
+
+    if mode == 'off':
+        return RateLimitedClient(**kwargs)
+
+    return CachedClient(ResponseCache(cache_path, ttl_days, max_entries), mode=mode, **kwargs)
+
+
+def network_rate_limiter(client, rate_limiter):
+    """
+    Hand a rate limiter to the client, so it is applied only to network requests.
+
+    Returns:
+        The limiter the caller still has to apply to each call: None when the
+        client took it over, else rate_limiter (e.g. for stub clients)
+    """
+    if rate_limiter is not None and isinstance(client, RateLimitedClient):
+        client.rate_limiter = rate_limiter
+        return None
+    return rate_limiter
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    cache = ResponseCache()
+
+    if command == 'stats':
+        stats = cache.stats()
+        print(f"Response cache: {CACHE_FILE} ({sum(stats.values())} entries)")
+        for url, count in stats.items():
+            print(f"  {url}: {count}")
+    elif command == 'prune':
+        print(f"Removed {cache.prune()} expired entries")
+    elif command == 'clear':
+        cache.clear()
+        print("Cache cleared")
+    else:
+        sys.exit(f"Unknown command '{command}' (expected stats, prune or clear)")
@@ -1,58 +1,222 @@
-import pandas as pd
+"""
+Merge address extracts into Combined_Address_Details.csv.
+
+Sources are streamed in chunks: each chunk is read with fixed string dtypes
+(no per-chunk type guessing), its pincodes are cleaned, and it is appended to
+the output straight away, so memory stays at one chunk no matter how large or
+how many the extracts are. The output is written to a temporary file and moved
+into place at the end, so a failed run never leaves a half-written file.
+
+The same chunks also go to a Hive-style partitioned Parquet dataset
+(datasets/addresses/Year=.../RRH_LOCATION_CD=.../), which the dashboards read
+partition by partition (see data_loader.iter_partitions).
+
+Usage:
+    python merge_addresses.py                           # Address Details.csv + TNAddress.csv
+    python merge_addresses.py "extracts/*.csv" More.csv  # any files or glob patterns
+    python merge_addresses.py BlrSurgeryOnly.csv --no-csv --dataset datasets/surgery
+"""
+
+import argparse
+import glob
+import os
+import shutil
 from pathlib import Path
 
-def merge_address_files():
-    """Merge Address Details.csv and TNAddress.csv into a single combined CSV"""
+import pandas as pd
+
+from data_loader import ADDRESS_DATASET, write_partitioned
+
+DEFAULT_SOURCES = ['Address Details.csv', 'TNAddress.csv']
+OUTPUT_FILE = 'Combined_Address_Details.csv'
+
+# Rows read per chunk
+CHUNK_SIZE = 200_000
+
+# Everything is read as text; pincodes are converted per chunk, the rest is passed through as is
+ADDRESS_DTYPES = {
+    'RRH_MR_NUM': 'string',
+    'CPA_ADDR_AREA': 'string',
+    'CPA_ADDR_CITY': 'string',
+    'CPA_PIN_CODE': 'string',
+    'RRH_LOCATION_CD': 'string',
+    'RegistrationDate': 'string',
+    'BSM_MINOR_CD': 'string'  # Surgery extracts only
+}
+
+
+def expand_sources(patterns):
+    """Resolve file names and glob patterns to a de-duplicated list of files, in order"""
+    sources = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.escape(pattern) != pattern else [pattern]
+        for match in matches:
+            if match not in sources:
+                sources.append(match)
+    return sources
+
+
+def read_chunks(csv_file, chunk_size=CHUNK_SIZE):
+    """Stream a source file in chunks with the fixed address dtypes"""
+    return pd.read_csv(
+        csv_file,
+        dtype=ADDRESS_DTYPES,
+        encoding='utf-8-sig',  # Excel exports start with a byte order mark
+        chunksize=chunk_size
+    )
+
+
+def clean_chunk(chunk):
+    """Drop rows with invalid pincodes and store the rest as integers"""
+    pincodes = pd.to_numeric(chunk['CPA_PIN_CODE'], errors='coerce')
+    valid = pincodes.notna()
+    chunk = chunk[valid].copy()
+    chunk['CPA_PIN_CODE'] = pincodes[valid].astype('int64')
+    return chunk, int((~valid).sum())
 
+
+def replace_dir(tmp_dir, target_dir):
+    """Swap a freshly written directory in for the old one"""
+    target_dir = Path(target_dir)
+    old_dir = target_dir.with_name(f"{target_dir.name}.old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if target_dir.exists():
+        target_dir.rename(old_dir)
+    Path(tmp_dir).rename(target_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def merge_address_files(sources=None, output_file=OUTPUT_FILE, chunk_size=CHUNK_SIZE, dataset_dir=ADDRESS_DATASET):
+    """
+    Stream address CSVs into a single combined CSV and/or a partitioned dataset.
+
+    Args:
+        sources (list): File names or glob patterns (default: DEFAULT_SOURCES)
+        output_file (str): Combined CSV to write (None to skip)
+        chunk_size (int): Rows held in memory at a time
+        dataset_dir (Path): Partitioned Parquet dataset to write (None to skip)
+
+    Returns:
+        bool: True if the outputs were written
+    """
     print("=" * 60)
     print("Merging Address CSV Files")
     print("=" * 60)
 
-    csv_files = ['Address Details.csv', 'TNAddress.csv']
-    dataframes = []
+    csv_files = expand_sources(sources or DEFAULT_SOURCES)
+    if not csv_files:
+        print(f"\n❌ No files match {', '.join(sources)}")
+        return False
+
+    missing = [csv_file for csv_file in csv_files if not Path(csv_file).exists()]
+    if missing:
+        for csv_file in missing:
+            print(f"\n❌ {csv_file} NOT FOUND")
+        return False
+
+    tmp_file = f"{output_file}.tmp" if output_file else None
+    tmp_dataset = Path(f"{dataset_dir}.tmp") if dataset_dir else None
+    if tmp_dataset:
+        shutil.rmtree(tmp_dataset, ignore_errors=True)
+        tmp_dataset.parent.mkdir(parents=True, exist_ok=True)
+    columns = None
+    sample = None
+    total_records = 0
+    all_pincodes = set()
 
-    for csv_file in csv_files:
-        if Path(csv_file).exists():
-            print(f"\nLoading {csv_file}...")
-            df = pd.read_csv(csv_file)
+    try:
+        for csv_file in csv_files:
+            print(f"\nStreaming {csv_file}...")
+            records = 0
+            dropped = 0
+            pincodes = set()
 
-            # Convert pincode to numeric
-            df['CPA_PIN_CODE'] = pd.to_numeric(df['CPA_PIN_CODE'], errors='coerce')
+            for chunk in read_chunks(csv_file, chunk_size):
+                chunk, chunk_dropped = clean_chunk(chunk)
 
-            # Drop rows with invalid pincodes
-            original_count = len(df)
-            df = df.dropna(subset=['CPA_PIN_CODE'])
-            dropped = original_count - len(df)
+                # The first file fixes the columns; later files must have the same
+                # ones and are aligned to its order
+                first_chunk = columns is None
+                if first_chunk:
+                    columns = list(chunk.columns)
+                elif set(chunk.columns) != set(columns):
+                    missing_columns = [column for column in columns if column not in chunk.columns]
+                    extra_columns = [column for column in chunk.columns if column not in columns]
+                    print(f"\n❌ {csv_file} has different columns than {csv_files[0]}")
+                    if missing_columns:
+                        print(f"   Missing: {', '.join(missing_columns)}")
+                    if extra_columns:
+                        print(f"   Extra: {', '.join(extra_columns)}")
+                    return False
+                chunk = chunk.reindex(columns=columns)
 
-            print(f"  - Loaded {len(df)} records")
+                if tmp_file:
+                    chunk.to_csv(tmp_file, mode='w' if first_chunk else 'a', header=first_chunk, index=False)
+                if tmp_dataset:
+                    write_partitioned(chunk, tmp_dataset)
+
+                if sample is None:
+                    sample = chunk.head()
+                records += len(chunk)
+                dropped += chunk_dropped
+                pincodes.update(chunk['CPA_PIN_CODE'].unique().tolist())
+
+            print(f"  - Loaded {records:,} records")
             if dropped > 0:
-                print(f"  - Dropped {dropped} records with invalid pincodes")
-            print(f"  - Unique pincodes: {df['CPA_PIN_CODE'].nunique()}")
+                print(f"  - Dropped {dropped:,} records with invalid pincodes")
+            print(f"  - Unique pincodes: {len(pincodes)}")
 
-            dataframes.append(df)
-        else:
-            print(f"\n❌ {csv_file} NOT FOUND")
-            return False
+            total_records += records
+            all_pincodes |= pincodes
 
-    # Combine all dataframes
-    print(f"\nMerging {len(dataframes)} files...")
-    combined_df = pd.concat(dataframes, ignore_index=True)
+        if not total_records:
+            print(f"\n❌ No records with valid pincodes in {', '.join(csv_files)}")
+            return False
 
-    # Save to new file
-    output_file = 'Combined_Address_Details.csv'
-    combined_df.to_csv(output_file, index=False)
+        if tmp_file:
+            os.replace(tmp_file, output_file)
+        if tmp_dataset:
+            replace_dir(tmp_dataset, dataset_dir)
+    finally:
+        if tmp_file and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        if tmp_dataset:
+            shutil.rmtree(tmp_dataset, ignore_errors=True)
 
-    print(f"\n✅ Successfully created {output_file}")
-    print(f"   Total records: {len(combined_df):,}")
-    print(f"   Unique pincodes: {combined_df['CPA_PIN_CODE'].nunique()}")
-    print(f"   Columns: {', '.join(combined_df.columns)}")
+    for output in [output_file, dataset_dir]:
+        if output:
+            print(f"\n✅ Successfully created {output} from {len(csv_files)} files")
+    print(f"   Total records: {total_records:,}")
+    print(f"   Unique pincodes: {len(all_pincodes)}")
+    print(f"   Columns: {', '.join(columns)}")
 
     # Show sample data
     print("\nSample data (first 5 rows):")
-    print(combined_df.head())
+    print(sample)
 
     print("\n" + "=" * 60)
     return True
 
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stream address extracts into one combined CSV")
+    parser.add_argument('sources', nargs='*', default=DEFAULT_SOURCES,
+                        help="Source CSV files or glob patterns (default: %(default)s)")
+    parser.add_argument('--output', default=OUTPUT_FILE, help="Combined CSV to write (default: %(default)s)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help="Rows read per chunk (default: %(default)s)")
+    parser.add_argument('--dataset', default=str(ADDRESS_DATASET),
+                        help="Partitioned Parquet dataset to write (default: %(default)s)")
+    parser.add_argument('--no-csv', action='store_true', help="Only write the partitioned dataset")
+    parser.add_argument('--no-dataset', action='store_true', help="Only write the combined CSV")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    merge_address_files()
+    args = parse_args()
+    merge_address_files(
+        args.sources,
+        output_file=None if args.no_csv else args.output,
+        chunk_size=args.chunk_size,
+        dataset_dir=None if args.no_dataset else Path(args.dataset)
+    )
@@ -0,0 +1,151 @@
+"""
+Offline pincode geocoder backed by the India Post reference file.
+
+Builds an in-memory index from `pincode_with_lat-long.csv` (one row per post
+office: Pincode, Latitude, Longitude, OfficeName, District, StateName):
+
+- exact index: one centroid per 6-digit pincode (median of its post offices)
+- prefix index: one centroid per pincode prefix of 3-5 digits. Indian pincodes
+  are hierarchical (1st digit = zone, 2 = sub-zone, 3 = sorting district), so a
+  prefix centroid is a good region-level stand-in.
+
+A full 6-digit pincode only matches its exact entry. A partial entry like
+`560` or `56010` falls back to ever shorter prefixes, so it still lands in the
+right district instead of the India-wide centroid Google returns for it. A
+full pincode missing from the reference file is left unresolved rather than
+placed at a district centroid, so the API can still geocode it exactly.
+fetch_coordinates.py consults this index before making any billed API call.
+
+Usage:
+    python offline_geocoder.py 560001 560 56010
+"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from aggregates import most_frequent
+
+REFERENCE_FILE = 'pincode_with_lat-long.csv'
+
+# Google's country-level result for pincodes it cannot place
+INDIA_CENTROID = (20.593684, 78.96288)
+
+# Bounding box used to drop obviously wrong reference coordinates
+INDIA_BOUNDS = {'lat': (6.0, 37.5), 'lon': (68.0, 97.5)}
+
+# Shortest prefix still precise enough to use (3 digits = sorting district)
+DEFAULT_MIN_PREFIX = 3
+
+
+def is_country_centroid(latitude, longitude, tolerance=1e-4):
+    """True for coordinates at India's centroid (an unresolved geocode)"""
+    return (abs(latitude - INDIA_CENTROID[0]) < tolerance) & (abs(longitude - INDIA_CENTROID[1]) < tolerance)
+
+
+def load_reference(reference_file=REFERENCE_FILE):
+    """Load and clean the pincode reference file"""
+    df = pd.read_csv(reference_file, usecols=['Pincode', 'Latitude', 'Longitude', 'District', 'StateName'],
+                     low_memory=False)
+
+    df['Pincode'] = pd.to_numeric(df['Pincode'], errors='coerce')
+    df['Latitude'] = pd.to_numeric(df['Latitude'], errors='coerce')
+    df['Longitude'] = pd.to_numeric(df['Longitude'], errors='coerce')
+    df = df.dropna(subset=['Pincode', 'Latitude', 'Longitude'])
+
+    in_bounds = (
+        df['Latitude'].between(*INDIA_BOUNDS['lat']) &
+        df['Longitude'].between(*INDIA_BOUNDS['lon'])
+    )
+    df = df[in_bounds]
+
+    df['Pincode'] = df['Pincode'].astype('int64').astype(str)
+    return df[df['Pincode'].str.len() == 6]
+
+
+class OfflineGeocoder:
+    """
+    Exact + hierarchical-prefix pincode lookup over a reference DataFrame.
+
+    Args:
+        reference (pd.DataFrame): Cleaned reference rows (see load_reference)
+        min_prefix (int): Shortest pincode prefix a lookup may fall back to
+    """
+
+    def __init__(self, reference, min_prefix=DEFAULT_MIN_PREFIX):
+        self.min_prefix = min_prefix
+        self._index = {}
+
+        # One centroid per prefix length; the 6-digit keys are the exact pincodes
+        for length in range(min_prefix, 7):
+            keyed = reference.assign(key=reference['Pincode'].str[:length])
+            centroids = keyed.groupby('key')[['Latitude', 'Longitude']].median()
+            centroids['District'] = most_frequent(keyed, 'key', 'District')
+            centroids['StateName'] = most_frequent(keyed, 'key', 'StateName')
+
+            for key, row in zip(centroids.index, centroids.itertuples(index=False)):
+                self._index[key] = (row.Latitude, row.Longitude, row.District, row.StateName)
+
+    @classmethod
+    def from_file(cls, reference_file=REFERENCE_FILE, min_prefix=DEFAULT_MIN_PREFIX):
+        return cls(load_reference(reference_file), min_prefix=min_prefix)
+
+    def lookup(self, pincode):
+        """
+        Resolve a pincode (full or partial) offline.
+
+        Returns:
+            dict: Same keys as fetch_coordinates.geocode_pincode plus 'match'
+                ('exact' or 'prefix:<digits>'), or None if nothing matches
+        """
+        digits = str(int(pincode))
+        if len(digits) > 6:
+            return None
+
+        # A full pincode: exact entry only, since a prefix centroid would be
+        # cached as if it were exact. Anything shorter is itself a prefix.
+        shortest = 6 if len(digits) == 6 else self.min_prefix
+        for length in range(len(digits), shortest - 1, -1):
+            key = digits[:length]
+            entry = self._index.get(key)
+            if entry is None:
+                continue
+
+            latitude, longitude, district, state = entry
+            exact = length == 6
+            area = digits if exact else f"{key}xxx"[:6]
+            return {
+                'pincode': int(pincode),
+                'latitude': float(latitude),
+                'longitude': float(longitude),
+                'city': district if isinstance(district, str) else None,
+                'state': state if isinstance(state, str) else None,
+                'formatted_address': ', '.join(
+                    str(part) for part in [area, district, state, 'India'] if isinstance(part, str)
+                ),
+                'match': 'exact' if exact else f"prefix:{key}"
+            }
+
+        return None
+
+
+def load_offline_geocoder(reference_file=REFERENCE_FILE, min_prefix=DEFAULT_MIN_PREFIX):
+    """The offline geocoder, or None if the reference file is not available"""
+    if not Path(reference_file).exists():
+        return None
+    return OfflineGeocoder.from_file(reference_file, min_prefix=min_prefix)
+
+
+if __name__ == "__main__":
+    geocoder = load_offline_geocoder()
+    if geocoder is None:
+        sys.exit(f"❌ Reference file '{REFERENCE_FILE}' not found")
+
+    for arg in sys.argv[1:]:
+        result = geocoder.lookup(arg)
+        if result:
+            print(f"{arg}: {result['latitude']:.6f}, {result['longitude']:.6f} "
+                  f"({result['match']}) {result['formatted_address']}")
+        else:
+            print(f"{arg}: ❌ No match")
@@ -0,0 +1,71 @@
+"""
+Rate limiting and retry helpers shared by the Google Maps fetch scripts.
+
+TokenBucket caps the request rate across all worker threads (a single bucket
+is shared by every concurrent call), and call_with_retry retries transient
+failures with exponential backoff and jitter.
+"""
+
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiter.
+
+    Args:
+        rate (float): Tokens added per second (the sustained requests per second)
+        capacity (float): Maximum burst size; defaults to one second's worth of tokens
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` tokens are available, then take them"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                wait = (tokens - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+
+def call_with_retry(func, *args, is_transient=lambda e: True, retries=4, base_delay=1.0, max_delay=30.0, **kwargs):
+    """
+    Call func(*args, **kwargs), retrying transient failures with exponential backoff.
+
+    Args:
+        func (callable): Function to call
+        is_transient (callable): Returns True if an exception is worth retrying
+        retries (int): Maximum number of retries after the first attempt
+        base_delay (float): Delay before the first retry in seconds (doubles each retry)
+        max_delay (float): Upper bound on a single delay in seconds
+
+    Returns:
+        The return value of func
+
+    Raises:
+        The last exception if it is not transient or all retries fail
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries or not is_transient(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.0))
@@ -0,0 +1,188 @@
+"""
+Vectorized great-circle distances and a nearest-point index.
+
+NearestIndex answers "which k hospitals are nearest to each of these pincodes"
+in one batched call. Points are stored as 3D unit vectors, where the largest
+dot product is the smallest great-circle distance, so a chunk of queries
+becomes one matrix product plus a partial sort instead of a Python loop over
+pincodes × hospitals. With a few hundred indexed points this beats a tree;
+chunking keeps memory at chunk_size × points regardless of the number of
+queries.
+
+CatchmentIndex builds on it to assign every point to its nearest remaining
+facility and to keep that assignment up to date as facilities are removed.
+"""
+
+import numpy as np
+
+# Earth's radius in kilometers
+EARTH_RADIUS_KM = 6371
+
+# Queries handled per matrix product
+QUERY_CHUNK_SIZE = 4096
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometers; array arguments broadcast against each other"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype='float64')) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def unit_vectors(lat, lon):
+    """Points on the unit sphere, shape (n, 3)"""
+    lat = np.radians(np.asarray(lat, dtype='float64'))
+    lon = np.radians(np.asarray(lon, dtype='float64'))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+class NearestIndex:
+    """
+    k-nearest lookup over a fixed set of points (e.g. hospitals).
+
+    Args:
+        lat, lon (array-like): Coordinates of the indexed points in degrees
+    """
+
+    def __init__(self, lat, lon):
+        self.lat = np.asarray(lat, dtype='float64')
+        self.lon = np.asarray(lon, dtype='float64')
+        self._xyz = unit_vectors(self.lat, self.lon)
+
+    @classmethod
+    def from_frame(cls, df, lat_column='latitude', lon_column='longitude'):
+        return cls(df[lat_column].to_numpy(), df[lon_column].to_numpy())
+
+    def __len__(self):
+        return len(self.lat)
+
+    def query(self, lat, lon, k=1, chunk_size=QUERY_CHUNK_SIZE):
+        """
+        The k nearest indexed points for every query point.
+
+        Args:
+            lat, lon (array-like): Query coordinates in degrees
+            k (int): Neighbours per query (capped at the number of indexed points)
+            chunk_size (int): Queries per matrix product
+
+        Returns:
+            tuple: (indices, distances_km), both of shape (n_queries, k), nearest first
+        """
+        lat = np.asarray(lat, dtype='float64')
+        lon = np.asarray(lon, dtype='float64')
+        k = min(k, len(self))
+        indices = np.empty((len(lat), k), dtype='int64')
+
+        if k > 0:
+            for start in range(0, len(lat), chunk_size):
+                stop = start + chunk_size
+                similarity = unit_vectors(lat[start:stop], lon[start:stop]) @ self._xyz.T
+
+                # Top k by similarity (unordered), then order those k
+                top = np.argpartition(-similarity, k - 1, axis=1)[:, :k] if k < len(self) else \
+                    np.broadcast_to(np.arange(k), similarity.shape).copy()
+                order = np.argsort(-np.take_along_axis(similarity, top, axis=1), axis=1, kind='stable')
+                indices[start:stop] = np.take_along_axis(top, order, axis=1)
+
+        # Exact distances for the selected pairs only
+        distances = haversine(lat[:, None], lon[:, None], self.lat[indices], self.lon[indices])
+        return indices, distances
+
+
+class CatchmentIndex:
+    """
+    Nearest-facility assignment of points that is updated, not recomputed, on removal.
+
+    Keeps the k nearest facilities of every point. Removing a facility only
+    touches the points assigned to it: each moves on to its next nearest
+    remaining candidate, and only points that have run out of candidates are
+    queried again against the remaining facilities.
+
+    Args:
+        facility_lat, facility_lon (array-like): Facility coordinates (e.g. hospitals)
+        point_lat, point_lon (array-like): Point coordinates (e.g. pincodes)
+        k (int): Candidate facilities kept per point
+    """
+
+    def __init__(self, facility_lat, facility_lon, point_lat, point_lon, k=8):
+        self.facilities = NearestIndex(facility_lat, facility_lon)
+        self.point_lat = np.asarray(point_lat, dtype='float64')
+        self.point_lon = np.asarray(point_lon, dtype='float64')
+        self.k = k
+
+        # One extra, never-active slot marks "no facility" in the candidate table
+        self._sentinel = len(self.facilities)
+        self._active = np.r_[np.ones(len(self.facilities), dtype=bool), False]
+
+        n_points = len(self.point_lat)
+        self.candidates = np.full((n_points, k + 1), self._sentinel, dtype='int64')
+        self.candidate_distances = np.full((n_points, k + 1), np.inf)
+        self.rank = np.zeros(n_points, dtype='int64')  # Column of the current assignment
+        self._fill(np.arange(n_points), np.arange(len(self.facilities)))
+
+    def _fill(self, points, facility_ids):
+        """(Re)load the candidate rows of points from the given facilities"""
+        self.candidates[points] = self._sentinel
+        self.candidate_distances[points] = np.inf
+        self.rank[points] = 0
+        if len(facility_ids) == 0 or len(points) == 0:
+            return
+
+        index = NearestIndex(self.facilities.lat[facility_ids], self.facilities.lon[facility_ids])
+        nearest, distances = index.query(self.point_lat[points], self.point_lon[points], k=self.k)
+        self.candidates[points, :nearest.shape[1]] = facility_ids[nearest]
+        self.candidate_distances[points, :nearest.shape[1]] = distances
+
+    @property
+    def assignment(self):
+        """Facility position assigned to every point (-1 when no facility is left)"""
+        assigned = self.candidates[np.arange(len(self.rank)), self.rank]
+        return np.where(assigned == self._sentinel, -1, assigned)
+
+    @property
+    def distance_km(self):
+        """Distance from every point to its assigned facility (inf when none)"""
+        return self.candidate_distances[np.arange(len(self.rank)), self.rank]
+
+    @property
+    def active(self):
+        return self._active[:-1]
+
+    def remove(self, facility):
+        """
+        Remove one facility and reassign its points.
+
+        Returns:
+            int: Number of points that were reassigned
+        """
+        if not self._active[facility]:
+            return 0
+        self._active[facility] = False
+
+        affected = np.flatnonzero(self.assignment == facility)
+        if len(affected) == 0:
+            return 0
+
+        # Next remaining candidate after the current one, per affected point
+        columns = np.arange(self.candidates.shape[1])
+        usable = self._active[self.candidates[affected]] & (columns > self.rank[affected, None])
+        has_next = usable.any(axis=1)
+        self.rank[affected[has_next]] = usable[has_next].argmax(axis=1)
+
+        # Points whose k candidates are all gone need a fresh query
+        self._fill(affected[~has_next], np.flatnonzero(self.active))
+        return len(affected)
+
+    def loads(self, weights=None, points=None):
+        """
+        Total weight (or number of points) assigned to every facility.
+
+        Args:
+            weights (array-like): Weight per point in points (default 1 each)
+            points (array-like): Point positions to count (default all points)
+        """
+        assigned = self.assignment if points is None else self.assignment[points]
+        valid = assigned >= 0
+        if weights is not None:
+            weights = np.asarray(weights, dtype='float64')[valid]
+        return np.bincount(assigned[valid], weights=weights, minlength=len(self.facilities))
@@ -1,8 +1,32 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import folium
-from folium.plugins import MarkerCluster, HeatMap
-from streamlit_folium import st_folium
+from folium.plugins import MarkerCluster
+import streamlit.components.v1 as components
+
+from aggregates import build_pincode_cube, build_pincode_locations, fold_pincode_aggregates, summarize_cube
+from data_loader import DATASET_DIR, apply_schema, clean_patient_types, iter_partitions, memory_report, read_source_csv
+from heat_tiles import heat_tile_layer, static_heat_tiles
+from hexbin import HEX_RESOLUTIONS, aggregate_hexes, hex_mapping, hexbin_layer
+from map_layers import HeatDataLayer, PopupLookup, cluster_icon_function, heat_data, prerender
+from spatial_index import CatchmentIndex, NearestIndex
+
+# Partitioned surgery dataset (python merge_addresses.py BlrSurgeryOnly.csv --no-csv --dataset datasets/surgery)
+SURGERY_DATASET = DATASET_DIR / 'surgery'
+
+# Maximum number of rendered maps kept in the map cache
+MAP_CACHE_SIZE = 32
+
+# Distance (km) counted as "close to care" in the distance metrics
+NEAR_CARE_KM = 5
+
+# Nearest hospitals kept per pincode by the catchment index
+CATCHMENT_CANDIDATES = 8
+
+# Colors cycled over hospitals in the catchment view
+CATCHMENT_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+                    '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
 
 # Page config
 st.set_page_config(
@@ -15,8 +39,8 @@ st.set_page_config(
 @st.cache_data
 def load_data():
     """Load and prepare the surgery data"""
-    # Load the surgery data
-    surgery_df = pd.read_csv('BlrSurgeryOnly.csv')
+    # Load the surgery data (only the columns the dashboard uses)
+    surgery_df = read_source_csv('BlrSurgeryOnly.csv')
 
     # Load Google Maps pincode coordinates
     pincode_coords = pd.read_csv('pincode_coordinates_google.csv')
@@ -30,7 +54,7 @@ def load_data():
     surgery_df['Year'] = surgery_df['RegistrationDate'].dt.year
 
     # Clean patient type - handle variations
-    surgery_df['BSM_MINOR_CD'] = surgery_df['BSM_MINOR_CD'].fillna('Unknown').astype(str).str.strip()
+    surgery_df['BSM_MINOR_CD'] = clean_patient_types(surgery_df['BSM_MINOR_CD'])
 
     # Merge with Google Maps coordinates
     merged_df = surgery_df.merge(
@@ -53,7 +77,24 @@ def load_data():
     # Drop rows without coordinates
     merged_df = merged_df.dropna(subset=['Latitude', 'Longitude'])
 
-    return merged_df
+    # Compact dtypes (int32 pincode, int16 year, categorical text, float32 coordinates)
+    return apply_schema(merged_df)
+
+def iter_surgery_partitions():
+    """Surgery rows one dataset partition at a time, with patient types cleaned as in load_data"""
+    for df in iter_partitions(SURGERY_DATASET, extra_columns=['BSM_MINOR_CD']):
+        df['BSM_MINOR_CD'] = clean_patient_types(df['BSM_MINOR_CD']).astype('category')
+        yield df
+
+@st.cache_data
+def load_cube():
+    """Pre-aggregate patient counts per pincode, year and patient type"""
+    if SURGERY_DATASET.exists():
+        # Fold the partitions into the cube one at a time instead of loading every row
+        return fold_pincode_aggregates(iter_surgery_partitions(), ['Year', 'BSM_MINOR_CD'])
+
+    df = load_data()
+    return build_pincode_cube(df, ['Year', 'BSM_MINOR_CD']), build_pincode_locations(df)
 
 @st.cache_data
 def load_hospitals():
@@ -65,261 +106,216 @@ def load_hospitals():
     except FileNotFoundError:
         return pd.DataFrame()  # Return empty dataframe if file not found
 
-# Load data
-st.title("🏥 Surgery Type Distribution Heatmap Dashboard")
-st.markdown("Interactive visualization of surgical patients across Bangalore by patient type")
-
-with st.spinner("Loading data..."):
-    df = load_data()
-
-# Sidebar filters
-st.sidebar.header("🔍 Filters")
-
-# Get unique patient types and create user-friendly labels
-patient_types = sorted(df['BSM_MINOR_CD'].unique())
-patient_type_labels = {
-    '0': '📋 OPD (Outpatient)',
-    'CAT': '🏥 CATLAC Surgery',
-    'LSK': '👁️ LASIK Surgery',
-    'IP Others': '🔧 IP Others',
-    'LRC': '🔬 LRC',
-    'Unknown': '❓ Unknown'
-}
-
-# Create patient type filter
-patient_type_options = ['All Patient Types'] + patient_types
-selected_patient_type = st.sidebar.selectbox(
-    "Select Patient Type",
-    patient_type_options,
-    format_func=lambda x: patient_type_labels.get(x, x) if x != 'All Patient Types' else x
-)
-
-# Year filter
-years = sorted(df['Year'].dropna().unique())
-year_options = ['All Years'] + [int(year) for year in years]
-selected_year = st.sidebar.selectbox("Select Year", year_options)
-
-# Visualization type
-viz_type = st.sidebar.radio(
-    "Visualization Type",
-    ["Clustered Markers", "Heatmap", "Both"]
-)
-
-# Display mode toggle
-display_mode = st.sidebar.radio(
-    "Display Mode",
-    ["Absolute Count", "Percentage"]
-)
-
-# Load hospitals data early
-hospitals = load_hospitals()
-
-# Hospital settings
-st.sidebar.markdown("---")
-st.sidebar.markdown("### 👁️ Eye Hospitals")
-
-# Toggle to show/hide hospitals
-show_hospitals = st.sidebar.checkbox(
-    "Show Eye Hospitals on Map",
-    value=True if not hospitals.empty else False,
-    help="Toggle to display eye hospitals with 100+ reviews"
-)
-
-if show_hospitals and not hospitals.empty:
-    st.sidebar.markdown("**Hospital Filters:**")
-
-    # Hospital rating filter
-    hospital_min_rating = st.sidebar.slider(
-        "Minimum Hospital Rating",
-        min_value=0.0,
-        max_value=5.0,
-        value=4.0,
-        step=0.1,
-        key="hospital_rating"
-    )
-
-    # Hospital review count filter
-    hospital_min_reviews = st.sidebar.slider(
-        "Minimum Hospital Reviews",
-        min_value=int(hospitals['review_count'].min()),
-        max_value=int(hospitals['review_count'].max()),
-        value=500,
-        step=100,
-        key="hospital_reviews"
+@st.cache_data
+def get_pincode_summary(selected_year, selected_patient_type):
+    """Slice the pre-aggregated cube for the selected filters and sum counts per pincode"""
+    cube, pincode_locations = load_cube()
+    return summarize_cube(
+        cube,
+        pincode_locations,
+        'patient_count',
+        {
+            'BSM_MINOR_CD': selected_patient_type if selected_patient_type != 'All Patient Types' else None,
+            'Year': selected_year if selected_year != 'All Years' else None
+        },
+        mode_columns=['BSM_MINOR_CD']  # Most common patient type per pincode
     )
 
-    # Excluded hospitals (removed hospitals)
-    if 'excluded_hospitals' not in st.session_state:
-        st.session_state.excluded_hospitals = set()
-
-    # Show count of available hospitals
-    filtered_hospital_count = len(hospitals[
-        (hospitals['rating'] >= hospital_min_rating) &
-        (hospitals['review_count'] >= hospital_min_reviews)
-    ])
-    st.sidebar.markdown(f"**Available hospitals:** {filtered_hospital_count}/{len(hospitals)}")
-
-    # Show removed hospitals count
-    if st.session_state.excluded_hospitals:
-        st.sidebar.markdown(f"**Removed hospitals:** {len(st.session_state.excluded_hospitals)}")
-else:
-    st.sidebar.info("No hospital data available")
-    show_hospitals = False
-    # Set default values for hospital filters
-    hospital_min_rating = 4.0
-    hospital_min_reviews = 500
-
-# Apply filters
-filtered_df = df.copy()
-
-if selected_patient_type != 'All Patient Types':
-    filtered_df = filtered_df[filtered_df['BSM_MINOR_CD'] == selected_patient_type]
-
-if selected_year != 'All Years':
-    filtered_df = filtered_df[filtered_df['Year'] == selected_year]
-
-# Aggregate data by pincode
-pincode_counts = filtered_df.groupby('CPA_PIN_CODE').size().reset_index(name='patient_count')
-
-# For each pincode, get representative location and most common city/state
-pincode_locations = filtered_df.groupby('CPA_PIN_CODE').agg({
-    'Latitude': 'median',
-    'Longitude': 'median',
-    'CPA_ADDR_CITY': lambda x: x.mode()[0] if len(x.mode()) > 0 else x.iloc[0],
-    'StateName': lambda x: x.mode()[0] if len(x.mode()) > 0 else x.iloc[0],
-    'BSM_MINOR_CD': lambda x: x.mode()[0] if len(x.mode()) > 0 else x.iloc[0]  # Get the patient type
-}).reset_index()
-
-# Merge counts with locations
-pincode_summary = pincode_counts.merge(pincode_locations, on='CPA_PIN_CODE')
-
-# Calculate percentage of total patients
-total_patients = len(filtered_df)
-pincode_summary['percentage'] = (pincode_summary['patient_count'] / total_patients * 100)
-pincode_summary = pincode_summary.sort_values('patient_count', ascending=False)
-
-# Display statistics
-col1, col2, col3, col4 = st.columns(4)
-with col1:
-    st.metric("Total Patients", f"{len(filtered_df):,}")
-with col2:
-    st.metric("Unique Pincodes", f"{len(pincode_summary):,}")
-with col3:
-    st.metric("Average per Pincode", f"{pincode_summary['patient_count'].mean():.1f}")
-with col4:
-    st.metric("Max at One Pincode", f"{pincode_summary['patient_count'].max():,}")
-
-# Display patient type breakdown if showing all types
-if selected_patient_type == 'All Patient Types':
-    st.subheader("📊 Patient Type Breakdown")
-    type_breakdown = df.groupby('BSM_MINOR_CD').size().reset_index(name='count')
-    type_breakdown['percentage'] = (type_breakdown['count'] / len(df) * 100).round(1)
-    type_breakdown = type_breakdown.sort_values('count', ascending=False)
-
-    # Create columns for breakdown display
-    cols = st.columns(len(type_breakdown))
-    for col, (idx, row) in zip(cols, type_breakdown.iterrows()):
-        with col:
-            st.metric(
-                patient_type_labels.get(row['BSM_MINOR_CD'], row['BSM_MINOR_CD']),
-                f"{row['count']:,}",
-                f"{row['percentage']:.1f}%"
-            )
-
-# Calculate map center
-if len(pincode_summary) > 0:
-    center_lat = pincode_summary['Latitude'].mean()
-    center_lon = pincode_summary['Longitude'].mean()
-else:
-    center_lat = 12.9716  # Default to Bangalore
-    center_lon = 77.5946
+def filter_hospitals(hospitals, min_rating, min_reviews, excluded_hospitals):
+    """Hospitals passing the rating/review filters, without the removed ones"""
+    filtered_hospitals = hospitals[
+        (hospitals['rating'] >= min_rating) &
+        (hospitals['review_count'] >= min_reviews)
+    ]
+    return filtered_hospitals[~filtered_hospitals['name'].isin(excluded_hospitals)]
 
-# Create map
-st.subheader("🗺️ Map Visualization")
+@st.cache_data
+def get_nearest_hospitals(hospital_min_rating, hospital_min_reviews, excluded_hospitals):
+    """
+    Nearest filtered hospital and its distance for every pincode.
+
+    Depends only on the hospital filters (not on year/patient type), so one
+    batched index query covers every patient filter combination.
+    """
+    _, pincode_locations = load_cube()
+    hospitals = filter_hospitals(load_hospitals(), hospital_min_rating, hospital_min_reviews, excluded_hospitals)
+
+    nearest = pd.DataFrame(index=pd.Index(pincode_locations['CPA_PIN_CODE'], name='CPA_PIN_CODE'))
+    if hospitals.empty:
+        nearest['nearest_hospital'] = None
+        nearest['distance_km'] = float('nan')
+        return nearest
+
+    index = NearestIndex.from_frame(hospitals)
+    hospital_idx, distance = index.query(pincode_locations['Latitude'], pincode_locations['Longitude'], k=1)
+    nearest['nearest_hospital'] = hospitals['name'].to_numpy()[hospital_idx[:, 0]]
+    nearest['distance_km'] = distance[:, 0]
+    return nearest
+
+def with_nearest_hospitals(pincode_summary, nearest_hospitals):
+    """Attach the nearest hospital and distance columns to a pincode summary"""
+    return pincode_summary.join(nearest_hospitals, on='CPA_PIN_CODE')
 
-# Create base map
-m = folium.Map(
-    location=[center_lat, center_lon],
-    zoom_start=11,
-    tiles='OpenStreetMap',
-    control_scale=True
-)
+@st.cache_data
+def get_catchment_base(hospital_min_rating, hospital_min_reviews):
+    """Catchment index of every pincode over the slider-filtered hospitals, before removals"""
+    _, pincode_locations = load_cube()
+    hospitals = filter_hospitals(load_hospitals(), hospital_min_rating, hospital_min_reviews, ()).reset_index(drop=True)
+    catchment = CatchmentIndex(
+        hospitals['latitude'], hospitals['longitude'],
+        pincode_locations['Latitude'], pincode_locations['Longitude'],
+        k=CATCHMENT_CANDIDATES
+    )
+    return hospitals, catchment
+
+def get_catchment(hospital_min_rating, hospital_min_reviews, excluded_hospitals):
+    """
+    Catchment index for the hospital filters with the removed hospitals taken out.
+
+    Kept in the session: removing a hospital only reassigns that hospital's
+    pincodes in the existing index. A slider change (or a hospital coming
+    back) starts again from the cached base index.
+    """
+    key = (hospital_min_rating, hospital_min_reviews)
+    excluded = set(excluded_hospitals)
+    state = st.session_state.get('catchment')
+
+    if state is None or state['key'] != key or not state['excluded'] <= excluded:
+        hospitals, catchment = get_catchment_base(*key)
+        state = {'key': key, 'excluded': set(), 'hospitals': hospitals, 'catchment': catchment}
+        st.session_state['catchment'] = state
+
+    hospitals, catchment = state['hospitals'], state['catchment']
+    for name in excluded - state['excluded']:
+        for position in np.flatnonzero(hospitals['name'].to_numpy() == name):
+            catchment.remove(position)
+    state['excluded'] = excluded
+
+    return hospitals, catchment
+
+def catchment_points(pincode_summary):
+    """Positions of the summary's pincodes in the catchment index (which covers all pincodes)"""
+    _, pincode_locations = load_cube()
+    position = pd.Series(np.arange(len(pincode_locations)), index=pincode_locations['CPA_PIN_CODE'])
+    return position.loc[pincode_summary['CPA_PIN_CODE']].to_numpy()
+
+def summarize_catchment(pincode_summary, hospitals, catchment):
+    """Patients and pincodes assigned to every remaining hospital, with their mean distance"""
+    points = catchment_points(pincode_summary)
+    counts = pincode_summary['patient_count'].to_numpy()
+    distances = catchment.distance_km[points]
+
+    patients = catchment.loads(counts, points)
+    distance_sum = catchment.loads(counts * np.where(np.isfinite(distances), distances, 0), points)
+
+    catchment_load = hospitals[['name', 'latitude', 'longitude', 'rating', 'review_count']].assign(
+        patients=patients.astype('int64'),
+        pincodes=catchment.loads(points=points).astype('int64'),
+        avg_distance_km=np.divide(distance_sum, patients, out=np.full(len(patients), np.nan), where=patients > 0)
+    )[catchment.active]
+    catchment_load['percentage'] = catchment_load['patients'] / max(catchment_load['patients'].sum(), 1) * 100
+    return catchment_load.sort_values('patients', ascending=False)
+
+def catchment_layer(pincode_summary, hospitals, assignment, distance_km, catchment_load):
+    """
+    Pincodes colored by their assigned hospital, spokes to it, and hospital circles sized by load.
+
+    assignment and distance_km are the catchment index arrays over every pincode
+    (CatchmentIndex.assignment / distance_km), not just the summary's.
+    """
+    points = catchment_points(pincode_summary)
+    assigned = assignment[points]
+    distances = distance_km[points]
+    colors = np.array(CATCHMENT_COLORS)[np.arange(len(hospitals)) % len(CATCHMENT_COLORS)]
+    names = hospitals['name'].to_numpy()
+    lats = pincode_summary['Latitude'].to_numpy()
+    lons = pincode_summary['Longitude'].to_numpy()
+    counts = pincode_summary['patient_count'].to_numpy()
+    pincodes = pincode_summary['CPA_PIN_CODE'].to_numpy()
+
+    catchment_group = folium.FeatureGroup(name='Hospital Catchments', show=True)
+
+    # One multi-line per hospital from its pincodes to the hospital
+    spokes = []
+    for hospital in np.unique(assigned[assigned >= 0]):
+        mask = assigned == hospital
+        hospital_lonlat = [float(hospitals['longitude'].iat[hospital]), float(hospitals['latitude'].iat[hospital])]
+        spokes.append({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'MultiLineString',
+                'coordinates': [[[float(lon), float(lat)], hospital_lonlat] for lat, lon in zip(lats[mask], lons[mask])]
+            },
+            'properties': {'color': colors[hospital]}
+        })
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': spokes},
+        style_function=lambda feature: {'color': feature['properties']['color'], 'weight': 1, 'opacity': 0.5}
+    ).add_to(catchment_group)
+
+    # Pincodes as one GeoJSON layer, colored by their hospital
+    pincode_features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [float(lons[i]), float(lats[i])]},
+            'properties': {
+                'pincode': int(pincodes[i]),
+                'patients': int(counts[i]),
+                'hospital': names[assigned[i]] if assigned[i] >= 0 else 'None',
+                'distance': f"{distances[i]:.1f} km" if assigned[i] >= 0 else '-',
+                'color': colors[assigned[i]] if assigned[i] >= 0 else '#7f7f7f'
+            }
+        }
+        for i in range(len(pincode_summary))
+    ]
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': pincode_features},
+        marker=folium.CircleMarker(radius=5, fill=True, fill_opacity=0.8, weight=1),
+        style_function=lambda feature: {'color': feature['properties']['color'], 'fillColor': feature['properties']['color']},
+        tooltip=folium.GeoJsonTooltip(
+            fields=['pincode', 'patients', 'hospital', 'distance'],
+            aliases=['Pincode', 'Patients', 'Nearest Hospital', 'Distance']
+        )
+    ).add_to(catchment_group)
 
-# Define colors for patient types
-type_colors = {
-    '0': '#1f77b4',        # Blue for OPD
-    'CAT': '#ff7f0e',      # Orange for CATLAC
-    'LSK': '#2ca02c',      # Green for LASIK
-    'IP Others': '#d62728', # Red for IP Others
-    'LRC': '#9467bd',      # Purple for LRC
-    'Unknown': '#7f7f7f'   # Gray for Unknown
-}
+    # Hospitals sized by the patients in their catchment
+    max_patients = max(int(catchment_load['patients'].max()), 1) if not catchment_load.empty else 1
+    for position, hospital in catchment_load[catchment_load['patients'] > 0].iterrows():
+        folium.CircleMarker(
+            location=[hospital['latitude'], hospital['longitude']],
+            radius=6 + 24 * np.sqrt(hospital['patients'] / max_patients),
+            color=colors[position],
+            fill=True,
+            fillColor=colors[position],
+            fillOpacity=0.35,
+            weight=2,
+            tooltip=(f"👁️ {hospital['name']}: {hospital['patients']:,} patients ({hospital['percentage']:.1f}%) "
+                     f"from {hospital['pincodes']} pincodes, avg {hospital['avg_distance_km']:.1f} km")
+        ).add_to(catchment_group)
+
+    return catchment_group
+
+# Define color based on hospital rating
+def get_hospital_color(rating):
+    """Get marker color based on rating"""
+    if rating >= 4.6:
+        return "darkgreen"  # Excellent
+    elif rating >= 4.4:
+        return "green"  # Very Good
+    elif rating >= 4.2:
+        return "blue"  # Good
+    else:
+        return "orange"  # Fair
 
-# Add markers with clustering
-if viz_type in ["Clustered Markers", "Both"]:
+@st.cache_data(max_entries=MAP_CACHE_SIZE)
+def render_marker_layer(selected_year, selected_patient_type, display_mode):
+    """Clustered patient markers for the patient filters, rendered once (see map_layers.prerender)"""
+    pincode_summary = get_pincode_summary(selected_year, selected_patient_type)
+    total_patients = int(pincode_summary['patient_count'].sum())
     is_percentage_mode = display_mode == "Percentage"
 
     # Custom cluster function
-    if is_percentage_mode:
-        icon_create_function = f"""
-        function(cluster) {{
-            var markers = cluster.getAllChildMarkers();
-            var sumCount = 0;
-            var sumPct = 0;
-            var totalPatients = {total_patients};
-            for (var i = 0; i < markers.length; i++) {{
-                if (markers[i].options.customCount) {{
-                    sumCount += markers[i].options.customCount;
-                }}
-                if (markers[i].options.customPercentage) {{
-                    sumPct += markers[i].options.customPercentage;
-                }}
-            }}
-
-            var displayText = sumPct < 1 ? '<1%' : sumPct.toFixed(1) + '%';
-
-            var size = 'small';
-            if (sumPct >= 10) size = 'large';
-            else if (sumPct >= 5) size = 'medium';
-
-            var color = 'lightblue';
-            if (sumPct >= 10) color = 'red';
-            else if (sumPct >= 5) color = 'orange';
-            else if (sumPct >= 1) color = 'lightgreen';
-
-            return L.divIcon({{
-                html: '<div style="background-color:' + color + '; border-radius: 50%; text-align: center; color: black; font-weight: bold; border: 3px solid white; box-shadow: 0 0 10px rgba(0,0,0,0.5);"><span>' + displayText + '</span></div>',
-                className: 'marker-cluster marker-cluster-' + size,
-                iconSize: new L.Point(40, 40)
-            }});
-        }}
-        """
-    else:
-        icon_create_function = """
-        function(cluster) {
-            var markers = cluster.getAllChildMarkers();
-            var sum = 0;
-            for (var i = 0; i < markers.length; i++) {
-                if (markers[i].options.customCount) {
-                    sum += markers[i].options.customCount;
-                }
-            }
-            var size = 'small';
-            if (sum >= 5000) size = 'large';
-            else if (sum >= 1000) size = 'medium';
-
-            var color = 'lightblue';
-            if (sum > 1000) color = 'red';
-            else if (sum > 500) color = 'orange';
-            else if (sum >= 100) color = 'lightgreen';
-
-            return L.divIcon({
-                html: '<div style="background-color:' + color + '; border-radius: 50%; text-align: center; color: black; font-weight: bold; border: 3px solid white; box-shadow: 0 0 10px rgba(0,0,0,0.5);"><span>' + sum + '</span></div>',
-                className: 'marker-cluster marker-cluster-' + size,
-                iconSize: new L.Point(40, 40)
-            });
-        }
-        """
+    icon_create_function = cluster_icon_function(is_percentage_mode, total_patients)
 
     marker_cluster = MarkerCluster(
         name="Patient Locations",
@@ -344,6 +340,7 @@ if viz_type in ["Clustered Markers", "Both"]:
             <b>State:</b> {row['StateName']}<br>
             <b>Patients:</b> <span style="color: #d62728; font-weight: bold;">{row['patient_count']}</span><br>
             <b>Percentage:</b> <span style="color: #d62728; font-weight: bold;">{pct_display}</span><br>
+            <span class="nearest-hospital" data-key="{int(row['CPA_PIN_CODE'])}"></span>
             <b>Coordinates:</b> {row['Latitude']:.4f}, {row['Longitude']:.4f}
         </div>
         """
@@ -400,17 +397,37 @@ if viz_type in ["Clustered Markers", "Both"]:
         marker.options['customPercentage'] = float(row['percentage'])
         marker.add_to(marker_cluster)
 
-    marker_cluster.add_to(m)
+    return prerender(marker_cluster)
 
-# Add heatmap layer
-if viz_type in ["Heatmap", "Both"]:
-    heat_data = [
-        [row['Latitude'], row['Longitude'], row['patient_count']]
-        for _, row in pincode_summary.iterrows()
-    ]
+def get_heat_tiles(selected_year, selected_patient_type):
+    """
+    URL template of the server-rendered heatmap tiles for the patient filters.
+
+    Not cached: the tiles may have been evicted from disk while a cached map
+    still points at them, so every run checks them (and re-renders them if needed).
+    """
+    pincode_summary = get_pincode_summary(selected_year, selected_patient_type)
+    return static_heat_tiles(
+        pincode_summary['Latitude'].to_numpy(),
+        pincode_summary['Longitude'].to_numpy(),
+        pincode_summary['patient_count'].to_numpy()
+    )
+
+@st.cache_data(max_entries=MAP_CACHE_SIZE)
+def render_heatmap_layer(selected_year, selected_patient_type, heat_tile_url):
+    """Patient heatmap for the patient filters, rendered once (as the given PNG tiles when heat_tile_url is set)"""
+    if heat_tile_url:
+        return prerender(heat_tile_layer(heat_tile_url, name="Heatmap"))
+
+    pincode_summary = get_pincode_summary(selected_year, selected_patient_type)
+    points = heat_data(
+        pincode_summary['Latitude'].to_numpy(),
+        pincode_summary['Longitude'].to_numpy(),
+        pincode_summary['patient_count'].to_numpy()
+    )
 
-    HeatMap(
-        heat_data,
+    return prerender(HeatDataLayer(
+        points,
         name="Heatmap",
         min_opacity=0.3,
         max_zoom=18,
@@ -422,36 +439,32 @@ if viz_type in ["Heatmap", "Both"]:
             0.7: 'yellow',
             1.0: 'red'
         }
-    ).add_to(m)
+    ))
 
-# Add hospital markers
-if show_hospitals and not hospitals.empty:
-    # Filter hospitals by rating and review count
-    filtered_hospitals = hospitals[
-        (hospitals['rating'] >= hospital_min_rating) &
-        (hospitals['review_count'] >= hospital_min_reviews)
-    ].copy()
-
-    # Remove excluded hospitals
-    filtered_hospitals = filtered_hospitals[
-        ~filtered_hospitals['name'].isin(st.session_state.excluded_hospitals)
-    ]
+@st.cache_data
+def get_hex_mapping(hex_width):
+    """Pincode -> hexagon mapping at one resolution, shared by every filter"""
+    _, pincode_locations = load_cube()
+    return hex_mapping(pincode_locations, hex_width)
+
+@st.cache_data(max_entries=MAP_CACHE_SIZE)
+def render_hexbin_layer(selected_year, selected_patient_type, hex_width, display_mode):
+    """Patients summed into equal-area hexagons for the patient filters, rendered once"""
+    pincode_summary = get_pincode_summary(selected_year, selected_patient_type)
+    hexes = aggregate_hexes(pincode_summary, get_hex_mapping(hex_width), 'patient_count')
+    return prerender(hexbin_layer(hexes, hex_width, 'patient_count', 'patients', display_mode == "Percentage"))
+
+@st.cache_data(max_entries=MAP_CACHE_SIZE)
+def render_hospital_layer(hospital_min_rating, hospital_min_reviews, excluded_hospitals):
+    """Hospital markers for the hospital filters, rendered once"""
+    # Filter hospitals by rating and review count, without the removed ones
+    filtered_hospitals = filter_hospitals(
+        load_hospitals(), hospital_min_rating, hospital_min_reviews, excluded_hospitals
+    )
 
     # Create hospital marker group
     hospital_group = folium.FeatureGroup(name='Eye Hospitals', show=True)
 
-    # Define color based on hospital rating
-    def get_hospital_color(rating):
-        """Get marker color based on rating"""
-        if rating >= 4.6:
-            return "darkgreen"  # Excellent
-        elif rating >= 4.4:
-            return "green"  # Very Good
-        elif rating >= 4.2:
-            return "blue"  # Good
-        else:
-            return "orange"  # Fair
-
     # Add hospital markers
     for idx, hospital in filtered_hospitals.iterrows():
         color = get_hospital_color(hospital['rating'])
@@ -487,71 +500,372 @@ if show_hospitals and not hospitals.empty:
             tooltip=f"👁️ {hospital['name']} ({hospital['rating']} ⭐)"
         ).add_to(hospital_group)
 
-    hospital_group.add_to(m)
+    return prerender(hospital_group)
+
+@st.cache_data(max_entries=MAP_CACHE_SIZE)
+def render_catchment_layer(selected_year, selected_patient_type, catchment_view):
+    """
+    Catchment layer for the patient filters and a catchment_view, rendered once.
+
+    catchment_view is (hospitals, assignment, distance_km, catchment_load),
+    computed by the caller from the session's catchment index (see get_catchment),
+    so this cached function never reads or changes the session state.
+    """
+    pincode_summary = get_pincode_summary(selected_year, selected_patient_type)
+    return prerender(catchment_layer(pincode_summary, *catchment_view))
+
+def nearest_hospital_popups(nearest_hospitals):
+    """Nearest-hospital line of every pincode popup, keyed by pincode"""
+    nearest_hospitals = nearest_hospitals.dropna(subset=['distance_km'])
+    return {
+        int(pincode): f"<b>Nearest Hospital:</b> {name} ({distance:.1f} km)<br>"
+        for pincode, name, distance in zip(
+            nearest_hospitals.index, nearest_hospitals['nearest_hospital'], nearest_hospitals['distance_km']
+        )
+    }
+
+@st.cache_data(max_entries=MAP_CACHE_SIZE)
+def build_map_html(selected_year, selected_patient_type, viz_type, display_mode, heat_tile_url, hex_width,
+                   show_hospitals, hospital_min_rating, hospital_min_reviews, excluded_hospitals, catchment_view):
+    """
+    Build the folium map for one filter state and return it serialized to HTML.
+
+    Cached by every argument (excluded_hospitals is passed as a sorted tuple), so
+    revisiting a filter combination skips rebuilding the map and its markers. The
+    cache holds at most MAP_CACHE_SIZE maps and evicts the least recently used.
+
+    On a miss the map is assembled from layers cached by only the filters they
+    depend on: patient layers by year/patient type, hospital layers by the
+    hospital filters. Removing or restoring a hospital therefore re-renders only
+    the hospital layer; the patient popups pick up their nearest hospital from a
+    PopupLookup table instead of being rebuilt.
+
+    heat_tile_url is the server-rendered heatmap (None for the browser heatmap);
+    it comes from get_heat_tiles, which the caller runs on every rerun so the
+    tiles behind a cached map are never missing. catchment_view is the catchment
+    assignment for the "Catchment" view (see render_catchment_layer), else None.
+    """
+    pincode_summary = get_pincode_summary(selected_year, selected_patient_type)
+
+    # Calculate map center
+    if len(pincode_summary) > 0:
+        center_lat = pincode_summary['Latitude'].mean()
+        center_lon = pincode_summary['Longitude'].mean()
+    else:
+        center_lat = 12.9716  # Default to Bangalore
+        center_lon = 77.5946
+
+    # Create base map
+    m = folium.Map(
+        location=[center_lat, center_lon],
+        zoom_start=11,
+        tiles='OpenStreetMap',
+        control_scale=True
+    )
 
-# Add layer control
-folium.LayerControl().add_to(m)
+    # Add markers with clustering
+    if viz_type in ["Clustered Markers", "Both"]:
+        render_marker_layer(selected_year, selected_patient_type, display_mode).add_to(m)
 
-# Display map
-st_folium(m, width=1400, height=600)
+    # Add heatmap layer
+    if viz_type in ["Heatmap", "Both"]:
+        render_heatmap_layer(selected_year, selected_patient_type, heat_tile_url).add_to(m)
+
+    # Add hexbin layer
+    if viz_type == "Hexbin":
+        render_hexbin_layer(selected_year, selected_patient_type, hex_width, display_mode).add_to(m)
+
+    # Add catchment layer (every pincode's patients assigned to its nearest remaining hospital)
+    if catchment_view is not None:
+        render_catchment_layer(selected_year, selected_patient_type, catchment_view).add_to(m)
+
+    # Add hospital markers and the nearest-hospital line of the patient popups
+    if show_hospitals:
+        nearest_hospitals = get_nearest_hospitals(hospital_min_rating, hospital_min_reviews, excluded_hospitals)
+        PopupLookup(nearest_hospital_popups(nearest_hospitals), 'nearest-hospital').add_to(m)
+        render_hospital_layer(hospital_min_rating, hospital_min_reviews, excluded_hospitals).add_to(m)
+
+    # Add layer control
+    folium.LayerControl().add_to(m)
+
+    return m.get_root().render()
+
+# Load data
+st.title("🏥 Surgery Type Distribution Heatmap Dashboard")
+st.markdown("Interactive visualization of surgical patients across Bangalore by patient type")
+
+with st.spinner("Loading data..."):
+    cube, pincode_locations = load_cube()
+
+# Sidebar filters
+st.sidebar.header("🔍 Filters")
+
+# Get unique patient types and create user-friendly labels
+patient_types = sorted(cube['BSM_MINOR_CD'].unique())
+patient_type_labels = {
+    '0': '📋 OPD (Outpatient)',
+    'CAT': '🏥 CATLAC Surgery',
+    'LSK': '👁️ LASIK Surgery',
+    'IP Others': '🔧 IP Others',
+    'LRC': '🔬 LRC',
+    'Unknown': '❓ Unknown'
+}
+
+# Create patient type filter
+patient_type_options = ['All Patient Types'] + patient_types
+selected_patient_type = st.sidebar.selectbox(
+    "Select Patient Type",
+    patient_type_options,
+    format_func=lambda x: patient_type_labels.get(x, x) if x != 'All Patient Types' else x
+)
+
+# Year filter
+years = sorted(cube['Year'].dropna().unique())
+year_options = ['All Years'] + [int(year) for year in years]
+selected_year = st.sidebar.selectbox("Select Year", year_options)
+
+# Visualization type
+viz_type = st.sidebar.radio(
+    "Visualization Type",
+    ["Clustered Markers", "Heatmap", "Both", "Hexbin", "Catchment"],
+    help="Hexbin sums the pincodes into equal-area hexagons, so dense areas can be compared fairly. "
+         "Catchment assigns every pincode's patients to its nearest hospital passing the hospital filters"
+)
+
+# Hexagon size for the hexbin view
+hex_width = None
+if viz_type == "Hexbin":
+    hex_resolution = st.sidebar.select_slider("Hexagon Size", list(HEX_RESOLUTIONS), value="Fine (4 km)")
+    hex_width = HEX_RESOLUTIONS[hex_resolution]
+
+# Display mode toggle
+display_mode = st.sidebar.radio(
+    "Display Mode",
+    ["Absolute Count", "Percentage"]
+)
+
+# Heatmap rendering mode
+heatmap_rendering = st.sidebar.radio(
+    "Heatmap Rendering",
+    ["Browser (Leaflet.heat)", "Server Tiles"],
+    help="Browser mode sends every point and recomputes the heatmap on each pan and zoom. "
+         "Server tiles are rendered once per filter as PNG images, so the browser cost "
+         "does not grow with the number of points"
+)
+
+# Load hospitals data early
+hospitals = load_hospitals()
+
+# Hospital settings
+st.sidebar.markdown("---")
+st.sidebar.markdown("### 👁️ Eye Hospitals")
+
+# Toggle to show/hide hospitals
+show_hospitals = st.sidebar.checkbox(
+    "Show Eye Hospitals on Map",
+    value=True if not hospitals.empty else False,
+    help="Toggle to display eye hospitals with 100+ reviews"
+)
 
-# Hospital management section
 if show_hospitals and not hospitals.empty:
-    st.subheader("👁️ Hospital Management")
+    st.sidebar.markdown("**Hospital Filters:**")
+
+    # Hospital rating filter
+    hospital_min_rating = st.sidebar.slider(
+        "Minimum Hospital Rating",
+        min_value=0.0,
+        max_value=5.0,
+        value=4.0,
+        step=0.1,
+        key="hospital_rating"
+    )
+
+    # Hospital review count filter
+    hospital_min_reviews = st.sidebar.slider(
+        "Minimum Hospital Reviews",
+        min_value=int(hospitals['review_count'].min()),
+        max_value=int(hospitals['review_count'].max()),
+        value=500,
+        step=100,
+        key="hospital_reviews"
+    )
 
-    # Filter hospitals for display
-    filtered_hospitals_display = hospitals[
+    # Excluded hospitals (removed hospitals)
+    if 'excluded_hospitals' not in st.session_state:
+        st.session_state.excluded_hospitals = set()
+
+    # Show count of available hospitals
+    filtered_hospital_count = len(hospitals[
         (hospitals['rating'] >= hospital_min_rating) &
         (hospitals['review_count'] >= hospital_min_reviews)
-    ].copy()
+    ])
+    st.sidebar.markdown(f"**Available hospitals:** {filtered_hospital_count}/{len(hospitals)}")
 
-    filtered_hospitals_display = filtered_hospitals_display[
-        ~filtered_hospitals_display['name'].isin(st.session_state.excluded_hospitals)
-    ].sort_values('review_count', ascending=False)
+    # Show removed hospitals count
+    if st.session_state.excluded_hospitals:
+        st.sidebar.markdown(f"**Removed hospitals:** {len(st.session_state.excluded_hospitals)}")
+else:
+    st.sidebar.info("No hospital data available")
+    show_hospitals = False
+    # Set default values for hospital filters
+    hospital_min_rating = 4.0
+    hospital_min_reviews = 500
+
+# Memory held by the cached data frames
+with st.sidebar.expander("💾 Data Memory"):
+    cached_frames = {'Pincode cube': cube, 'Pincode locations': pincode_locations}
+    if not SURGERY_DATASET.exists():
+        cached_frames = {'Patient rows': load_data(), **cached_frames}
+    st.dataframe(memory_report(cached_frames), hide_index=True)
+
+# Slice the pre-aggregated cube for the selected filters and sum counts per pincode
+pincode_summary = get_pincode_summary(selected_year, selected_patient_type)
+total_patients = int(pincode_summary['patient_count'].sum())
+
+# Display statistics
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    st.metric("Total Patients", f"{total_patients:,}")
+with col2:
+    st.metric("Unique Pincodes", f"{len(pincode_summary):,}")
+with col3:
+    st.metric("Average per Pincode", f"{pincode_summary['patient_count'].mean():.1f}")
+with col4:
+    st.metric("Max at One Pincode", f"{pincode_summary['patient_count'].max():,}")
+
+# Distance to care (nearest hospital that passes the hospital filters)
+excluded_hospitals = tuple(sorted(st.session_state.get('excluded_hospitals', set()))) if show_hospitals else ()
+if show_hospitals:
+    pincode_summary = with_nearest_hospitals(
+        pincode_summary, get_nearest_hospitals(hospital_min_rating, hospital_min_reviews, excluded_hospitals)
+    )
+    reachable = pincode_summary.dropna(subset=['distance_km'])
+
+    if not reachable.empty:
+        weights = reachable['patient_count']
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Avg Distance to Nearest Hospital", f"{(reachable['distance_km'] * weights).sum() / weights.sum():.1f} km",
+                      help="Patient-weighted, to the nearest hospital passing the hospital filters")
+        with col2:
+            near_share = weights[reachable['distance_km'] <= NEAR_CARE_KM].sum() / weights.sum() * 100
+            st.metric(f"Patients Within {NEAR_CARE_KM} km", f"{near_share:.1f}%")
+        with col3:
+            st.metric("Farthest Pincode", f"{reachable['distance_km'].max():.1f} km")
+
+# Display patient type breakdown if showing all types
+if selected_patient_type == 'All Patient Types':
+    st.subheader("📊 Patient Type Breakdown")
+    type_breakdown = cube.groupby('BSM_MINOR_CD', observed=True)['count'].sum().reset_index(name='count')
+    type_breakdown['percentage'] = (type_breakdown['count'] / type_breakdown['count'].sum() * 100).round(1)
+    type_breakdown = type_breakdown.sort_values('count', ascending=False)
+
+    # Create columns for breakdown display
+    cols = st.columns(len(type_breakdown))
+    for col, (idx, row) in zip(cols, type_breakdown.iterrows()):
+        with col:
+            st.metric(
+                patient_type_labels.get(row['BSM_MINOR_CD'], row['BSM_MINOR_CD']),
+                f"{row['count']:,}",
+                f"{row['percentage']:.1f}%"
+            )
+
+# Create map
+st.subheader("🗺️ Map Visualization")
+
+# Catchment assignment, updated in the session here (outside every cached function)
+# and shared by the map and the load table below
+catchment_view = None
+if viz_type == "Catchment" and show_hospitals:
+    catchment_hospitals, catchment = get_catchment(hospital_min_rating, hospital_min_reviews, excluded_hospitals)
+    catchment_load = summarize_catchment(pincode_summary, catchment_hospitals, catchment)
+    catchment_view = (catchment_hospitals, catchment.assignment, catchment.distance_km, catchment_load)
+
+# Server heatmap tiles are checked on every run, even when the map itself is cached
+heat_tile_url = None
+if viz_type in ["Heatmap", "Both"] and heatmap_rendering == "Server Tiles":
+    heat_tile_url = get_heat_tiles(selected_year, selected_patient_type)
+
+# Display map (served from the map cache when this filter state was rendered before)
+map_html = build_map_html(
+    selected_year,
+    selected_patient_type,
+    viz_type,
+    display_mode,
+    heat_tile_url,
+    hex_width,
+    show_hospitals,
+    hospital_min_rating,
+    hospital_min_reviews,
+    excluded_hospitals,
+    catchment_view
+)
+components.html(map_html, width=1400, height=600)
+
+# Catchment load per hospital
+if viz_type == "Catchment":
+    if show_hospitals:
+        st.subheader("🏥 Hospital Catchment Load")
+        catchment_table = catchment_load[['name', 'patients', 'percentage', 'pincodes', 'avg_distance_km', 'rating']].copy()
+        catchment_table.columns = ['Hospital', 'Patients', 'Percentage', 'Pincodes', 'Avg Distance (km)', 'Rating']
+        st.dataframe(
+            catchment_table.style.format({'Percentage': '{:.1f}%', 'Avg Distance (km)': '{:.1f}'}),
+            hide_index=True
+        )
+    else:
+        st.info("The catchment view needs hospital data - enable 'Show Eye Hospitals on Map' in the sidebar.")
+
+# Hospital management section
+if show_hospitals and not hospitals.empty:
+    st.subheader("👁️ Hospital Management")
+
+    # Every hospital passing the sliders; removed ones stay listed (ticked) so they can be restored
+    filtered_hospitals_display = filter_hospitals(
+        hospitals, hospital_min_rating, hospital_min_reviews, ()
+    ).sort_values('review_count', ascending=False)
 
     if not filtered_hospitals_display.empty:
         col1, col2 = st.columns([3, 1])
 
         with col1:
-            # Display hospitals table with removal option
-            st.markdown("**Click 'Remove Hospital' to filter it out from the map:**")
-
-            # Create columns for the table
-            hosp_col1, hosp_col2, hosp_col3, hosp_col4, hosp_col5 = st.columns([3, 1, 1, 1, 1])
-
-            with hosp_col1:
-                st.markdown("**Hospital Name**")
-            with hosp_col2:
-                st.markdown("**Rating**")
-            with hosp_col3:
-                st.markdown("**Reviews**")
-            with hosp_col4:
-                st.markdown("**City**")
-            with hosp_col5:
-                st.markdown("**Action**")
-
-            # Display each hospital with remove button
-            for idx, hospital in filtered_hospitals_display.iterrows():
-                hosp_col1, hosp_col2, hosp_col3, hosp_col4, hosp_col5 = st.columns([3, 1, 1, 1, 1])
-
-                with hosp_col1:
-                    st.text(hospital['name'][:30] + "..." if len(hospital['name']) > 30 else hospital['name'])
-                with hosp_col2:
-                    st.text(f"⭐ {hospital['rating']}")
-                with hosp_col3:
-                    st.text(f"{hospital['review_count']:,}")
-                with hosp_col4:
-                    # Try to extract city from address
-                    address_parts = hospital['address'].split(',')
-                    city = address_parts[-3].strip() if len(address_parts) >= 3 else "Unknown"
-                    st.text(city[:15] + "..." if len(city) > 15 else city)
-                with hosp_col5:
-                    if st.button("Remove", key=f"remove_{hospital['name']}_{idx}"):
-                        st.session_state.excluded_hospitals.add(hospital['name'])
-                        st.rerun()
+            st.markdown("**Tick 'Remove' to filter hospitals out from the map, then apply:**")
+
+            hospital_table = pd.DataFrame({
+                'Remove': filtered_hospitals_display['name'].isin(st.session_state.excluded_hospitals),
+                'Hospital Name': filtered_hospitals_display['name'],
+                'Rating': filtered_hospitals_display['rating'],
+                'Reviews': filtered_hospitals_display['review_count'],
+                # City is the third-last address part
+                'City': filtered_hospitals_display['address'].str.split(',').str[-3].str.strip().fillna("Unknown")
+            })
+
+            # One table widget; edits are applied together when the form is submitted.
+            # Edits are stored by row position, so the key changes with the rows listed.
+            editor_key = f"hospital_editor_{hospital_min_rating}_{hospital_min_reviews}"
+            with st.form("hospital_management"):
+                edited_table = st.data_editor(
+                    hospital_table,
+                    column_config={
+                        'Remove': st.column_config.CheckboxColumn("Remove", help="Hide this hospital from the map"),
+                        'Rating': st.column_config.NumberColumn("Rating", format="⭐ %.1f"),
+                        'Reviews': st.column_config.NumberColumn("Reviews", format="%d")
+                    },
+                    disabled=['Hospital Name', 'Rating', 'Reviews', 'City'],
+                    hide_index=True,
+                    width='stretch',
+                    key=editor_key
+                )
+
+                if st.form_submit_button("Apply changes"):
+                    listed = set(hospital_table['Hospital Name'])
+                    removed = set(edited_table.loc[edited_table['Remove'], 'Hospital Name'])
+                    st.session_state.excluded_hospitals = (st.session_state.excluded_hospitals - listed) | removed
+                    del st.session_state[editor_key]  # The ticks are now part of the table itself
+                    st.rerun()
 
         with col2:
-            st.info(f"📊 Showing {len(filtered_hospitals_display)}/{len(hospitals)} hospitals")
+            shown = len(filtered_hospitals_display) - int(hospital_table['Remove'].sum())
+            st.info(f"📊 Showing {shown}/{len(hospitals)} hospitals")
     else:
         st.info("No hospitals match the selected filters")
 else:
@@ -561,10 +875,18 @@ else:
 # Display top locations table
 st.subheader("📊 Top 20 Locations by Patient Count")
 if len(pincode_summary) > 0:
-    top_locations = pincode_summary.head(20)[['CPA_ADDR_CITY', 'CPA_PIN_CODE', 'StateName', 'patient_count', 'percentage']].copy()
-    top_locations.columns = ['City', 'Pincode', 'State', 'Patient Count', 'Percentage']
+    location_columns = ['CPA_ADDR_CITY', 'CPA_PIN_CODE', 'StateName', 'patient_count', 'percentage']
+    location_names = ['City', 'Pincode', 'State', 'Patient Count', 'Percentage']
+    if show_hospitals:
+        location_columns += ['nearest_hospital', 'distance_km']
+        location_names += ['Nearest Hospital', 'Distance (km)']
+
+    top_locations = pincode_summary.head(20)[location_columns].copy()
+    top_locations.columns = location_names
     top_locations['Pincode'] = top_locations['Pincode'].astype(int)
     top_locations['Percentage'] = top_locations['Percentage'].apply(lambda x: "<1%" if x < 1 else f"{x:.1f}%")
+    if show_hospitals:
+        top_locations['Distance (km)'] = top_locations['Distance (km)'].round(1)
     top_locations.index = range(1, len(top_locations) + 1)
     st.dataframe(top_locations, width='stretch')
 else:
@@ -3,9 +3,10 @@ Simple API Test Script - Verify Google Maps API is working
 """
 
 import os
-import googlemaps
 from dotenv import load_dotenv
 
+from maps_client import create_client
+
 # Load API key
 load_dotenv()
 API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
@@ -22,10 +23,12 @@ if not API_KEY:
 print(f"✓ API Key loaded: {API_KEY[:20]}...")
 print()
 
-# Initialize client
+# Initialize client - always hits the API (and records the response) unless
+# GOOGLE_MAPS_CACHE_MODE=replay asks for the recorded response instead
+cache_mode = os.getenv('GOOGLE_MAPS_CACHE_MODE', 'refresh')
 try:
-    gmaps = googlemaps.Client(key=API_KEY)
-    print("✓ Google Maps client initialized")
+    gmaps = create_client(mode=cache_mode)
+    print(f"✓ Google Maps client initialized (response cache: {cache_mode})")
 except Exception as e:
     print(f"❌ Failed to initialize client: {e}")
     exit(1)